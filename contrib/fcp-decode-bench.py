@@ -0,0 +1,42 @@
+#!/usr/bin/env python3
+
+# Micro-benchmark for the decoding of SELECT responses (FCP templates), which
+# dominates the CPU time spent by pySim-shell when walking the file system of a card.
+#
+# (C) 2024 by Sysmocom s.f.m.c. GmbH
+# All Rights Reserved
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import argparse
+import timeit
+
+from pySim.ts_102_221 import CardProfileUICC
+
+# FCP of a typical transparent EF (EF.IMSI of a commercial USIM)
+EF_FCP = '621f8202412183026f07a506c00100ca01808a01058b036f060380020009880138'
+
+option_parser = argparse.ArgumentParser(description='Benchmark the decoding of SELECT responses')
+option_parser.add_argument('--fcp', default=EF_FCP, help='SELECT response (FCP) to decode, as hex string')
+option_parser.add_argument('--number', type=int, default=3000, help='number of decodes per run')
+option_parser.add_argument('--repeat', type=int, default=7, help='number of runs')
+
+
+if __name__ == '__main__':
+    opts = option_parser.parse_args()
+
+    print(CardProfileUICC.decode_select_response(opts.fcp))
+    timer = timeit.Timer(lambda: CardProfileUICC.decode_select_response(opts.fcp))
+    best = min(timer.repeat(repeat=opts.repeat, number=opts.number))
+    print("best of %ux%u runs: %.0f decodes/s" % (opts.repeat, opts.number, opts.number / best))
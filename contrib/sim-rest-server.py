@@ -22,6 +22,8 @@ import sys
 import argparse
 
 from klein import Klein
+from twisted.internet import reactor, threads
+from twisted.python.threadpool import ThreadPool
 
 from pySim.transport import ApduTracer
 from pySim.transport.pcsc import PcscSimLink
@@ -38,7 +40,7 @@ class ApduPrintTracer(ApduTracer):
         pass
 
 def connect_to_card(slot_nr:int):
-    tp = PcscSimLink(argparse.Namespace(pcsc_dev=slot_nr), apdu_tracer=ApduPrintTracer())
+    tp = PcscSimLink(argparse.Namespace(pcsc_dev=slot_nr, pcsc_shared=False), apdu_tracer=ApduPrintTracer())
     tp.connect()
 
     scc = SimCardCommands(tp)
@@ -55,24 +57,139 @@ def connect_to_card(slot_nr:int):
 
     return tp, scc, card
 
+class CardSlot:
+    """Persistent connection to the card in one PC/SC reader slot.  All card access of a slot is
+    executed by the single worker thread of the slot, so requests for different slots are processed
+    concurrently, while requests for the same slot are queued.  The connection (together with the
+    AIDs of the card and any cached information like ICCID/IMSI) is kept until the card is removed."""
+    def __init__(self, slot_nr:int):
+        self.slot_nr = slot_nr
+        self.pool = ThreadPool(minthreads=1, maxthreads=1, name='slot%u' % slot_nr)
+        self.tp = None
+        self.scc = None
+        self.card = None
+        # information about the current card, valid until the card is removed
+        self.cache = {}
+        self.usim_selected = False
+
+    def invalidate(self):
+        """Forget about the current card and its connection."""
+        if self.tp:
+            try:
+                self.tp.disconnect()
+            except Exception:
+                pass
+        self.tp = self.scc = self.card = None
+        self.cache = {}
+        self.usim_selected = False
+
+    def _check_card(self):
+        """Make sure we are connected to the card in the slot.  A card removal (or reset by another
+        application) in between requests is detected by querying the status of the connection,
+        which does not involve any exchange with the card."""
+        if self.tp:
+            try:
+                self.tp.get_atr()
+            except Exception:
+                self.invalidate()
+        if not self.tp:
+            self.tp, self.scc, self.card = connect_to_card(self.slot_nr)
+
+    def select_usim(self):
+        """Select ADF.USIM, unless it is still selected from a previous request."""
+        if not self.usim_selected:
+            self.card.select_adf_by_aid(adf='usim')
+            self.usim_selected = True
+
+    def select_mf(self):
+        self.usim_selected = False
+        self.scc.select_file('3f00')
+
+    def _run(self, func, *args):
+        self._check_card()
+        try:
+            return func(self, *args)
+        except SwMatchError:
+            # the card rejected the command, but the connection is fine
+            raise
+        except Exception:
+            self.invalidate()
+            raise
+
+    def run(self, func, *args):
+        """Execute func(slot, *args) in the worker thread of the slot.  Returns a Deferred."""
+        return threads.deferToThreadPool(reactor, self.pool, self._run, func, *args)
+
 class ApiError:
     def __init__(self, msg:str, sw=None):
         self.msg = msg
         self.sw = sw
 
-    def __str__(self):
+    def to_dict(self) -> dict:
         d = {'error': {'message':self.msg}}
         if self.sw:
             d['error']['status_word'] = self.sw
-        return json.dumps(d)
+        return d
+
+    def __str__(self):
+        return json.dumps(self.to_dict())
 
 
 def set_headers(request):
     request.setHeader('Content-Type', 'application/json')
 
+def json_response(request, res) -> str:
+    set_headers(request)
+    return json.dumps(res, indent=4)
+
+def do_auth(slot:CardSlot, rand:str, autn:str):
+    slot.select_usim()
+    res, sw = slot.scc.authenticate(rand, autn)
+    return res
+
+def do_auth_batch(slot:CardSlot, vectors, context:str, write):
+    """Perform AUTHENTICATE for each (RAND, AUTN) pair, writing one JSON line per result (NDJSON)
+    as soon as it is available."""
+    if context == '2g':
+        # RUN GSM ALGORITHM selects DF.GSM
+        slot.usim_selected = False
+    else:
+        slot.select_usim()
+    results = slot.scc.authenticate_batch(vectors, context)
+    for (rand, autn), (res, sw) in zip(vectors, results):
+        if res is None:
+            res = ApiError("Card Authentication Error", sw).to_dict()
+        res['rand'] = rand
+        write(json.dumps(res) + '\n')
+
+def do_info(slot:CardSlot):
+    if not 'iccid' in slot.cache:
+        slot.select_mf()
+        ef_iccid = EF_ICCID()
+        (iccid, sw) = slot.scc.read_binary(ef_iccid.fid)
+        slot.cache['iccid'] = dec_iccid(iccid)
+    if not 'imsi' in slot.cache:
+        slot.select_usim()
+        ef_imsi = EF_IMSI()
+        (imsi, sw) = slot.scc.read_binary(ef_imsi.fid)
+        slot.cache['imsi'] = dec_imsi(imsi)
+    return {"imsi": slot.cache['imsi'], "iccid": slot.cache['iccid'] }
+
 class SimRestServer:
     app = Klein()
 
+    def __init__(self):
+        self.slots = {}
+
+    def get_slot(self, slot_nr:int) -> CardSlot:
+        """Return the (persistent) CardSlot for the given slot number."""
+        if not slot_nr in self.slots:
+            slot = CardSlot(slot_nr)
+            slot.pool.start()
+            reactor.addSystemEventTrigger('before', 'shutdown', slot.pool.stop)
+            self.slots[slot_nr] = slot
+        return self.slots[slot_nr]
+
     @app.handle_errors(NoCardError)
     def no_card_error(self, request, failure):
         set_headers(request)
@@ -119,15 +236,34 @@ class SimRestServer:
             request.setResponseCode(400)
             return str(ApiError("Malformed Request"))
 
-        tp, scc, card = connect_to_card(slot)
-
-        card.select_adf_by_aid(adf='usim')
-        res, sw = scc.authenticate(rand, autn)
-
-        tp.disconnect()
+        d = self.get_slot(slot).run(do_auth, rand, autn)
+        d.addCallback(lambda res: json_response(request, res))
+        return d
+
+    @app.route('/sim-auth-api/v1/slot/<int:slot>/batch')
+    def auth_batch(self, request, slot):
+        """REST API endpoint for performing authentication against a USIM for a batch of vectors.
+           Expects a JSON body containing a list 'vectors' of objects with RAND and AUTN, and an
+           optional security 'context' ('3g' (default), 'gsm', 'gba' or '2g' for RUN GSM ALGORITHM).
+           Returns one JSON object per line (NDJSON) for each vector as soon as it is available,
+           containing either RAND, RES, CK, IK and Kc (depending on context) or an error."""
+        try:
+            content = json.loads(request.content.read())
+            context = content.get('context', '3g')
+            vectors = [(v['rand'], v.get('autn')) for v in content['vectors']]
+            if context not in ['3g', 'gsm', 'gba', '2g']:
+                raise ValueError(context)
+        except:
+            set_headers(request)
+            request.setResponseCode(400)
+            return str(ApiError("Malformed Request"))
 
-        set_headers(request)
-        return json.dumps(res, indent=4)
+        request.setHeader('Content-Type', 'application/x-ndjson')
+        def write(line:str):
+            reactor.callFromThread(request.write, line.encode())
+        d = self.get_slot(slot).run(do_auth_batch, vectors, context, write)
+        d.addCallback(lambda res: '')
+        return d
 
     @app.route('/sim-info-api/v1/slot/<int:slot>')
     def info(self, request, slot):
@@ -135,21 +271,9 @@ class SimRestServer:
         Expects empty body in request.
         Returns a JSON body containing ICCID, IMSI."""
 
-        tp, scc, card = connect_to_card(slot)
-
-        ef_iccid = EF_ICCID()
-        (iccid, sw) = card._scc.read_binary(ef_iccid.fid)
-
-        card.select_adf_by_aid(adf='usim')
-        ef_imsi = EF_IMSI()
-        (imsi, sw) = card._scc.read_binary(ef_imsi.fid)
-
-        res = {"imsi": dec_imsi(imsi), "iccid": dec_iccid(iccid) }
-
-        tp.disconnect()
-
-        set_headers(request)
-        return json.dumps(res, indent=4)
+        d = self.get_slot(slot).run(do_info)
+        d.addCallback(lambda res: json_response(request, res))
+        return d
 
 
 def main(argv):
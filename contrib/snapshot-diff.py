@@ -0,0 +1,59 @@
+#!/usr/bin/env python3
+
+# Compare card snapshots written by the pySim-shell 'snapshot' command against a
+# reference snapshot, e.g. to check a batch of personalized cards against a golden card.
+#
+# (C) 2024 by Sysmocom s.f.m.c. GmbH
+# All Rights Reserved
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import sys
+import argparse
+
+from pySim.snapshot import Snapshot, diff_snapshots
+
+option_parser = argparse.ArgumentParser(description='Compare pySim card snapshots against a reference snapshot')
+option_parser.add_argument('--ignore', action='append', default=[], metavar='PATTERN',
+                           help='glob pattern of file paths (by name or FID, case-insensitive) to ignore, e.g. "*/EF.IMSI"')
+option_parser.add_argument('--no-fcp', action='store_true', help='do not report differences in the FCP of files')
+option_parser.add_argument('--quiet', '-q', action='store_true',
+                           help='only print the names of snapshots that differ from the reference')
+option_parser.add_argument('REFERENCE', help='reference snapshot file')
+option_parser.add_argument('SNAPSHOT', nargs='+', help='snapshot file(s) to compare against the reference')
+
+
+if __name__ == '__main__':
+    opts = option_parser.parse_args()
+
+    differing = 0
+    with Snapshot.open(opts.REFERENCE) as ref:
+        for filename in opts.SNAPSHOT:
+            with Snapshot.open(filename) as snap:
+                diffs = diff_snapshots(ref, snap, opts.ignore, not opts.no_fcp)
+                if opts.quiet:
+                    if next(diffs, None):
+                        print(filename)
+                        differing += 1
+                    continue
+                first = True
+                for d in diffs:
+                    if first:
+                        print('--- %s (ICCID %s)' % (filename, snap.meta.get('iccid')))
+                        differing += 1
+                        first = False
+                    print(d)
+                diffs.close()
+
+    sys.exit(1 if differing else 0)
@@ -17,6 +17,15 @@
 # You should have received a copy of the GNU General Public License
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
+import sys
+
+# This must happen before any other import, as we want to measure the time they take
+import_profiler = None
+if '--profile-startup' in sys.argv:
+    from pySim.import_profiler import ImportProfiler
+    import_profiler = ImportProfiler()
+    import_profiler.start()
+
 from typing import List, Optional
 
 import json
@@ -40,21 +49,26 @@ from cmd2 import CommandSet, with_default_category, with_argparser
 import argparse
 
 import os
-import sys
+import time
 import inspect
 from pathlib import Path
-from io import StringIO
+from io import StringIO, BytesIO
 
 from pprint import pprint as pp
 
 from pySim.exceptions import *
 from pySim.transport import init_reader, ApduTracer, argparse_add_reader_args, ProactiveHandler
+from pySim.transport.replay import ApduRecorder
+from pySim.transport.metrics import ApduMetrics
 from pySim.utils import h2b, b2h, i2h, swap_nibbles, rpad, JsonEncoder, bertlv_parse_one, sw_match
 from pySim.utils import sanitize_pin_adm, tabulate_str_list, boxed_heading_str, Hexstr, dec_iccid
 from pySim.utils import is_hexstr_or_decimal, is_hexstr, is_decimal
 from pySim.card_handler import CardHandler, CardHandlerAuto
+from pySim.bulk import BulkEngine, ShellScriptJob, resolve_pcsc_readers
 
-from pySim.filesystem import CardMF, CardDF, CardADF
+from pySim.filesystem import CardMF, CardDF, CardADF, TransparentEF, LinFixedEF, CyclicEF, WalkPlan
+from pySim.runtime import ContentCache
+from pySim.snapshot import SnapshotWriter, Snapshot, diff_snapshots
 from pySim.ts_102_222 import Ts102222Commands
 from pySim.gsm_r import DF_EIRENE
 from pySim.cat import ProactiveCommand
@@ -105,9 +119,14 @@ Online manual available at https://downloads.osmocom.org/docs/pysim/master/html/
         self.py_locals = {'card': self.card, 'rs': self.rs, 'lchan': self.lchan}
         self.sl = sl
         self.ch = ch
+        # command line arguments passed on to the pySim-shell processes spawned by bulk_script
+        self.worker_args = []
 
         self.numeric_path = False
         self.conserve_write = True
+        self.conserve_gap = 8
+        self.use_sfi = False
+        self.content_cache = False
         self.json_pretty_print = True
         self.apdu_trace = False
 
@@ -115,6 +134,13 @@ Online manual available at https://downloads.osmocom.org/docs/pysim/master/html/
                                           onchange_cb=self._onchange_numeric_path))
         self.add_settable(Settable2Compat('conserve_write', bool, 'Read and compare before write', self,
                                           onchange_cb=self._onchange_conserve_write))
+        self.add_settable(Settable2Compat('conserve_gap', int,
+                                          'Max. unchanged bytes between two ranges written as one (conserve_write)',
+                                          self, onchange_cb=self._onchange_conserve_gap))
+        self.add_settable(Settable2Compat('use_sfi', bool, 'Use SFI addressing instead of SELECT where possible', self,
+                                          onchange_cb=self._onchange_use_sfi))
+        self.add_settable(Settable2Compat('content_cache', bool, 'Cache the content of files read/written', self,
+                                          onchange_cb=self._onchange_content_cache))
         self.add_settable(Settable2Compat('json_pretty_print', bool, 'Pretty-Print JSON output', self))
         self.add_settable(Settable2Compat('apdu_trace', bool, 'Trace and display APDUs exchanged with card', self,
                                           onchange_cb=self._onchange_apdu_trace))
@@ -150,6 +176,9 @@ Online manual available at https://downloads.osmocom.org/docs/pysim/master/html/
             self.lchan = self.rs.lchan[0]
             self._onchange_conserve_write(
                 'conserve_write', False, self.conserve_write)
+            self._onchange_conserve_gap('conserve_gap', 8, self.conserve_gap)
+            self._onchange_use_sfi('use_sfi', False, self.use_sfi)
+            self._onchange_content_cache('content_cache', False, self.content_cache)
             self._onchange_apdu_trace('apdu_trace', False, self.apdu_trace)
             if self.rs.profile:
                 for cmd_set in self.rs.profile.shell_cmdsets:
@@ -187,12 +216,30 @@ Online manual available at https://downloads.osmocom.org/docs/pysim/master/html/
         if self.rs:
             self.rs.conserve_write = new
 
+    def _onchange_conserve_gap(self, param_name, old, new):
+        if self.card:
+            self.card._scc.conserve_gap = new
+        if self.rs:
+            for lchan in self.rs.lchan.values():
+                lchan.scc.conserve_gap = new
+
+    def _onchange_use_sfi(self, param_name, old, new):
+        if self.rs:
+            self.rs.use_sfi = new
+
+    def _onchange_content_cache(self, param_name, old, new):
+        if self.rs:
+            self.rs.content_cache = ContentCache() if new else None
+
     def _onchange_apdu_trace(self, param_name, old, new):
         if self.card:
-            if new == True:
-                self.card._scc._tp.apdu_tracer = self.Cmd2ApduTracer(self)
+            tracer = self.Cmd2ApduTracer(self) if new == True else None
+            tp = self.card._scc._tp
+            # keep an APDU recording (--record-apdus) going, chain the tracer to it
+            if isinstance(tp.apdu_tracer, ApduRecorder):
+                tp.apdu_tracer.chain = tracer
             else:
-                self.card._scc._tp.apdu_tracer = None
+                tp.apdu_tracer = tracer
 
     class Cmd2ApduTracer(ApduTracer):
         def __init__(self, cmd2_app):
@@ -254,6 +301,9 @@ Online manual available at https://downloads.osmocom.org/docs/pysim/master/html/
             data, sw = self.card._scc.send_apdu(opts.APDU)
         else:
             data, sw = self.lchan.scc.send_apdu(opts.APDU)
+        # the command may have modified any file
+        if self.lchan:
+            self.lchan.invalidate_content()
         if data:
             self.poutput("SW: %s, RESP: %s" % (sw, data))
         else:
@@ -266,11 +316,40 @@ Online manual available at https://downloads.osmocom.org/docs/pysim/master/html/
     def do_reset(self, opts):
         """Reset the Card."""
         atr = self.card.reset()
+        if self.lchan:
+            self.lchan.invalidate_content()
         if self.lchan and self.lchan.scc.scp:
             self.lchan.scc.scp = None
         self.poutput('Card ATR: %s' % i2h(atr))
         self.update_prompt()
 
+    apdu_stats_parser = argparse.ArgumentParser()
+    apdu_stats_parser.add_argument('--prometheus', action='store_true',
+                                   help='Use the Prometheus text exposition format instead of JSON')
+    apdu_stats_parser.add_argument('--output', metavar='FILE', default=None,
+                                   help='Write the statistics to the given file instead of printing them')
+    apdu_stats_parser.add_argument('--reset', action='store_true',
+                                   help='Reset all statistics after displaying/writing them')
+
+    @cmd2.with_argparser(apdu_stats_parser)
+    @cmd2.with_category(CUSTOM_CATEGORY)
+    def do_apdu_stats(self, opts):
+        """Display latency and byte-count statistics of all APDUs exchanged with the card, per
+        instruction (INS) and per file, as well as the number of GET RESPONSE / 6Cxx retries and
+        proactive FETCH round trips."""
+        metrics = self.sl.metrics
+        if metrics is None:
+            raise RuntimeError('APDU statistics are not enabled on this reader')
+        fmt = 'prometheus' if opts.prometheus else 'json'
+        if opts.output:
+            metrics.write(opts.output, fmt)
+        elif opts.prometheus:
+            self.poutput(metrics.to_prometheus().rstrip('\n'))
+        else:
+            self.poutput_json(metrics.to_dict())
+        if opts.reset:
+            metrics.reset()
+
     class InterceptStderr(list):
         def __init__(self):
             self._stderr_backup = sys.stderr
@@ -357,6 +436,10 @@ Online manual available at https://downloads.osmocom.org/docs/pysim/master/html/
                                     help='commandline to execute when card handling has stopped')
     bulk_script_parser.add_argument('--pre_card_action', type=str, default=None,
                                     help='commandline to execute before actually talking to the card')
+    bulk_script_parser.add_argument('--readers', type=str, nargs='+', default=None, metavar='READER',
+                                    help='process the cards in the given PC/SC readers (number or regex) in parallel')
+    bulk_script_parser.add_argument('--workers', type=int, default=None,
+                                    help='maximum number of readers processed concurrently (default: all)')
 
     @cmd2.with_argparser(bulk_script_parser)
     @cmd2.with_category(CUSTOM_CATEGORY)
@@ -368,6 +451,9 @@ Online manual available at https://downloads.osmocom.org/docs/pysim/master/html/
             self.poutput("Invalid script file!")
             return
 
+        if opts.readers:
+            return self._bulk_script_parallel(opts)
+
         success_count = 0
         fail_count = 0
 
@@ -440,6 +526,46 @@ Online manual available at https://downloads.osmocom.org/docs/pysim/master/html/
 
             first = False
 
+    def _bulk_script_parallel(self, opts):
+        """Run script once on the cards in each of the readers specified in opts.readers, using
+        one pySim-shell worker process per reader."""
+        try:
+            readers = resolve_pcsc_readers(opts.readers)
+        except ValueError as e:
+            self.poutput(str(e))
+            return
+
+        if opts.pre_card_action:
+            os.system(opts.pre_card_action)
+
+        def result_cb(res):
+            self.poutput("")
+            self.poutput("Reader %u (%u tries, %.2fs):" % (res.reader, res.tries, res.duration))
+            self.poutput("---------------------8<---------------------")
+            self.poutput(res.transcript)
+            self.poutput("---------------------8<---------------------")
+            if res.success:
+                self._show_success_sign()
+            else:
+                self._show_failure_sign()
+
+        # the worker processes need exclusive access to their reader, which may well be ours
+        self.sl.disconnect()
+
+        self.poutput("Processing cards in %u readers: %s" % (len(readers), readers))
+        engine = BulkEngine(ShellScriptJob(opts.script_path, extra_args=self.worker_args),
+                            tries=opts.tries, max_workers=opts.workers)
+        try:
+            stats = engine.run(readers, result_cb, halt_on_error=opts.halt_on_error)
+        except KeyboardInterrupt:
+            self.poutput("")
+            self.poutput("Terminated by user!")
+            return
+        self.poutput("Statistics: %s" % stats)
+        self.poutput("(use the 'equip' command to re-initialize the card in our own reader)")
+        if opts.on_stop_action:
+            os.system(opts.on_stop_action)
+
     echo_parser = argparse.ArgumentParser()
     echo_parser.add_argument('string', help="string to echo on the shell", nargs='+')
 
@@ -496,98 +622,110 @@ class PySimCommands(CommandSet):
         self._cmd.poutput(directory_str)
         self._cmd.poutput("%d files" % len(selectables))
 
-    def walk(self, indent=0, action_ef=None, action_df=None, context=None, **kwargs):
-        """Recursively walk through the file system, starting at the currently selected DF"""
+    def walk(self, indent=0, action_ef=None, action_df=None, context=None, plan=None, **kwargs):
+        """Walk through the file system, starting at the currently selected DF, in the order given by
+        a WalkPlan (by default one for visiting all files if action_ef is given, else only the DFs).
+        Each file is selected directly from the one visited before (see WalkPlan), when the walk is
+        done, the DF it was started at is selected again."""
+        start = self._cmd.lchan.selected_file
+        if plan is None:
+            plan = WalkPlan(start, efs=bool(action_ef))
+        try:
+            self._walk_df(start, indent, plan, action_ef, action_df, context, **kwargs)
+        finally:
+            if self._cmd.lchan.selected_file != start:
+                self._cmd.lchan.select_file(start, self._cmd)
 
-        if isinstance(self._cmd.lchan.selected_file, CardDF):
+    def _walk_df(self, df, indent, plan, action_ef, action_df, context, **kwargs):
+        if isinstance(df, CardDF):
             if action_df:
                 action_df(context, **kwargs)
 
-        files = self._cmd.lchan.selected_file.get_selectables(
-            flags=['FNAMES', 'ANAMES'])
-        for f in files:
+        for f in plan.children(df):
             # special case: When no action is performed, just output a directory
             if not action_ef and not action_df:
-                output_str = "  " * indent + str(f) + (" " * 250)
+                output_str = "  " * indent + f.name + (" " * 250)
                 output_str = output_str[0:25]
-                if isinstance(files[f], CardADF):
-                    output_str += " " + str(files[f].aid)
+                if isinstance(f, CardADF):
+                    output_str += " " + str(f.aid)
                 else:
-                    output_str += " " + str(files[f].fid)
-                output_str += " " + str(files[f].desc)
+                    output_str += " " + str(f.fid)
+                output_str += " " + str(f.desc)
                 self._cmd.poutput(output_str)
 
-            if isinstance(files[f], CardDF):
-                skip_df = False
+            if isinstance(f, CardDF):
                 try:
-                    fcp_dec = self._cmd.lchan.select(f, self._cmd)
+                    self._cmd.lchan.select_file(f, self._cmd)
                 except Exception as e:
-                    skip_df = True
-                    df = self._cmd.lchan.selected_file
-                    df_path = df.fully_qualified_path_str(True)
-                    df_skip_reason_str = df_path + \
-                        "/" + str(f) + ", " + str(e)
+                    # If the DF was skipped, we never have entered the directory below
+                    df_skip_reason_str = df.fully_qualified_path_str(True) + "/" + str(f) + ", " + str(e)
                     if context:
                         context['DF_SKIP'] += 1
                         context['DF_SKIP_REASON'].append(df_skip_reason_str)
-
-                # If the DF was skipped, we never have entered the directory
-                # below, so we must not move up.
-                if skip_df == False:
-                    self.walk(indent + 1, action_ef, action_df, context, **kwargs)
-
-                    parent = self._cmd.lchan.selected_file.parent
-                    df = self._cmd.lchan.selected_file
-                    adf = self._cmd.lchan.selected_adf
-                    if isinstance(parent, CardMF) and (adf and adf.has_fs == False):
-                        # Not every application that may be present on a GlobalPlatform card will support the SELECT
-                        # command as we know it from ETSI TS 102 221, section 11.1.1. In fact the only subset of
-                        # SELECT we may rely on is the OPEN SELECT command as specified in GlobalPlatform Card
-                        # Specification, section 11.9. Unfortunately the OPEN SELECT command only supports the
-                        # "select by name" method, which means we can only select an application and not a file.
-                        # The consequence of this is that we may get trapped in an application that does not have
-                        # ISIM/USIM like file system support and the only way to leave that application is to select
-                        # an ISIM/USIM application in order to get the file system access back.
-                        #
-                        # To automate this escape-route while traversing the file system we will check whether
-                        # the parent file is the MF. When this is the case and the selected ADF has no file system
-                        # support, we will select an arbitrary ADF that has file system support first and from there
-                        # we will then select the MF.
-                        for selectable in parent.get_selectables().items():
-                            if isinstance(selectable[1], CardADF) and selectable[1].has_fs == True:
-                                self._cmd.lchan.select(selectable[1].name, self._cmd)
-                                break
-                        self._cmd.lchan.select(df.get_mf().name, self._cmd)
-                    else:
-                        # Normal DF/ADF selection
-                        fcp_dec = self._cmd.lchan.select("..", self._cmd)
+                    continue
+
+                self._walk_df(f, indent + 1, plan, action_ef, action_df, context, **kwargs)
+
+                if isinstance(f, CardADF) and f.has_fs == False:
+                    # Not every application that may be present on a GlobalPlatform card will support the SELECT
+                    # command as we know it from ETSI TS 102 221, section 11.1.1. In fact the only subset of
+                    # SELECT we may rely on is the OPEN SELECT command as specified in GlobalPlatform Card
+                    # Specification, section 11.9. Unfortunately the OPEN SELECT command only supports the
+                    # "select by name" method, which means we can only select an application and not a file.
+                    # The consequence of this is that we may get trapped in an application that does not have
+                    # ISIM/USIM like file system support and the only way to leave that application is to select
+                    # an ISIM/USIM application in order to get the file system access back.
+                    #
+                    # To automate this escape-route while traversing the file system we will select an
+                    # arbitrary ADF that has file system support, from where the walk can then continue.
+                    for selectable in f.get_mf().get_selectables().items():
+                        if isinstance(selectable[1], CardADF) and selectable[1].has_fs == True:
+                            self._cmd.lchan.select_file(selectable[1], self._cmd)
+                            break
 
             elif action_ef:
-                df_before_action = self._cmd.lchan.selected_file
-                action_ef(f, context, **kwargs)
-                # When walking through the file system tree the action must not
-                # always restore the currently selected file to the file that
-                # was selected before executing the action() callback.
-                if df_before_action != self._cmd.lchan.selected_file:
+                action_ef(f.name, context, **kwargs)
+                # When walking through the file system tree the action may leave the EF selected, but it
+                # must not change the current DF.
+                if df != self._cmd.lchan.get_cwd():
                     raise RuntimeError("inconsistent walk, %s is currently selected but expecting %s to be selected"
-                                       % (str(self._cmd.lchan.selected_file), str(df_before_action)))
+                                       % (str(self._cmd.lchan.get_cwd()), str(df)))
+
+    tree_parser = argparse.ArgumentParser()
+    tree_parser.add_argument('--stats', action='store_true',
+                             help='Report the number of SELECT commands planned and sent')
 
+    @cmd2.with_argparser(tree_parser)
     def do_tree(self, opts):
         """Display a filesystem-tree with all selectable files"""
-        self.walk()
+        plan = WalkPlan(self._cmd.lchan.selected_file, efs=False)
+        selects = self._select_count()
+        self.walk(plan=plan)
+        if opts.stats:
+            self._cmd.poutput(self._select_stats_str(plan, selects))
+
+    def _select_count(self) -> Optional[int]:
+        """Number of SELECT commands sent to the card so far (as far as the APDU metrics tell)"""
+        metrics = self._cmd.sl.metrics
+        if metrics is None:
+            return None
+        stats = metrics.per_ins.get(0xa4)
+        return stats.count if stats else 0
+
+    def _select_stats_str(self, plan, selects_before) -> str:
+        selects = self._select_count()
+        if selects is None or selects_before is None:
+            return "# SELECT commands: planned %s" % plan
+        return "# SELECT commands: %u sent, planned %s" % (selects - selects_before, plan)
 
     def export_ef(self, filename, context, as_json):
         """ Select and export a single elementary file (EF) """
         context['COUNT'] += 1
-        df = self._cmd.lchan.selected_file
 
-	# The currently selected file (not the file we are going to export)
-	# must always be an ADF or DF. From this starting point we select
-	# the EF we want to export. To maintain consistency we will then
-	# select the current DF again (see comment below).
-        if not isinstance(df, CardDF):
-            raise RuntimeError(
-                "currently selected file %s is not a DF or ADF" % str(df))
+        # The EF we want to export is located in the current DF. The currently
+        # selected file may also be another EF in that DF (when walking through
+        # the file system), as selecting an EF does not change the current DF.
+        df = self._cmd.lchan.get_cwd()
 
         df_path_list = df.fully_qualified_path(True)
         df_path = df.fully_qualified_path_str(True)
@@ -598,37 +736,60 @@ class PySimCommands(CommandSet):
 
         self._cmd.poutput("# directory: %s (%s)" % (df_path, df_path_fid))
         try:
-            fcp_dec = self._cmd.lchan.select(filename, self._cmd)
-            self._cmd.poutput("# file: %s (%s)" % (
-                self._cmd.lchan.selected_file.name, self._cmd.lchan.selected_file.fid))
+            ef = df.lookup_file_by_name(filename) or df.lookup_file_by_fid(filename.lower())
+            # EFs may be read using SFI addressing, without selecting them
+            use_sfi = self._cmd.rs.use_sfi and isinstance(ef, (TransparentEF, LinFixedEF)) and ef.sfid is not None
+            if use_sfi:
+                self._cmd.poutput("# file: %s (%s)" % (ef.name, ef.fid))
+                if isinstance(ef, TransparentEF):
+                    structure = 'transparent'
+                elif isinstance(ef, CyclicEF):
+                    structure = 'cyclic'
+                else:
+                    structure = 'linear_fixed'
+                self._cmd.poutput("# structure: %s" % str(structure))
+                self._cmd.poutput("# SFI: %02x (read without SELECT, no FCP Template)" % int(str(ef.sfid)))
+            else:
+                if ef:
+                    self._cmd.lchan.select_file(ef, self._cmd)
+                else:
+                    self._cmd.lchan.select(filename, self._cmd)
+                ef = self._cmd.lchan.selected_file
+                self._cmd.poutput("# file: %s (%s)" % (ef.name, ef.fid))
 
-            structure = self._cmd.lchan.selected_file_structure()
-            self._cmd.poutput("# structure: %s" % str(structure))
-            self._cmd.poutput("# RAW FCP Template: %s" % str(self._cmd.lchan.selected_file_fcp_hex))
-            self._cmd.poutput("# Decoded FCP Template: %s" % str(self._cmd.lchan.selected_file_fcp))
+                structure = self._cmd.lchan.selected_file_structure()
+                self._cmd.poutput("# structure: %s" % str(structure))
+                self._cmd.poutput("# RAW FCP Template: %s" % str(self._cmd.lchan.selected_file_fcp_hex))
+                self._cmd.poutput("# Decoded FCP Template: %s" % str(self._cmd.lchan.selected_file_fcp))
 
             for f in df_path_list:
                 self._cmd.poutput("select " + str(f))
-            self._cmd.poutput("select " + self._cmd.lchan.selected_file.name)
+            self._cmd.poutput("select " + ef.name)
 
             if structure == 'transparent':
-                if as_json:
-                    result = self._cmd.lchan.read_binary_dec()
-                    self._cmd.poutput("update_binary_decoded '%s'" % json.dumps(result[0], cls=JsonEncoder))
+                if use_sfi:
+                    result = self._cmd.lchan.read_ef_binary(ef)
                 else:
                     result = self._cmd.lchan.read_binary()
+                if as_json:
+                    self._cmd.poutput("update_binary_decoded '%s'" % json.dumps(ef.decode_hex(result[0]), cls=JsonEncoder))
+                else:
                     self._cmd.poutput("update_binary " + str(result[0]))
             elif structure == 'cyclic' or structure == 'linear_fixed':
-                # Use number of records specified in select response
-                num_of_rec = self._cmd.lchan.selected_file_num_of_rec()
-                if num_of_rec:
-                    for r in range(1, num_of_rec + 1):
+                # Use number of records specified in select response (without one, reading via SFI
+                # stops at the first record the card reports as not found)
+                num_of_rec = None if use_sfi else self._cmd.lchan.selected_file_num_of_rec()
+                if use_sfi or num_of_rec:
+                    if use_sfi:
+                        records = self._cmd.lchan.read_ef_records(ef)
+                    else:
+                        records = self._cmd.lchan.read_records(range(1, num_of_rec + 1))
+                    for r, data in records:
                         if as_json:
-                            result = self._cmd.lchan.read_record_dec(r)
-                            self._cmd.poutput("update_record_decoded %d '%s'" % (r, json.dumps(result[0], cls=JsonEncoder)))
+                            data_json = json.dumps(ef.decode_record_hex(data, r), cls=JsonEncoder)
+                            self._cmd.poutput("update_record_decoded %d '%s'" % (r, data_json))
                         else:
-                            result = self._cmd.lchan.read_record(r)
-                            self._cmd.poutput("update_record %d %s" % (r, str(result[0])))
+                            self._cmd.poutput("update_record %d %s" % (r, str(data)))
 
                 # When the select response does not return the number of records, read until we hit the
                 # first record that cannot be read.
@@ -665,11 +826,8 @@ class PySimCommands(CommandSet):
             context['ERR'] += 1
             context['BAD'].append(bad_file_str)
 
-        # When reading the file is done, make sure the parent file is
-        # selected again. This will be the usual case, however we need
-        # to check before since we must not select the same DF twice
-        if df != self._cmd.lchan.selected_file:
-            self._cmd.lchan.select(df.fid or df.aid, self._cmd)
+        # The EF is left selected, so that the next EF of the same DF can be
+        # selected directly. The caller takes care of selecting the DF again.
 
         self._cmd.poutput("#")
 
@@ -687,11 +845,17 @@ class PySimCommands(CommandSet):
         kwargs_export = {'as_json': opts.json}
         exception_str_add = ""
 
+        df = self._cmd.lchan.selected_file
+        plan = WalkPlan(df, efs=True, sfi=self._cmd.rs.use_sfi)
+        selects = self._select_count()
+
         if opts.filename:
             self.export_ef(opts.filename, context, **kwargs_export)
+            if df != self._cmd.lchan.selected_file:
+                self._cmd.lchan.select_file(df, self._cmd)
         else:
             try:
-                self.walk(0, self.export_ef, None, context, **kwargs_export)
+                self.walk(0, self.export_ef, None, context, plan=plan, **kwargs_export)
             except Exception as e:
                 print("# Stopping early here due to exception: " + str(e))
                 print("#")
@@ -709,6 +873,9 @@ class PySimCommands(CommandSet):
         for b in context['DF_SKIP_REASON']:
             self._cmd.poutput("#  " + b)
 
+        if not opts.filename:
+            self._cmd.poutput(self._select_stats_str(plan, selects))
+
         if context['ERR'] and context['DF_SKIP']:
             raise RuntimeError("unable to export %i elementary file(s) and %i dedicated file(s)%s" % (
                     context['ERR'], context['DF_SKIP'], exception_str_add))
@@ -719,6 +886,76 @@ class PySimCommands(CommandSet):
             raise RuntimeError(
                     "unable to export %i dedicated files(s)%s" % (context['ERR'], exception_str_add))
 
+    def snapshot_df(self, context, writer):
+        """ Add the currently selected dedicated file (DF) to a snapshot """
+        writer.add_selected(self._cmd.lchan)
+
+    def snapshot_ef(self, filename, context, writer):
+        """ Select a single elementary file (EF) and add it to a snapshot """
+        context['COUNT'] += 1
+        df = self._cmd.lchan.get_cwd()
+        ef = df.lookup_file_by_name(filename)
+        try:
+            self._cmd.lchan.select_file(ef, self._cmd)
+            writer.add_selected(self._cmd.lchan)
+        except Exception as e:
+            fid_path = df.fully_qualified_path_str(False) + "/" + str(ef.fid)
+            writer.add_error(df.fully_qualified_path_str(True) + "/" + str(filename), fid_path, str(e))
+            context['ERR'] += 1
+            context['BAD'].append(df.fully_qualified_path_str(True) + "/" + str(filename) + ", " + str(e))
+
+    def take_snapshot(self, f, context):
+        """Write a snapshot of all files below the currently selected DF to the binary file object f"""
+        meta = {'iccid': self._cmd.iccid, 'atr': b2h(self._cmd.lchan.scc.get_atr()),
+                'card': self._cmd.card.name, 'time': time.strftime('%Y-%m-%dT%H:%M:%S%z')}
+        with SnapshotWriter(f, meta) as writer:
+            self.walk(0, self.snapshot_ef, self.snapshot_df, context, writer=writer)
+
+    snapshot_parser = argparse.ArgumentParser()
+    snapshot_parser.add_argument('FILE', help='snapshot file to write')
+
+    @cmd2.with_argparser(snapshot_parser)
+    def do_snapshot(self, opts):
+        """Write a compact binary snapshot of the FCP and content of all files below the currently
+selected DF.  Snapshots can be compared using the snapshot_diff command or contrib/snapshot-diff.py."""
+        context = {'ERR': 0, 'COUNT': 0, 'BAD': [], 'DF_SKIP': 0, 'DF_SKIP_REASON': []}
+        with open(opts.FILE, 'wb') as f:
+            self.take_snapshot(f, context)
+        self._cmd.poutput("# total files visited: %u" % context['COUNT'])
+        self._cmd.poutput("# bad files:           %u" % context['ERR'])
+        for b in context['BAD']:
+            self._cmd.poutput("#  " + b)
+        self._cmd.poutput("# skipped dedicated files(s): %u" % context['DF_SKIP'])
+        for b in context['DF_SKIP_REASON']:
+            self._cmd.poutput("#  " + b)
+
+    snapshot_diff_parser = argparse.ArgumentParser()
+    snapshot_diff_parser.add_argument('--ignore', action='append', default=[], metavar='PATTERN',
+                                      help='glob pattern of file paths (by name or FID, case-insensitive) to ignore')
+    snapshot_diff_parser.add_argument('--no-fcp', action='store_true',
+                                      help='do not report differences in the FCP of files')
+    snapshot_diff_parser.add_argument('SNAPSHOT', help='reference snapshot file')
+    snapshot_diff_parser.add_argument('OTHER', nargs='?',
+                                      help='snapshot file to compare (default: snapshot of the card)')
+
+    @cmd2.with_argparser(snapshot_diff_parser)
+    def do_snapshot_diff(self, opts):
+        """Compare a snapshot against another snapshot or against the files below the currently selected DF"""
+        with Snapshot.open(opts.SNAPSHOT) as ref:
+            if opts.OTHER:
+                other = Snapshot.open(opts.OTHER)
+            else:
+                context = {'ERR': 0, 'COUNT': 0, 'BAD': [], 'DF_SKIP': 0, 'DF_SKIP_REASON': []}
+                buf = BytesIO()
+                self.take_snapshot(buf, context)
+                other = Snapshot(buf.getbuffer(), 'card')
+            with other:
+                diffs = 0
+                for d in diff_snapshots(ref, other, opts.ignore, not opts.no_fcp):
+                    self._cmd.poutput(str(d))
+                    diffs += 1
+        self._cmd.poutput("# %u difference(s)" % diffs)
+
     def do_desc(self, opts):
         """Display human readable file description for the currently selected file"""
         desc = self._cmd.lchan.selected_file.desc
@@ -887,7 +1124,7 @@ class Iso7816Commands(CommandSet):
 
     def do_deactivate_file(self, opts):
         """Deactivate the currently selected EF"""
-        (data, sw) = self._cmd.lchan.scc.deactivate_file()
+        (data, sw) = self._cmd.lchan.deactivate_file()
 
     activate_file_parser = argparse.ArgumentParser()
     activate_file_parser.add_argument('NAME', type=str, help='File name or FID of file to activate')
@@ -970,6 +1207,8 @@ global_group.add_argument('--csv', metavar='FILE',
                           default=None, help='Read card data from CSV file')
 global_group.add_argument("--card_handler", dest="card_handler_config", metavar="FILE",
                           help="Use automatic card handling machine")
+global_group.add_argument('--profile-startup', action='store_true',
+                          help='Report the time spent importing modules and initializing the card at start-up')
 
 adm_group = global_group.add_mutually_exclusive_group()
 adm_group.add_argument('-a', '--pin-adm', metavar='PIN_ADM1', dest='pin_adm', default=None,
@@ -983,6 +1222,25 @@ option_parser.add_argument('command_args', nargs=argparse.REMAINDER,
                            help="Optional Arguments for command")
 
 
+def worker_args_from_opts(opts) -> List[str]:
+    """Build the command line arguments for the pySim-shell worker processes of a parallel
+    bulk_script run: all general options except for the reader selection (which is done per worker)
+    and the start-up script/command (the worker runs the bulk script instead)."""
+    args = []
+    if opts.pcsc_shared:
+        args.append('--pcsc-shared')
+    args += ['--pcsc-protocol', opts.pcsc_protocol]
+    if opts.csv:
+        args += ['--csv', opts.csv]
+    if opts.card_handler_config:
+        args += ['--card_handler', opts.card_handler_config]
+    if opts.pin_adm:
+        args += ['--pin-adm', opts.pin_adm]
+    elif opts.pin_adm_hex:
+        args += ['--pin-adm-hex', opts.pin_adm_hex]
+    return args
+
+
 if __name__ == '__main__':
 
     # Parse options
@@ -1004,6 +1262,8 @@ if __name__ == '__main__':
 
     # Init card reader driver
     sl = init_reader(opts, proactive_handler = Proact())
+    if sl.metrics is None:
+        sl.metrics = ApduMetrics()
 
     # Create a card handler (for bulk provisioning)
     if opts.card_handler_config:
@@ -1030,6 +1290,14 @@ if __name__ == '__main__':
         if opts.script:
             print("will not execute startup script due to card initialization errors!")
         app = PysimApp(None, None, sl, ch)
+    app.worker_args = worker_args_from_opts(opts)
+
+    if import_profiler:
+        import_profiler.stop()
+        print("Start-up profile (%.1f ms until card initialized):" %
+              ((time.perf_counter() - import_profiler.t_start) * 1000))
+        print(import_profiler.report())
+        print("")
 
     # If the user supplies an ADM PIN at via commandline args authenticate
     # immediately so that the user does not have to use the shell commands
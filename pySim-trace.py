@@ -1,8 +1,12 @@
 #!/usr/bin/env python3
 
 import sys
+import json
+import queue
+import threading
 import logging, colorlog
 import argparse
+from typing import Optional, Union
 from pprint import pprint as pp
 
 from pySim.apdu import *
@@ -15,6 +19,7 @@ from pySim.ts_102_221 import CardProfileUICC
 from pySim.ts_31_102 import CardApplicationUSIM
 from pySim.ts_31_103 import CardApplicationISIM
 from pySim.transport import LinkBase
+from pySim.utils import b2h, JsonEncoder
 
 from pySim.apdu_source.gsmtap import GsmtapApduSource
 from pySim.apdu_source.pyshark_rspro import PysharkRsproPcap, PysharkRsproLive
@@ -53,7 +58,7 @@ class DummySimLink(LinkBase):
 
     def _send_apdu_raw(self, pdu):
         #print("DummySimLink-apdu: %s" % pdu)
-        return [], '9000'
+        return '', '9000'
 
     def connect(self):
         pass
@@ -88,18 +93,49 @@ class Tracer:
         self.suppress_select = kwargs.get('suppress_select', True)
         self.show_raw_apdu = kwargs.get('show_raw_apdu', False)
         self.source = kwargs.get('source', None)
-
-    def format_capdu(self, apdu: Apdu, inst: ApduCommand):
-        """Output a single decoded + processed ApduCommand."""
+        self.output_format = kwargs.get('output_format', 'text')
+        self.output = kwargs.get('output', sys.stdout)
+
+    def format_capdu(self, apdu: Apdu, inst: ApduCommand) -> str:
+        """Format a single decoded + processed ApduCommand."""
+        if self.output_format == 'json':
+            d = {'lchan': inst.lchan_nr, 'name': inst._name, 'path': inst.path_str, 'id': inst.col_id,
+                 'sw': b2h(inst.sw), 'processed': inst.processed}
+            if self.show_raw_apdu:
+                d['apdu'] = inst.to_dict()
+            return json.dumps(d, cls=JsonEncoder) + '\n'
+        out = ''
         if self.show_raw_apdu:
-            print(apdu)
-        print("%02u %-16s %-35s %-8s %s %s" % (inst.lchan_nr, inst._name, inst.path_str, inst.col_id, inst.col_sw, inst.processed))
-        print("===============================")
-
-    def format_reset(self, apdu: CardReset):
-        """Output a single decoded CardReset."""
-        print(apdu)
-        print("===============================")
+            out += '%s\n' % apdu
+        out += "%02u %-16s %-35s %-8s %s %s\n" % (inst.lchan_nr, inst._name, inst.path_str, inst.col_id, inst.col_sw, inst.processed)
+        out += "===============================\n"
+        return out
+
+    def format_reset(self, apdu: CardReset) -> str:
+        """Format a single decoded CardReset."""
+        if self.output_format == 'json':
+            return json.dumps({'reset': {'atr': apdu.atr}}, cls=JsonEncoder) + '\n'
+        return "%s\n===============================\n" % apdu
+
+    def process_apdu(self, apdu: Union[Apdu, CardReset]) -> Optional[str]:
+        """Decode + process a single Apdu or CardReset; return the formatted output (if any)."""
+        if isinstance(apdu, CardReset):
+            self.rs.reset()
+            return self.format_reset(apdu)
+
+        # ask ApduDecoder to look-up (INS,CLA) + instantiate an ApduCommand derived
+        # class like 'UiccSelect'
+        inst = self.ad.input(apdu)
+        # process the APDU (may modify the RuntimeState)
+        inst.process(self.rs)
+
+        # Avoid cluttering the log with too much verbosity
+        if self.suppress_select and isinstance(inst, UiccSelect):
+            return None
+        if self.suppress_status and isinstance(inst, UiccStatus):
+            return None
+
+        return self.format_capdu(apdu, inst)
 
     def main(self):
         """Main loop of tracer: Iterates over all Apdu received from source."""
@@ -113,24 +149,47 @@ class Tracer:
                 print("%i APDUs parsed, stop iteration." % apdu_counter)
                 return 0
 
-            if isinstance(apdu, CardReset):
-                self.rs.reset()
-                self.format_reset(apdu)
-                continue
-
-            # ask ApduDecoder to look-up (INS,CLA) + instantiate an ApduCommand derived
-            # class like 'UiccSelect'
-            inst = self.ad.input(apdu)
-            # process the APDU (may modify the RuntimeState)
-            inst.process(self.rs)
-
-            # Avoid cluttering the log with too much verbosity
-            if self.suppress_select and isinstance(inst, UiccSelect):
-                continue
-            if self.suppress_status and isinstance(inst, UiccStatus):
-                continue
-
-            self.format_capdu(apdu, inst)
+            out = self.process_apdu(apdu)
+            if out:
+                print(out, end='')
+
+    def _read_source(self, q: queue.Queue):
+        """Producer thread of main_streaming(): read from the source as fast as possible."""
+        try:
+            while True:
+                q.put(self.source.read())
+        except StopIteration:
+            q.put(None)
+        except Exception as e:
+            q.put(e)
+
+    def main_streaming(self, batch_size: int = 100):
+        """Main loop of tracer in streaming mode: The source is read by a separate producer thread,
+        so that (particularly live) sources are drained promptly even if decoding or output
+        temporarily lag behind.  Output is written in batches of up to batch_size APDUs; a batch
+        is also written as soon as no further APDUs are pending."""
+        q = queue.Queue()
+        threading.Thread(target=self._read_source, args=(q,), daemon=True).start()
+        apdu_counter = 0
+        batch = []
+        while True:
+            apdu = q.get()
+            if apdu is None or isinstance(apdu, Exception):
+                break
+            apdu_counter = apdu_counter + 1
+            out = self.process_apdu(apdu)
+            if out:
+                batch.append(out)
+            if len(batch) >= batch_size or (batch and q.empty()):
+                self.output.write(''.join(batch))
+                self.output.flush()
+                batch = []
+        self.output.write(''.join(batch))
+        self.output.flush()
+        if isinstance(apdu, Exception):
+            raise apdu
+        logger.info("%i APDUs parsed, stop iteration." % apdu_counter)
+        return 0
 
 option_parser = argparse.ArgumentParser(description='Osmocom pySim high-level SIM card trace decoder',
                                         formatter_class=argparse.ArgumentDefaultsHelpFormatter)
@@ -147,6 +206,14 @@ global_group.add_argument('--no-suppress-status', action='store_false', dest='su
     information that was not already received in resposne to the most recent SEELCT.""")
 global_group.add_argument('--show-raw-apdu', action='store_true', dest='show_raw_apdu',
                           help="""Show the raw APDU in addition to its parsed form.""")
+global_group.add_argument('--output-format', choices=['text', 'json'], default='text',
+                          help="""Output format; 'json' writes one JSON object per line.""")
+global_group.add_argument('--stream', action='store_true',
+                          help="""
+    Read the source in a separate thread and write the output in batches. Use this to avoid
+    losing packets of live captures under bursty traffic.""")
+global_group.add_argument('--batch-size', type=int, default=100,
+                          help="""Maximum number of APDUs per output batch in --stream mode.""")
 
 
 subparsers = option_parser.add_subparsers(help='APDU Source', dest='source', required=True)
@@ -193,7 +260,10 @@ if __name__ == '__main__':
         s = PysharkGsmtapPcap(opts.pcap_file)
 
     tracer = Tracer(source=s, suppress_status=opts.suppress_status, suppress_select=opts.suppress_select,
-                    show_raw_apdu=opts.show_raw_apdu)
+                    show_raw_apdu=opts.show_raw_apdu, output_format=opts.output_format)
     logger.info('Entering main loop...')
-    tracer.main()
+    if opts.stream:
+        tracer.main_streaming(opts.batch_size)
+    else:
+        tracer.main()
 
@@ -15,31 +15,60 @@
 
 
 from typing import Tuple
+import importlib
 
 from pySim.transport import LinkBase
 from pySim.commands import SimCardCommands
-from pySim.filesystem import CardModel, CardApplication
+from pySim.filesystem import CardModel, CardApplication, LazyCardApplication
 from pySim.cards import card_detect, SimCardBase, UiccCardBase
 from pySim.runtime import RuntimeState
 from pySim.profile import CardProfile
 from pySim.cdma_ruim import CardProfileRUIM
 from pySim.ts_102_221 import CardProfileUICC
-from pySim.utils import all_subclasses
-
-# we need to import this module so that the SysmocomSJA2 sub-class of
-# CardModel is created, which will add the ATR-based matching and
-# calling of SysmocomSJA2.add_files.  See  CardModel.apply_matching_models
-import pySim.sysmocom_sja2
-
-# we need to import these modules so that the various sub-classes of
-# CardProfile are created, which will be used in init_card() to iterate
-# over all known CardProfile sub-classes.
-import pySim.ts_31_102
-import pySim.ts_31_103
-import pySim.ts_31_104
-import pySim.ara_m
-import pySim.global_platform
-import pySim.euicc
+from pySim.utils import all_subclasses, i2h
+
+# Card applications known to pySim, as (name, AID, module, class).  The module implementing an
+# application is only imported once an application with matching AID is found on the card (either
+# in EF.DIR or by probing), see RuntimeState._match_applications.
+CARD_APPLICATIONS = [
+    ('USIM', 'a0000000871002', 'pySim.ts_31_102', 'CardApplicationUSIM'),
+    ('USIM-non-IMSI', 'a000000087100b', 'pySim.ts_31_102', 'CardApplicationUSIMnonIMSI'),
+    ('ISIM', 'a0000000871004', 'pySim.ts_31_103', 'CardApplicationISIM'),
+    ('HPSIM', 'a000000087100A', 'pySim.ts_31_104', 'CardApplicationHPSIM'),
+    ('ARA-M', 'a00000015141434c00', 'pySim.ara_m', 'CardApplicationARAM'),
+    ('ADF.ISD', 'a000000003000000', 'pySim.global_platform', 'CardApplicationISD'),
+    ('ADF.ISD-R', 'A0000005591010FFFFFFFF8900000100', 'pySim.euicc', 'CardApplicationISDR'),
+    ('ADF.ECASD', 'A0000005591010FFFFFFFF8900000200', 'pySim.euicc', 'CardApplicationECASD'),
+]
+
+# Modules implementing CardModel sub-classes, as (ATR prefix, module).  The module is only imported
+# if the ATR of the card starts with the given prefix; CardModel.apply_matching_models will then
+# perform the actual matching.
+CARD_MODELS = [
+    ('3b9f96801f878031e073fe211b674a', 'pySim.sysmocom_sja2'),
+]
+
+def load_card_models(scc: SimCardCommands):
+    """Import the modules of all CardModel sub-classes that may match the card (by ATR)."""
+    atr = i2h(scc.get_atr()).lower()
+    for atr_prefix, module_name in CARD_MODELS:
+        if atr.startswith(atr_prefix):
+            importlib.import_module(module_name)
+
+def card_applications() -> list:
+    """Return the list of card applications for an UICC profile; applications from modules not
+    imported yet are represented by LazyCardApplication instances."""
+    apps = [LazyCardApplication(*x) for x in CARD_APPLICATIONS]
+    lazy_classes = [(x.module_name, x.class_name) for x in apps]
+    # any other (e.g. third-party) applications whose modules have been imported by other means
+    for app_cls in all_subclasses(CardApplication):
+        # skip any intermediary sub-classes such as CardApplicationSD
+        if hasattr(app_cls, '_' + app_cls.__name__ + '__intermediate'):
+            continue
+        if (app_cls.__module__, app_cls.__name__) in lazy_classes:
+            continue
+        apps.append(app_cls())
+    return apps
 
 def init_card(sl: LinkBase) -> Tuple[RuntimeState, SimCardBase]:
     """
@@ -86,21 +115,21 @@ def init_card(sl: LinkBase) -> Tuple[RuntimeState, SimCardBase]:
     # We cannot do it within pySim/profile.py as that would create circular
     # dependencies between the individual profiles and profile.py.
     if isinstance(profile, CardProfileUICC):
-        for app_cls in all_subclasses(CardApplication):
-            # skip any intermediary sub-classes such as CardApplicationSD
-            if hasattr(app_cls, '_' + app_cls.__name__ + '__intermediate'):
-                continue
-            profile.add_application(app_cls())
+        for app in card_applications():
+            profile.add_application(app)
         # We have chosen SimCard() above, but we now know it actually is an UICC
         # so it's safe to assume it supports USIM application (which we're adding above).
         # IF we don't do this, we will have a SimCard but try USIM specific commands like
         # the update_ust method (see https://osmocom.org/issues/6055)
         if generic_card:
             card = UiccCardBase(scc)
+        # use extended length APDUs for large transfers, if possible (T=1 only)
+        scc.probe_extended_length()
 
     # Create runtime state with card profile
     rs = RuntimeState(card, profile)
 
+    load_card_models(scc)
     CardModel.apply_matching_models(scc, rs)
 
     # inform the transport that we can do context-specific SW interpretation
@@ -0,0 +1,202 @@
+# -*- coding: utf-8 -*-
+
+""" pySim: parallel bulk processing of cards in multiple readers.
+
+The classic bulk provisioning loop handles one card at a time in one reader,
+so its throughput is capped by the round-trip latency of that one reader.  The
+BulkEngine below dispatches one job per reader to a pool of workers, so that
+racks of readers can be processed concurrently.
+"""
+
+#
+# (C) 2024 by Sysmocom s.f.m.c. GmbH
+# All Rights Reserved
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+import os
+import re
+import sys
+import time
+import threading
+import subprocess
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Callable, List, Optional, Tuple
+
+
+def resolve_pcsc_readers(specs: List[str], reader_names: Optional[List[str]] = None) -> List[int]:
+    """Resolve a list of PC/SC reader specifications into a sorted list of reader indices.
+
+    Args:
+            specs : list of reader numbers (as used with --pcsc-device) or regular expressions
+                    (as used with --pcsc-regex). A regex selects all readers whose name matches.
+            reader_names : names of the available readers (default: ask the PC/SC subsystem)
+    Returns:
+            sorted list of unique reader indices
+    """
+    if reader_names is None:
+        from smartcard.System import readers
+        reader_names = [str(r) for r in readers()]
+    result = set()
+    for spec in specs:
+        if spec.isdigit():
+            idx = int(spec)
+            if idx >= len(reader_names):
+                raise ValueError('No reader found for number %d' % idx)
+            result.add(idx)
+        else:
+            cre = re.compile(spec)
+            matches = [i for i, name in enumerate(reader_names) if cre.search(name)]
+            if not matches:
+                raise ValueError('No matching reader found for regex %s' % spec)
+            result.update(matches)
+    return sorted(result)
+
+
+class BulkResult:
+    """Outcome of processing one card in one reader."""
+
+    def __init__(self, reader, success: bool, transcript: str = '', tries: int = 1, duration: float = 0.0):
+        self.reader = reader
+        self.success = success
+        self.transcript = transcript
+        self.tries = tries
+        self.duration = duration
+
+    def __str__(self):
+        return "reader %s: %s (%u tries, %.2fs)" % (self.reader, 'success' if self.success else 'FAILURE',
+                                                     self.tries, self.duration)
+
+
+class BulkStats:
+    """Aggregated statistics over the results of one or more bulk runs."""
+
+    def __init__(self):
+        self.results = []
+        self.elapsed = 0.0
+
+    @property
+    def success_count(self) -> int:
+        return len([r for r in self.results if r.success])
+
+    @property
+    def fail_count(self) -> int:
+        return len([r for r in self.results if not r.success])
+
+    @property
+    def cards_per_minute(self) -> float:
+        if not self.elapsed:
+            return 0.0
+        return len(self.results) * 60.0 / self.elapsed
+
+    def __str__(self):
+        return "success: %i, failure: %i, elapsed: %.2fs (%.1f cards/min)" % (
+            self.success_count, self.fail_count, self.elapsed, self.cards_per_minute)
+
+
+class BulkEngine:
+    """Run a job for each of a number of readers concurrently.
+
+    The job is a callable which is given the reader (whatever was passed in the
+    'readers' list, typically a PC/SC reader index) and returns a (success, transcript)
+    tuple.  Jobs should not share any state; each one typically owns its own LinkBase
+    or even its own process.  Failing jobs are retried up to 'tries' times."""
+
+    def __init__(self, job: Callable[[object], Tuple[bool, str]], tries: int = 1,
+                 max_workers: Optional[int] = None):
+        self.job = job
+        self.tries = tries
+        self.max_workers = max_workers
+
+    def _run_one(self, reader, halt: Optional[threading.Event] = None) -> Optional[BulkResult]:
+        if halt and halt.is_set():
+            return None
+        tstart = time.monotonic()
+        transcript = ''
+        success = False
+        tries = 0
+        while tries < self.tries and not success:
+            tries += 1
+            try:
+                success, transcript = self.job(reader)
+            except Exception as e:
+                success, transcript = False, 'Job raised an exception: %s' % e
+        if halt and not success:
+            halt.set()
+        return BulkResult(reader, success, transcript, tries, time.monotonic() - tstart)
+
+    def run(self, readers: List, result_cb: Optional[Callable[[BulkResult], None]] = None,
+            halt_on_error: bool = False) -> BulkStats:
+        """Process one card in each of the given readers.
+
+        Args:
+                readers : list of readers to process in parallel
+                result_cb : optional callback, called (from the calling thread) as soon as
+                            a reader has completed
+                halt_on_error : do not start any further readers once a reader has failed
+                                (readers which are already being processed are completed)
+        Returns:
+                BulkStats instance with the results of all processed readers, in order of
+                the 'readers' list
+        """
+        stats = BulkStats()
+        tstart = time.monotonic()
+        results = {}
+        halt = threading.Event() if halt_on_error else None
+        max_workers = self.max_workers or max(len(readers), 1)
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            futures = {executor.submit(self._run_one, r, halt): i for i, r in enumerate(readers)}
+            for future in as_completed(futures):
+                res = future.result()
+                if res is None:
+                    continue
+                results[futures[future]] = res
+                if result_cb:
+                    result_cb(res)
+        stats.results = [results[i] for i in sorted(results)]
+        stats.elapsed = time.monotonic() - tstart
+        return stats
+
+
+class ShellScriptJob:
+    """BulkEngine job executing a pySim-shell script against a PC/SC reader.
+
+    Each job runs in its own pySim-shell process, so that the card processing
+    (including all CPU bound encoding/decoding) of the readers does not contend
+    for a single interpreter."""
+
+    def __init__(self, script_path: str, extra_args: Optional[List[str]] = None,
+                 shell_path: Optional[str] = None, timeout: Optional[float] = None):
+        self.script_path = script_path
+        self.extra_args = extra_args or []
+        if shell_path is None:
+            shell_path = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                                      'pySim-shell.py')
+        self.shell_path = shell_path
+        self.timeout = timeout
+
+    def cmdline(self, reader: int) -> List[str]:
+        return [sys.executable, self.shell_path, '--pcsc-device', str(reader)] + self.extra_args + \
+            ['run_script', self.script_path]
+
+    def __call__(self, reader: int) -> Tuple[bool, str]:
+        proc = subprocess.run(self.cmdline(reader), stdin=subprocess.DEVNULL, stdout=subprocess.PIPE,
+                              stderr=subprocess.PIPE, timeout=self.timeout, text=True)
+        transcript = "Transcript stdout:\n%s\nTranscript stderr:\n%s" % (proc.stdout.strip(),
+                                                                       proc.stderr.strip() or '(none)')
+        # same criteria as used by the sequential bulk_script command of pySim-shell
+        success = proc.returncode == 0 and "EXCEPTION of type" not in proc.stderr \
+            and "Card initialization" not in proc.stdout
+        return success, transcript
@@ -21,17 +21,23 @@
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 #
 
-from typing import List, Tuple
+from typing import List, Tuple, Optional, Iterable, Generator, AsyncGenerator
 import typing # construct also has a Union, so we do typing.Union below
 
 from construct import Construct, Struct, Const, Select
 from construct import Optional as COptional
 from pySim.construct import LV, filter_dict
 from pySim.utils import rpad, lpad, b2h, h2b, sw_match, bertlv_encode_len, h2i, i2h, str_sanitize, expand_hex, SwMatchstr
-from pySim.utils import Hexstr, SwHexstr, ResTuple
+from pySim.utils import changed_ranges
+from pySim.utils import Hexstr, SwHexstr, ResTuple, ResTupleBin, restuple_b2h, atr_card_capabilities
+from pySim.utils import BerTlvReader
 from pySim.exceptions import SwMatchError
 from pySim.transport import LinkBase
 
+if typing.TYPE_CHECKING:
+    # only for type annotations: avoid loading asyncio in all the synchronous programs
+    from pySim.transport.aio import AsyncLinkBase
+
 # A path can be either just a FID or a list of FID
 Path = typing.Union[Hexstr, List[Hexstr]]
 
@@ -53,17 +59,71 @@ def lchan_nr_to_cla(cla: int, lchan_nr: int) -> int:
     else:
         raise ValueError('logical channel outside of range 0 .. 15')
 
+# 3GPP TS 31.102 Section 7.1.2.1: AUTHENTICATE command / response data
+AuthCmd3G = Struct('rand'/LV, 'autn'/COptional(LV))
+AuthResp3GSyncFail = Struct(Const(b'\xDC'), 'auts'/LV)
+AuthResp3GSuccess = Struct(Const(b'\xDB'), 'res'/LV, 'ck'/LV, 'ik'/LV, 'kc'/COptional(LV))
+AuthResp3G = Select(AuthResp3GSyncFail, AuthResp3GSuccess)
+# 3GPP TS 31.102 Section 7.1.2.2: GSM security context
+AuthCmdGsm = Struct('rand'/LV)
+AuthRespGsm = Struct('sres'/LV, 'kc'/LV)
+# 3GPP TS 31.102 Section 7.1.2.4.1: GBA security context (bootstrapping mode)
+AuthCmdGba = Struct(Const(b'\xDD'), 'rand'/LV, 'autn'/LV)
+AuthRespGba = Select(AuthResp3GSyncFail, Struct(Const(b'\xDB'), 'res'/LV))
+
+# AUTHENTICATE security contexts: P2, command data and response data
+AUTH_CONTEXTS = {
+    '3g': ('81', AuthCmd3G, AuthResp3G),
+    'gsm': ('80', AuthCmdGsm, AuthRespGsm),
+    'gba': ('84', AuthCmdGba, AuthRespGba),
+}
+
+# Maximum command/response data length used with extended length APDUs, if the card indicates
+# support for them, but not the actual limits (via the extended length information in EF.ATR)
+EXT_APDU_LEN_DEFAULT = 1024
+
+# INS bytes of commands which never change the file selection state of a logical channel.  Any
+# other command passing through SimCardCommands invalidates the selection cache of its lchan.
+SEL_NEUTRAL_INS = frozenset([
+    0x10, # TERMINAL PROFILE
+    0x12, # FETCH
+    0x14, # TERMINAL RESPONSE
+    0x20, # VERIFY PIN
+    0x24, # CHANGE PIN
+    0x26, # DISABLE PIN
+    0x28, # ENABLE PIN
+    0x2c, # UNBLOCK PIN
+    0x32, # INCREASE
+    0x78, # GET IDENTITY
+    0x88, # AUTHENTICATE / RUN GSM ALGORITHM
+    0x89, # AUTHENTICATE (odd)
+    0xa2, # SEARCH RECORD
+    0xb0, # READ BINARY
+    0xb1, # READ BINARY (odd)
+    0xb2, # READ RECORD
+    0xb3, # READ RECORD (odd)
+    0xc0, # GET RESPONSE
+    0xc2, # ENVELOPE
+    0xca, # GET DATA
+    0xcb, # RETRIEVE DATA
+    0xd6, # UPDATE BINARY
+    0xd7, # UPDATE BINARY (odd)
+    0xdb, # SET DATA
+    0xdc, # UPDATE RECORD
+    0xdd, # UPDATE RECORD (odd)
+    0xf2, # STATUS
+])
+
 def cla_with_lchan(cla_byte: Hexstr, lchan_nr: int) -> Hexstr:
     """Embed a logical channel number into the hex-string encoded CLA value."""
     cla_int = h2i(cla_byte)[0]
     return i2h([lchan_nr_to_cla(cla_int, lchan_nr)])
 
-class SimCardCommands:
-    """Class providing methods for various card-specific commands such as SELECT, READ BINARY, etc.
-    Historically one instance exists below CardBase, but with the introduction of multiple logical
-    channels there can be multiple instances.  The lchan number will then be patched into the CLA
-    byte by the respective instance. """
-    def __init__(self, transport: LinkBase, lchan_nr: int = 0):
+class SimCardCommandsBase:
+    """Common state of SimCardCommands and AsyncSimCardCommands (CLA byte, selection control, selection
+    cache, maximum APDU lengths) and the parsing of SELECT responses.  None of the methods of this
+    class exchange any data with the card."""
+    def __init__(self, transport: typing.Union[LinkBase, 'AsyncLinkBase'], lchan_nr: int = 0):
         self._tp = transport
         self._cla_byte = None
         self.sel_ctrl = "0000"
@@ -71,14 +131,68 @@ class SimCardCommands:
         # invokes the setter below
         self.cla_byte = "a0"
         self.scp = None # Secure Channel Protocol
-
-    def fork_lchan(self, lchan_nr: int) -> 'SimCardCommands':
-        """Fork a per-lchan specific SimCardCommands instance off the current instance."""
-        ret = SimCardCommands(transport = self._tp, lchan_nr = lchan_nr)
+        # selection cache: dict of lchan_nr -> (sel_ctrl, list of FIDs, list of FCPs); shared
+        # between all instances forked off each other, as they all talk to the same card.
+        self._sel_cache = {}
+        self.sel_cache_enabled = True
+        # maximum command/response data length of extended length APDUs (0: short APDUs only)
+        self.ext_cmd_len = 0
+        self.ext_rsp_len = 0
+        # conserve mode of UPDATE BINARY: changed ranges separated by not more than this number of
+        # unchanged bytes are written with one command (saving the overhead of another APDU)
+        self.conserve_gap = 8
+
+    def fork_lchan(self, lchan_nr: int) -> 'SimCardCommandsBase':
+        """Fork a per-lchan specific instance off the current instance."""
+        ret = type(self)(transport = self._tp, lchan_nr = lchan_nr)
         ret.cla_byte = self._cla_byte
         ret.sel_ctrl = self.sel_ctrl
+        ret._sel_cache = self._sel_cache
+        ret.sel_cache_enabled = self.sel_cache_enabled
+        ret.ext_cmd_len = self.ext_cmd_len
+        ret.ext_rsp_len = self.ext_rsp_len
+        ret.conserve_gap = self.conserve_gap
         return ret
 
+    def invalidate_sel_cache(self, all_lchans: bool = False):
+        """Forget about the currently selected file of this (or all) logical channel(s). The next
+        select_path() will then issue SELECT commands again."""
+        if all_lchans:
+            self._sel_cache.clear()
+        else:
+            self._sel_cache.pop(self.lchan_nr, None)
+
+    def _sel_cache_lookup(self, dir_list: List[Hexstr]) -> Optional[List[Hexstr]]:
+        """Look up the FCPs of a path in the selection cache. A hit is only reported if the
+        path is identical to the one selected last, or if it is the single FID of the currently
+        selected file (re-selecting the current file by FID does not change the selection)."""
+        if not self.sel_cache_enabled:
+            return None
+        entry = self._sel_cache.get(self.lchan_nr)
+        if not entry or entry[0] != self.sel_ctrl:
+            return None
+        _sel_ctrl, path, fcps = entry
+        if dir_list == path:
+            return list(fcps)
+        if len(dir_list) == 1 and dir_list[0] == path[-1]:
+            return [fcps[-1]]
+        return None
+
+    def _sel_cache_update(self, dir_list: List[Hexstr], fcps: List[Hexstr]):
+        if self.sel_cache_enabled:
+            self._sel_cache[self.lchan_nr] = (self.sel_ctrl, dir_list, fcps)
+
+    def _sel_cache_check_apdu(self, pdu: bytes):
+        """Invalidate the selection cache for any command that may change the selection."""
+        if not self._sel_cache:
+            return
+        ins = pdu[1]
+        if ins == 0x70:
+            # MANAGE CHANNEL may open/close/reset any logical channel
+            self.invalidate_sel_cache(all_lchans=True)
+        elif ins not in SEL_NEUTRAL_INS:
+            self.invalidate_sel_cache()
+
     @property
     def cla_byte(self) -> Hexstr:
         """Return the (cached) patched default CLA byte for this card."""
@@ -90,7 +204,29 @@ class SimCardCommands:
         if self.scp:
             return 255 - self.scp.overhead
         else:
-            return 255
+            return self.ext_cmd_len or 255
+
+    @property
+    def max_rsp_len(self) -> int:
+        """Maximum length of the response apdu data section requested by READ BINARY."""
+        if self.scp:
+            return 255 - self.scp.overhead
+        else:
+            return self.ext_rsp_len or 255
+
+    @staticmethod
+    def encode_lc(length: int) -> Hexstr:
+        """Encode the Lc field of a command APDU, using the extended length form if required."""
+        if length > 255:
+            return '00%04x' % length
+        return '%02x' % length
+
+    @staticmethod
+    def encode_le(length: int) -> Hexstr:
+        """Encode the Le field of a (case 2) command APDU, using the extended length form if required."""
+        if length > 256:
+            return '00%04x' % (length & 0xffff)
+        return '%02x' % (length & 0xff)
 
     @cla_byte.setter
     def cla_byte(self, new_val: Hexstr):
@@ -110,6 +246,170 @@ class SimCardCommands:
         else:
             return cla_with_lchan(cla, self.lchan_nr)
 
+    # Extract a single FCP item from TLV
+    def _parse_fcp(self, fcp: Hexstr):
+        # see also: ETSI TS 102 221, chapter 11.1.1.3.1 Response for MF,
+        # DF or ADF
+        from pytlv.TLV import TLV
+        tlvparser = TLV(['82', '83', '84', 'a5', '8a', '8b',
+                        '8c', '80', 'ab', 'c6', '81', '88'])
+
+        # pytlv is case sensitive!
+        fcp = fcp.lower()
+
+        if fcp[0:2] != '62':
+            raise ValueError(
+                'Tag of the FCP template does not match, expected 62 but got %s' % fcp[0:2])
+
+        # Unfortunately the spec is not very clear if the FCP length is
+        # coded as one or two byte vale, so we have to try it out by
+        # checking if the length of the remaining TLV string matches
+        # what we get in the length field.
+        # See also ETSI TS 102 221, chapter 11.1.1.3.0 Base coding.
+        exp_tlv_len = int(fcp[2:4], 16)
+        if len(fcp[4:]) // 2 == exp_tlv_len:
+            skip = 4
+        else:
+            exp_tlv_len = int(fcp[2:6], 16)
+            if len(fcp[4:]) // 2 == exp_tlv_len:
+                skip = 6
+
+        # Skip FCP tag and length
+        tlv = fcp[skip:]
+        return tlvparser.parse(tlv)
+
+    # Tell the length of a record by the card response
+    # USIMs respond with an FCP template, which is different
+    # from what SIMs responds. See also:
+    # USIM: ETSI TS 102 221, chapter 11.1.1.3 Response Data
+    # SIM: GSM 11.11, chapter 9.2.1 SELECT
+    def _record_len(self, r) -> int:
+        if self.sel_ctrl == "0004":
+            tlv_parsed = self._parse_fcp(r[-1])
+            file_descriptor = tlv_parsed['82']
+            # See also ETSI TS 102 221, chapter 11.1.1.4.3 File Descriptor
+            return int(file_descriptor[4:8], 16)
+        else:
+            return int(r[-1][28:30], 16)
+
+    # Tell the length of a binary file. See also comment
+    # above.
+    def _file_len(self, r) -> int:
+        if self.sel_ctrl == "0004":
+            tlv_parsed = self._parse_fcp(r[-1])
+            return int(tlv_parsed['80'], 16)
+        else:
+            return int(r[-1][4:8], 16)
+
+    def _read_records_prepare(self, r, first: int, count: Optional[int], next_mode: bool):
+        """Determine the READ RECORD command template, the number of records and the content of an
+        unused record from the select response of the EF (see read_records)."""
+        rec_length = self._record_len(r)
+        if count is None:
+            count = self._file_len(r) // rec_length - first + 1
+        if next_mode:
+            pdu_hdr = self.cla_byte + 'b20002%02x' % rec_length
+        else:
+            pdu_hdr = self.cla_byte + 'b2%%02x04%02x' % rec_length
+        return pdu_hdr, count, 'ff' * rec_length
+
+    def _write_ranges(self, data: Hexstr, data_current: Optional[Hexstr]) -> List[Tuple[int, int]]:
+        """Determine the (offset, length) ranges of data to be written by UPDATE BINARY in conserve
+        mode, given the current content of the file (None if it could not be read)."""
+        if data_current is None:
+            return [(0, len(data) // 2)]
+        return changed_ranges(h2b(data_current), h2b(data), self.conserve_gap)
+
+    def _chv_process_sw(self, op_name: str, chv_no: int, pin_code: Hexstr, sw: SwHexstr):
+        if sw_match(sw, '63cx'):
+            raise RuntimeError('Failed to %s chv_no 0x%02X with code 0x%s, %i tries left.' %
+                               (op_name, chv_no, b2h(pin_code).upper(), int(sw[3])))
+        if sw != '9000':
+            raise SwMatchError(sw, '9000')
+
+    def _auth_pdu(self, rand: Hexstr, autn: Optional[Hexstr], context: str) -> Hexstr:
+        """Build the AUTHENTICATE (or, for context '2g', RUN GSM ALGORITHM) command APDU."""
+        if context == '2g':
+            if len(rand) != 32:
+                raise ValueError('Invalid rand')
+            return self.cla4lchan('a0') + '88000010' + rand
+        if context not in AUTH_CONTEXTS:
+            raise ValueError('Unsupported authentication context %s' % context)
+        p2, cmd_constr, _rsp_constr = AUTH_CONTEXTS[context]
+        cmd = cmd_constr.build({'rand': rand, 'autn': autn})
+        return self.cla_byte + '8800' + p2 + '%02x' % len(cmd) + b2h(cmd)
+
+    @staticmethod
+    def _auth_result(data: Hexstr, context: str) -> dict:
+        """Decode the response data of AUTHENTICATE (or, for context '2g', RUN GSM ALGORITHM)."""
+        if context == '2g':
+            return {'successful_gsm_authentication': {'sres': data[0:8], 'kc': data[8:24]}}
+        _p2, _cmd_constr, rsp_constr = AUTH_CONTEXTS[context]
+        data = filter_dict(rsp_constr.parse(h2b(data)))
+        if 'auts' in data:
+            return {'synchronisation_failure': data}
+        if context == 'gsm':
+            return {'successful_gsm_authentication': data}
+        if context == 'gba':
+            return {'successful_gba_authentication': data}
+        return {'successful_3g_authentication': data}
+
+
+class SimCardCommands(SimCardCommandsBase):
+    """Class providing methods for various card-specific commands such as SELECT, READ BINARY, etc.
+    Historically one instance exists below CardBase, but with the introduction of multiple logical
+    channels there can be multiple instances.  The lchan number will then be patched into the CLA
+    byte by the respective instance. """
+    def probe_extended_length(self, read_ef_atr: bool = True):
+        """Enable the use of extended length APDUs for READ BINARY, UPDATE BINARY and STORE DATA, if
+        supported by both the transport (T=1) and the card.  The card indicates support in the card
+        capabilities of the historical bytes of its ATR or EF.ATR; the limits are taken from the
+        extended length information in EF.ATR (ISO/IEC 7816-4 Section 12.7.1)."""
+        self.ext_cmd_len = self.ext_rsp_len = 0
+        if self._tp.protocol != 1:
+            return
+        caps = atr_card_capabilities(self.get_atr())
+        supported = bool(caps and len(caps) >= 3 and caps[2] & 0x40)
+        limits = None
+        if read_ef_atr:
+            try:
+                data, _sw = self.read_binary(['3f00', '2f01'])
+                ef_atr = h2b(data)
+            except Exception:
+                ef_atr = b''
+            for tag, offset, length in BerTlvReader(ef_atr):
+                value = ef_atr[offset:offset+length]
+                if tag == 0x47 and len(value) >= 3:
+                    supported = supported or bool(value[2] & 0x40)
+                elif tag == 0x7f66:
+                    # two INTEGER data objects: maximum number of bytes in command / response APDU
+                    limits = [int.from_bytes(ef_atr[o:o+l], 'big') for _t, o, l in
+                              BerTlvReader(ef_atr, offset, offset + length)]
+        if limits and len(limits) >= 2:
+            # the limits refer to the complete APDU: subtract header, Lc and Le resp. the SW
+            cmd_len = limits[0] - 9
+            rsp_len = limits[1] - 2
+            self.ext_cmd_len = cmd_len if cmd_len > 255 else 0
+            self.ext_rsp_len = rsp_len if rsp_len > 256 else 0
+        elif supported:
+            self.ext_cmd_len = self.ext_rsp_len = EXT_APDU_LEN_DEFAULT
+
+    def send_apdu_bin(self, pdu: bytes) -> ResTupleBin:
+        """Sends an APDU and auto fetch response data
+
+        Args:
+           pdu : bytes of the command APDU
+        Returns:
+           tuple(data, sw), where
+                        data : bytes of returned data
+                        sw   : bytes of status word
+        """
+        self._sel_cache_check_apdu(pdu)
+        if self.scp:
+            return self.scp.send_apdu_wrapper_bin(self._tp.send_apdu_bin, pdu)
+        else:
+            return self._tp.send_apdu_bin(pdu)
+
     def send_apdu(self, pdu: Hexstr) -> ResTuple:
         """Sends an APDU and auto fetch response data
 
@@ -120,10 +420,29 @@ class SimCardCommands:
                         data : string (in hex) of returned data (ex. "074F4EFFFF")
                         sw   : string (in hex) of status word (ex. "9000")
         """
-        if self.scp:
-            return self.scp.send_apdu_wrapper(self._tp.send_apdu, pdu)
-        else:
-            return self._tp.send_apdu(pdu)
+        return restuple_b2h(self.send_apdu_bin(bytes.fromhex(pdu)))
+
+    def send_apdu_checksw_bin(self, pdu: bytes, sw: SwMatchstr = "9000") -> ResTupleBin:
+        """Sends an APDU and check returned SW
+
+        Args:
+           pdu : bytes of the command APDU
+           sw : string of 4 hexadecimal characters (ex. "9000"). The user may mask out certain
+                        digits using a '?' to add some ambiguity if needed.
+        Returns:
+                tuple(data, sw), where
+                        data : bytes of returned data
+                        sw   : bytes of status word
+        """
+        self._sel_cache_check_apdu(pdu)
+        try:
+            if self.scp:
+                return self.scp.send_apdu_wrapper_bin(self._tp.send_apdu_checksw_bin, pdu, sw)
+            else:
+                return self._tp.send_apdu_checksw_bin(pdu, sw)
+        except SwMatchError:
+            self.invalidate_sel_cache()
+            raise
 
     def send_apdu_checksw(self, pdu: Hexstr, sw: SwMatchstr = "9000") -> ResTuple:
         """Sends an APDU and check returned SW
@@ -137,10 +456,7 @@ class SimCardCommands:
                         data : string (in hex) of returned data (ex. "074F4EFFFF")
                         sw   : string (in hex) of status word (ex. "9000")
         """
-        if self.scp:
-            return self.scp.send_apdu_wrapper(self._tp.send_apdu_checksw, pdu, sw)
-        else:
-            return self._tp.send_apdu_checksw(pdu, sw)
+        return restuple_b2h(self.send_apdu_checksw_bin(bytes.fromhex(pdu), sw))
 
     def send_apdu_constr(self, cla: Hexstr, ins: Hexstr, p1: Hexstr, p2: Hexstr, cmd_constr: Construct,
                          cmd_data: Hexstr, resp_constr: Construct) -> Tuple[dict, SwHexstr]:
@@ -191,61 +507,6 @@ class SimCardCommands:
             raise SwMatchError(sw, sw_exp.lower(), self._tp.sw_interpreter)
         return (rsp, sw)
 
-    # Extract a single FCP item from TLV
-    def __parse_fcp(self, fcp: Hexstr):
-        # see also: ETSI TS 102 221, chapter 11.1.1.3.1 Response for MF,
-        # DF or ADF
-        from pytlv.TLV import TLV
-        tlvparser = TLV(['82', '83', '84', 'a5', '8a', '8b',
-                        '8c', '80', 'ab', 'c6', '81', '88'])
-
-        # pytlv is case sensitive!
-        fcp = fcp.lower()
-
-        if fcp[0:2] != '62':
-            raise ValueError(
-                'Tag of the FCP template does not match, expected 62 but got %s' % fcp[0:2])
-
-        # Unfortunately the spec is not very clear if the FCP length is
-        # coded as one or two byte vale, so we have to try it out by
-        # checking if the length of the remaining TLV string matches
-        # what we get in the length field.
-        # See also ETSI TS 102 221, chapter 11.1.1.3.0 Base coding.
-        exp_tlv_len = int(fcp[2:4], 16)
-        if len(fcp[4:]) // 2 == exp_tlv_len:
-            skip = 4
-        else:
-            exp_tlv_len = int(fcp[2:6], 16)
-            if len(fcp[4:]) // 2 == exp_tlv_len:
-                skip = 6
-
-        # Skip FCP tag and length
-        tlv = fcp[skip:]
-        return tlvparser.parse(tlv)
-
-    # Tell the length of a record by the card response
-    # USIMs respond with an FCP template, which is different
-    # from what SIMs responds. See also:
-    # USIM: ETSI TS 102 221, chapter 11.1.1.3 Response Data
-    # SIM: GSM 11.11, chapter 9.2.1 SELECT
-    def __record_len(self, r) -> int:
-        if self.sel_ctrl == "0004":
-            tlv_parsed = self.__parse_fcp(r[-1])
-            file_descriptor = tlv_parsed['82']
-            # See also ETSI TS 102 221, chapter 11.1.1.4.3 File Descriptor
-            return int(file_descriptor[4:8], 16)
-        else:
-            return int(r[-1][28:30], 16)
-
-    # Tell the length of a binary file. See also comment
-    # above.
-    def __len(self, r) -> int:
-        if self.sel_ctrl == "0004":
-            tlv_parsed = self.__parse_fcp(r[-1])
-            return int(tlv_parsed['80'], 16)
-        else:
-            return int(r[-1][4:8], 16)
-
     def get_atr(self) -> Hexstr:
         """Return the ATR of the currently inserted card."""
         return self._tp.get_atr()
@@ -276,12 +537,17 @@ class SimCardCommands:
         Returns:
                 list of return values (FCP in hex encoding) for each element of the path
         """
-        rv = []
         if not isinstance(dir_list, list):
             dir_list = [dir_list]
+        dir_list = [fid.lower() for fid in dir_list]
+        rv = self._sel_cache_lookup(dir_list)
+        if rv is not None:
+            return rv
+        rv = []
         for i in dir_list:
             data, _sw = self.select_file(i)
             rv.append(data)
+        self._sel_cache_update(dir_list, rv)
         return rv
 
     def select_file(self, fid: Hexstr) -> ResTuple:
@@ -291,7 +557,9 @@ class SimCardCommands:
                 fid : file identifier as hex string
         """
 
-        return self.send_apdu_checksw(self.cla_byte + "a4" + self.sel_ctrl + "02" + fid)
+        data, sw = self.send_apdu_checksw(self.cla_byte + "a4" + self.sel_ctrl + "02" + fid)
+        self._sel_cache_update([fid.lower()], [data])
+        return data, sw
 
     def select_parent_df(self) -> ResTuple:
         """Execute SELECT to switch to the parent DF """
@@ -319,16 +587,16 @@ class SimCardCommands:
         if len(r[-1]) == 0:
             return (None, None)
         if length is None:
-            length = self.__len(r) - offset
+            length = self._file_len(r) - offset
         if length < 0:
             return (None, None)
 
         total_data = ''
         chunk_offset = 0
         while chunk_offset < length:
-            chunk_len = min(self.max_cmd_len, length-chunk_offset)
+            chunk_len = min(self.max_rsp_len, length-chunk_offset)
             pdu = self.cla_byte + \
-                'b0%04x%02x' % (offset + chunk_offset, chunk_len)
+                'b0%04x' % (offset + chunk_offset) + self.encode_le(chunk_len)
             try:
                 data, sw = self.send_apdu_checksw(pdu)
             except Exception as e:
@@ -338,6 +606,54 @@ class SimCardCommands:
             chunk_offset += chunk_len
         return total_data, sw
 
+    def read_binary_sfi(self, sfi: int, length: int = None, offset: int = 0) -> ResTuple:
+        """Execute READ BINARY using short file identifier (SFI) addressing, without prior SELECT.
+        The EF must be located in the currently selected DF/ADF; it becomes the current EF.
+
+        Args:
+                sfi : short file identifier (1..30) of the transparent EF
+                length : number of bytes to read (None: read until end of file)
+                offset : byte offset in file from which to start reading (0..255)
+        """
+        if sfi < 1 or sfi > 30:
+            raise ValueError('Invalid SFI %d' % sfi)
+        if offset > 255:
+            raise ValueError('Offset %d exceeds range of SFI addressing' % offset)
+        # we don't know FID and FCP of the file that now becomes the current EF
+        self.invalidate_sel_cache()
+
+        total_data = ''
+        chunk_offset = 0
+        while length is None or chunk_offset < length:
+            if length is None:
+                chunk_len = self.max_rsp_len
+            else:
+                chunk_len = min(self.max_rsp_len, length - chunk_offset)
+            if chunk_offset == 0:
+                pdu = self.cla_byte + 'b0%02x%02x' % (0x80 | sfi, offset) + self.encode_le(chunk_len)
+            else:
+                # the EF has become the current EF, so we can continue with normal offsets
+                pdu = self.cla_byte + 'b0%04x' % (offset + chunk_offset) + self.encode_le(chunk_len)
+            data, sw = self.send_apdu(pdu)
+            if length is None:
+                # 6282: end of file reached before reading Le bytes
+                if sw == '6282' or (sw == '9000' and len(data) // 2 < chunk_len):
+                    total_data += data
+                    sw = '9000'
+                    break
+                # 6b00: we were exactly at the end of the file (wrong offset)
+                if sw == '6b00' and chunk_offset > 0:
+                    sw = '9000'
+                    break
+            if sw != '9000':
+                self.invalidate_sel_cache()
+                e = SwMatchError(sw, '9000', self._tp.sw_interpreter)
+                raise ValueError('%s, failed to read (SFI %d, offset %d)' %
+                                 (str_sanitize(str(e)), sfi, offset + chunk_offset)) from e
+            total_data += data
+            chunk_offset += chunk_len
+        return total_data, sw
+
     def __verify_binary(self, ef, data: str, offset: int = 0):
         """Verify contents of transparent EF.
 
@@ -360,6 +676,7 @@ class SimCardCommands:
                 data : hex string of data to be written
                 offset : byte offset in file from which to start writing
                 verify : Whether or not to verify data after write
+                conserve : read the current data first and only write the ranges that differ
         """
 
         file_len = self.binary_size(ef)
@@ -367,38 +684,74 @@ class SimCardCommands:
 
         data_length = len(data) // 2
 
-        # Save write cycles by reading+comparing before write
+        # Save write cycles by reading+comparing before write, and only writing what has changed
+        data_current = None
+        sw = None
         if conserve:
             try:
                 data_current, sw = self.read_binary(ef, data_length, offset)
-                if data_current == data:
-                    return None, sw
             except Exception:
                 # cannot read data. This is not a fatal error, as reading is just done to
                 # conserve the amount of smart card writes.  The access conditions of the file
                 # may well permit us to UPDATE but not permit us to READ.  So let's ignore
                 # any such exception during READ.
                 pass
+        ranges = self._write_ranges(data, data_current)
+        if not ranges:
+            return None, sw
 
         self.select_path(ef)
         total_data = ''
+        for range_offset, range_len in ranges:
+            chunk_offset = range_offset
+            while chunk_offset < range_offset + range_len:
+                chunk_len = min(self.max_cmd_len, range_offset + range_len - chunk_offset)
+                # chunk_offset is bytes, but data slicing is hex chars, so we need to multiply by 2
+                pdu = self.cla_byte + \
+                    'd6%04x' % (offset + chunk_offset) + self.encode_lc(chunk_len) + \
+                    data[chunk_offset*2: (chunk_offset+chunk_len)*2]
+                try:
+                    chunk_data, chunk_sw = self.send_apdu_checksw(pdu)
+                except Exception as e:
+                    raise ValueError('%s, failed to write chunk (chunk_offset %d, chunk_len %d)' %
+                                     (str_sanitize(str(e)), chunk_offset, chunk_len)) from e
+                total_data += chunk_data
+                chunk_offset += chunk_len
+        if verify:
+            self.__verify_binary(ef, data, offset)
+        return total_data, chunk_sw
+
+    def update_binary_sfi(self, sfi: int, data: Hexstr, offset: int = 0) -> ResTuple:
+        """Execute UPDATE BINARY using short file identifier (SFI) addressing, without prior SELECT.
+        The EF must be located in the currently selected DF/ADF; it becomes the current EF.
+
+        Args:
+                sfi : short file identifier (1..30) of the transparent EF
+                data : hex string of data to be written
+                offset : byte offset in file from which to start writing (0..255)
+        """
+        if sfi < 1 or sfi > 30:
+            raise ValueError('Invalid SFI %d' % sfi)
+        if offset > 255:
+            raise ValueError('Offset %d exceeds range of SFI addressing' % offset)
+        self.invalidate_sel_cache()
+
+        data_length = len(data) // 2
         chunk_offset = 0
         while chunk_offset < data_length:
             chunk_len = min(self.max_cmd_len, data_length - chunk_offset)
-            # chunk_offset is bytes, but data slicing is hex chars, so we need to multiply by 2
-            pdu = self.cla_byte + \
-                'd6%04x%02x' % (offset + chunk_offset, chunk_len) + \
-                data[chunk_offset*2: (chunk_offset+chunk_len)*2]
+            chunk = data[chunk_offset*2: (chunk_offset+chunk_len)*2]
+            if chunk_offset == 0:
+                pdu = self.cla_byte + 'd6%02x%02x' % (0x80 | sfi, offset) + self.encode_lc(chunk_len) + chunk
+            else:
+                pdu = self.cla_byte + 'd6%04x' % (offset + chunk_offset) + self.encode_lc(chunk_len) + chunk
             try:
                 chunk_data, chunk_sw = self.send_apdu_checksw(pdu)
             except Exception as e:
-                raise ValueError('%s, failed to write chunk (chunk_offset %d, chunk_len %d)' %
-                                 (str_sanitize(str(e)), chunk_offset, chunk_len)) from e
-            total_data += data
+                raise ValueError('%s, failed to write chunk (SFI %d, chunk_offset %d, chunk_len %d)' %
+                                 (str_sanitize(str(e)), sfi, chunk_offset, chunk_len)) from e
             chunk_offset += chunk_len
-        if verify:
-            self.__verify_binary(ef, data, offset)
-        return total_data, chunk_sw
+        return chunk_data, chunk_sw
 
     def read_record(self, ef: Path, rec_no: int) -> ResTuple:
         """Execute READ RECORD.
@@ -408,10 +761,84 @@ class SimCardCommands:
                 rec_no : record number to read
         """
         r = self.select_path(ef)
-        rec_length = self.__record_len(r)
+        rec_length = self._record_len(r)
         pdu = self.cla_byte + 'b2%02x04%02x' % (rec_no, rec_length)
         return self.send_apdu_checksw(pdu)
 
+    def read_records(self, ef: Path, first: int = 1, count: Optional[int] = None, next_mode: bool = False,
+                     stop_on_empty: bool = False) -> Generator[Tuple[int, Hexstr], None, None]:
+        """Execute READ RECORD for a range of records, selecting the EF and determining the record
+        length only once.
+
+        Args:
+                ef : string or list of strings indicating name or path of linear fixed / cyclic EF
+                first : number of the first record to read
+                count : number of records to read (None: all records from 'first' until the end)
+                next_mode : use the NEXT mode of READ RECORD instead of absolute record numbers.  This
+                            requires first=1, as the record pointer is (only) reset by selecting the EF.
+                stop_on_empty : stop at the first unused record (all bytes FF)
+        Returns:
+                generator of (record number, hex string of record data) tuples
+        """
+        if next_mode:
+            if first != 1:
+                raise ValueError('READ RECORD in NEXT mode must start at record 1')
+            # the record pointer is only reset by actually selecting the EF
+            self.invalidate_sel_cache()
+        r = self.select_path(ef)
+        pdu_hdr, count, empty = self._read_records_prepare(r, first, count, next_mode)
+        for rec_no in range(first, first + count):
+            pdu = pdu_hdr if next_mode else pdu_hdr % rec_no
+            data, _sw = self.send_apdu_checksw(pdu)
+            if stop_on_empty and data == empty:
+                return
+            yield rec_no, data
+
+    def read_record_sfi(self, sfi: int, rec_no: int, rec_length: int = 0) -> ResTuple:
+        """Execute READ RECORD using short file identifier (SFI) addressing, without prior SELECT.
+        The EF must be located in the currently selected DF/ADF; it becomes the current EF.
+
+        Args:
+                sfi : short file identifier (1..30) of the linear fixed / cyclic EF
+                rec_no : record number to read
+                rec_length : length of the record (0: let the card tell us via 6Cxx)
+        """
+        if sfi < 1 or sfi > 30:
+            raise ValueError('Invalid SFI %d' % sfi)
+        self.invalidate_sel_cache()
+        pdu = self.cla_byte + 'b2%02x%02x%02x' % (rec_no, (sfi << 3) | 0x04, rec_length)
+        return self.send_apdu_checksw(pdu)
+
+    def read_records_sfi(self, sfi: int, first: int = 1, count: Optional[int] = None, rec_length: int = 0,
+                         stop_on_empty: bool = False) -> Generator[Tuple[int, Hexstr], None, None]:
+        """Execute READ RECORD for a range of records using short file identifier (SFI) addressing,
+        without prior SELECT.  The EF must be located in the currently selected DF/ADF.
+
+        Args:
+                sfi : short file identifier (1..30) of the linear fixed / cyclic EF
+                first : number of the first record to read
+                count : number of records to read (None: all records from 'first' until the card
+                        reports that the record was not found)
+                rec_length : length of the records (0: let the card tell us via 6Cxx)
+                stop_on_empty : stop at the first unused record (all bytes FF)
+        Returns:
+                generator of (record number, hex string of record data) tuples
+        """
+        rec_no = first
+        while count is None or rec_no < first + count:
+            try:
+                data, _sw = self.read_record_sfi(sfi, rec_no, rec_length)
+            except SwMatchError as e:
+                if count is None and e.sw_actual in ['6a83', '9402']:
+                    return
+                raise
+            # the card told us the record length (if we didn't know it), no need to ask again
+            rec_length = len(data) // 2
+            if stop_on_empty and data == 'ff' * rec_length:
+                return
+            yield rec_no, data
+            rec_no += 1
+
     def __verify_record(self, ef: Path, rec_no: int, data: str):
         """Verify record against given data
 
@@ -440,7 +867,7 @@ class SimCardCommands:
         """
 
         res = self.select_path(ef)
-        rec_length = self.__record_len(res)
+        rec_length = self._record_len(res)
         data = expand_hex(data, rec_length)
 
         if force_len:
@@ -463,7 +890,7 @@ class SimCardCommands:
             try:
                 data_current, sw = self.read_record(ef, rec_no)
                 data_current = data_current[0:rec_length*2]
-                if data_current == data:
+                if data_current == data.lower():
                     return None, sw
             except Exception:
                 # cannot read data. This is not a fatal error, as reading is just done to
@@ -485,7 +912,7 @@ class SimCardCommands:
                 ef : string or list of strings indicating name or path of linear fixed EF
         """
         r = self.select_path(ef)
-        return self.__record_len(r)
+        return self._record_len(r)
 
     def record_count(self, ef: Path) -> int:
         """Determine the number of records in given file.
@@ -494,7 +921,7 @@ class SimCardCommands:
                 ef : string or list of strings indicating name or path of linear fixed EF
         """
         r = self.select_path(ef)
-        return self.__len(r) // self.__record_len(r)
+        return self._file_len(r) // self._record_len(r)
 
     def binary_size(self, ef: Path) -> int:
         """Determine the size of given transparent file.
@@ -503,7 +930,7 @@ class SimCardCommands:
                 ef : string or list of strings indicating name or path of transparent EF
         """
         r = self.select_path(ef)
-        return self.__len(r)
+        return self._file_len(r)
 
     # TS 102 221 Section 11.3.1 low-level helper
     def _retrieve_data(self, tag: int, first: bool = True) -> ResTuple:
@@ -591,26 +1018,32 @@ class SimCardCommands:
         Args:
                 rand : 16 byte random data as hex string (RAND)
                 autn : 8 byte Autentication Token (AUTN)
-                context : 16 byte random data ('3g' or 'gsm')
-        """
-        # 3GPP TS 31.102 Section 7.1.2.1
-        AuthCmd3G = Struct('rand'/LV, 'autn'/COptional(LV))
-        AuthResp3GSyncFail = Struct(Const(b'\xDC'), 'auts'/LV)
-        AuthResp3GSuccess = Struct(Const(b'\xDB'), 'res'/LV, 'ck'/LV, 'ik'/LV, 'kc'/COptional(LV))
-        AuthResp3G = Select(AuthResp3GSyncFail, AuthResp3GSuccess)
-        # build parameters
-        cmd_data = {'rand': rand, 'autn': autn}
-        if context == '3g':
-            p2 = '81'
-        elif context == 'gsm':
-            p2 = '80'
-        (data, sw) = self.send_apdu_constr_checksw(
-            self.cla_byte, '88', '00', p2, AuthCmd3G, cmd_data, AuthResp3G)
-        if 'auts' in data:
-            ret = {'synchronisation_failure': data}
-        else:
-            ret = {'successful_3g_authentication': data}
-        return (ret, sw)
+                context : security context ('3g', 'gsm' or 'gba')
+        """
+        data, sw = self.send_apdu_checksw(self._auth_pdu(rand, autn, context))
+        return (self._auth_result(data, context), sw)
+
+    def authenticate_batch(self, vectors: Iterable[Tuple[Hexstr, Optional[Hexstr]]],
+                           context: str = '3g') -> Generator[Tuple[Optional[dict], SwHexstr], None, None]:
+        """Execute AUTHENTICATE for each (RAND, AUTN) pair, yielding (result, sw) as soon as the
+        result of each pair is available.  The application (ADF.USIM/ADF.ISIM) must have been
+        selected by the caller; it remains selected throughout the batch.  A pair rejected by the
+        card (e.g. due to a MAC failure) does not abort the batch, (None, sw) is yielded instead.
+
+        Args:
+                vectors : iterable of (RAND, AUTN) tuples as hex strings
+                context : security context ('3g', 'gsm', 'gba' or '2g' for RUN GSM ALGORITHM
+                          in DF.GSM of a SIM, in which case the AUTN is ignored)
+        """
+        if context == '2g':
+            self.select_path(['3f00', '7f20'])
+        for rand, autn in vectors:
+            try:
+                data, sw = self.send_apdu_checksw(self._auth_pdu(rand, autn, context))
+            except SwMatchError as e:
+                yield (None, e.sw_actual)
+                continue
+            yield (self._auth_result(data, context), sw)
 
     def status(self) -> ResTuple:
         """Execute a STATUS command as per TS 102 221 Section 11.1.2."""
@@ -668,15 +1101,9 @@ class SimCardCommands:
 
     def reset_card(self) -> Hexstr:
         """Physically reset the card"""
+        self.invalidate_sel_cache(all_lchans=True)
         return self._tp.reset_card()
 
-    def _chv_process_sw(self, op_name: str, chv_no: int, pin_code: Hexstr, sw: SwHexstr):
-        if sw_match(sw, '63cx'):
-            raise RuntimeError('Failed to %s chv_no 0x%02X with code 0x%s, %i tries left.' %
-                               (op_name, chv_no, b2h(pin_code).upper(), int(sw[3])))
-        if sw != '9000':
-            raise SwMatchError(sw, '9000')
-
     def verify_chv(self, chv_no: int, code: Hexstr) -> ResTuple:
         """Verify a given CHV (Card Holder Verification == PIN)
 
@@ -814,3 +1241,322 @@ class SimCardCommands:
     def get_identity(self, context: int) -> Tuple[Hexstr, SwHexstr]:
         data, sw = self.send_apdu_checksw('807800%02x00' % (context))
         return (data, sw)
+
+
+class AsyncSimCardCommands(SimCardCommandsBase):
+    """asyncio variant of SimCardCommands, operating on an AsyncLinkBase.  It provides coroutines for
+    the core commands (SELECT, READ/UPDATE BINARY, READ/UPDATE RECORD, AUTHENTICATE, ...), so that a
+    single event loop can drive many cards concurrently.  Secure channels are not supported."""
+
+    async def send_apdu_bin(self, pdu: bytes) -> ResTupleBin:
+        """Sends an APDU and auto fetch response data (see SimCardCommands.send_apdu_bin)."""
+        self._sel_cache_check_apdu(pdu)
+        return await self._tp.send_apdu_bin(pdu)
+
+    async def send_apdu(self, pdu: Hexstr) -> ResTuple:
+        """Sends an APDU and auto fetch response data (see SimCardCommands.send_apdu)."""
+        return restuple_b2h(await self.send_apdu_bin(bytes.fromhex(pdu)))
+
+    async def send_apdu_checksw_bin(self, pdu: bytes, sw: SwMatchstr = "9000") -> ResTupleBin:
+        """Sends an APDU and check returned SW (see SimCardCommands.send_apdu_checksw_bin)."""
+        self._sel_cache_check_apdu(pdu)
+        try:
+            return await self._tp.send_apdu_checksw_bin(pdu, sw)
+        except SwMatchError:
+            self.invalidate_sel_cache()
+            raise
+
+    async def send_apdu_checksw(self, pdu: Hexstr, sw: SwMatchstr = "9000") -> ResTuple:
+        """Sends an APDU and check returned SW (see SimCardCommands.send_apdu_checksw)."""
+        return restuple_b2h(await self.send_apdu_checksw_bin(bytes.fromhex(pdu), sw))
+
+    def get_atr(self) -> Hexstr:
+        """Return the ATR of the currently inserted card."""
+        return self._tp.get_atr()
+
+    async def select_path(self, dir_list: Path) -> List[Hexstr]:
+        """Execute SELECT for an entire list/path of FIDs.
+
+        Args:
+                dir_list: list of FIDs representing the path to select
+
+        Returns:
+                list of return values (FCP in hex encoding) for each element of the path
+        """
+        if not isinstance(dir_list, list):
+            dir_list = [dir_list]
+        dir_list = [fid.lower() for fid in dir_list]
+        rv = self._sel_cache_lookup(dir_list)
+        if rv is not None:
+            return rv
+        rv = []
+        for i in dir_list:
+            data, _sw = await self.select_file(i)
+            rv.append(data)
+        self._sel_cache_update(dir_list, rv)
+        return rv
+
+    async def select_file(self, fid: Hexstr) -> ResTuple:
+        """Execute SELECT a given file by FID.
+
+        Args:
+                fid : file identifier as hex string
+        """
+        data, sw = await self.send_apdu_checksw(self.cla_byte + "a4" + self.sel_ctrl + "02" + fid)
+        self._sel_cache_update([fid.lower()], [data])
+        return data, sw
+
+    async def select_adf(self, aid: Hexstr) -> ResTuple:
+        """Execute SELECT a given Applicaiton ADF.
+
+        Args:
+                aid : application identifier as hex string
+        """
+        return await self.send_apdu_checksw(self.cla_byte + "a40404" + '%02x' % (len(aid) // 2) + aid)
+
+    async def read_binary(self, ef: Path, length: int = None, offset: int = 0) -> ResTuple:
+        """Execute READ BINARY.
+
+        Args:
+                ef : string or list of strings indicating name or path of transparent EF
+                length : number of bytes to read
+                offset : byte offset in file from which to start reading
+        """
+        r = await self.select_path(ef)
+        if len(r[-1]) == 0:
+            return (None, None)
+        if length is None:
+            length = self._file_len(r) - offset
+        if length < 0:
+            return (None, None)
+
+        total_data = ''
+        chunk_offset = 0
+        while chunk_offset < length:
+            chunk_len = min(self.max_rsp_len, length-chunk_offset)
+            pdu = self.cla_byte + \
+                'b0%04x' % (offset + chunk_offset) + self.encode_le(chunk_len)
+            try:
+                data, sw = await self.send_apdu_checksw(pdu)
+            except Exception as e:
+                raise ValueError('%s, failed to read (offset %d)' %
+                                 (str_sanitize(str(e)), offset)) from e
+            total_data += data
+            chunk_offset += chunk_len
+        return total_data, sw
+
+    async def update_binary(self, ef: Path, data: Hexstr, offset: int = 0, verify: bool = False,
+                            conserve: bool = False) -> ResTuple:
+        """Execute UPDATE BINARY.
+
+        Args:
+                ef : string or list of strings indicating name or path of transparent EF
+                data : hex string of data to be written
+                offset : byte offset in file from which to start writing
+                verify : Whether or not to verify data after write
+                conserve : read the current data first and only write the ranges that differ
+        """
+        file_len = await self.binary_size(ef)
+        data = expand_hex(data, file_len)
+        data_length = len(data) // 2
+
+        data_current = None
+        sw = None
+        if conserve:
+            try:
+                data_current, sw = await self.read_binary(ef, data_length, offset)
+            except Exception:
+                # see SimCardCommands.update_binary
+                pass
+        ranges = self._write_ranges(data, data_current)
+        if not ranges:
+            return None, sw
+
+        await self.select_path(ef)
+        total_data = ''
+        for range_offset, range_len in ranges:
+            chunk_offset = range_offset
+            while chunk_offset < range_offset + range_len:
+                chunk_len = min(self.max_cmd_len, range_offset + range_len - chunk_offset)
+                pdu = self.cla_byte + \
+                    'd6%04x' % (offset + chunk_offset) + self.encode_lc(chunk_len) + \
+                    data[chunk_offset*2: (chunk_offset+chunk_len)*2]
+                try:
+                    chunk_data, chunk_sw = await self.send_apdu_checksw(pdu)
+                except Exception as e:
+                    raise ValueError('%s, failed to write chunk (chunk_offset %d, chunk_len %d)' %
+                                     (str_sanitize(str(e)), chunk_offset, chunk_len)) from e
+                total_data += chunk_data
+                chunk_offset += chunk_len
+        if verify:
+            res = await self.read_binary(ef, data_length, offset)
+            if res[0].lower() != data.lower():
+                raise ValueError('Binary verification failed (expected %s, got %s)' % (
+                    data.lower(), res[0].lower()))
+        return total_data, chunk_sw
+
+    async def read_record(self, ef: Path, rec_no: int) -> ResTuple:
+        """Execute READ RECORD.
+
+        Args:
+                ef : string or list of strings indicating name or path of linear fixed EF
+                rec_no : record number to read
+        """
+        r = await self.select_path(ef)
+        rec_length = self._record_len(r)
+        pdu = self.cla_byte + 'b2%02x04%02x' % (rec_no, rec_length)
+        return await self.send_apdu_checksw(pdu)
+
+    async def read_records(self, ef: Path, first: int = 1, count: Optional[int] = None, next_mode: bool = False,
+                           stop_on_empty: bool = False) -> AsyncGenerator[Tuple[int, Hexstr], None]:
+        """Execute READ RECORD for a range of records, see SimCardCommands.read_records."""
+        if next_mode:
+            if first != 1:
+                raise ValueError('READ RECORD in NEXT mode must start at record 1')
+            self.invalidate_sel_cache()
+        r = await self.select_path(ef)
+        pdu_hdr, count, empty = self._read_records_prepare(r, first, count, next_mode)
+        for rec_no in range(first, first + count):
+            pdu = pdu_hdr if next_mode else pdu_hdr % rec_no
+            data, _sw = await self.send_apdu_checksw(pdu)
+            if stop_on_empty and data == empty:
+                return
+            yield rec_no, data
+
+    async def update_record(self, ef: Path, rec_no: int, data: Hexstr, force_len: bool = False,
+                            verify: bool = False, conserve: bool = False, leftpad: bool = False) -> ResTuple:
+        """Execute UPDATE RECORD.
+
+        Args:
+                ef : string or list of strings indicating name or path of linear fixed EF
+                rec_no : record number to read
+                data : hex string of data to be written
+                force_len : enforce record length by using the actual data length
+                verify : verify data by re-reading the record
+                conserve : read record and compare it with data, skip write on match
+                leftpad : apply 0xff padding from the left instead from the right side.
+        """
+        res = await self.select_path(ef)
+        rec_length = self._record_len(res)
+        data = expand_hex(data, rec_length)
+
+        if force_len:
+            rec_length = len(data) // 2
+        else:
+            if len(data) // 2 > rec_length:
+                raise ValueError('Data length exceeds record length (expected max %d, got %d)' % (
+                    rec_length, len(data) // 2))
+            elif len(data) // 2 < rec_length:
+                if leftpad:
+                    data = lpad(data, rec_length * 2)
+                else:
+                    data = rpad(data, rec_length * 2)
+
+        if conserve:
+            try:
+                data_current, sw = await self.read_record(ef, rec_no)
+                if data_current[0:rec_length*2] == data.lower():
+                    return None, sw
+            except Exception:
+                # see SimCardCommands.update_record
+                pass
+
+        pdu = (self.cla_byte + 'dc%02x04%02x' % (rec_no, rec_length)) + data
+        res = await self.send_apdu_checksw(pdu)
+        if verify:
+            data_current, _sw = await self.read_record(ef, rec_no)
+            if data_current.lower() != data.lower():
+                raise ValueError('Record verification failed (expected %s, got %s)' % (
+                    data.lower(), data_current.lower()))
+        return res
+
+    async def record_size(self, ef: Path) -> int:
+        """Determine the record size of given file.
+
+        Args:
+                ef : string or list of strings indicating name or path of linear fixed EF
+        """
+        return self._record_len(await self.select_path(ef))
+
+    async def record_count(self, ef: Path) -> int:
+        """Determine the number of records in given file.
+
+        Args:
+                ef : string or list of strings indicating name or path of linear fixed EF
+        """
+        r = await self.select_path(ef)
+        return self._file_len(r) // self._record_len(r)
+
+    async def binary_size(self, ef: Path) -> int:
+        """Determine the size of given transparent file.
+
+        Args:
+                ef : string or list of strings indicating name or path of transparent EF
+        """
+        return self._file_len(await self.select_path(ef))
+
+    async def run_gsm(self, rand: Hexstr) -> ResTuple:
+        """Execute RUN GSM ALGORITHM.
+
+        Args:
+                rand : 16 byte random data as hex string (RAND)
+        """
+        if len(rand) != 32:
+            raise ValueError('Invalid rand')
+        await self.select_path(['3f00', '7f20'])
+        return await self.send_apdu_checksw(self.cla4lchan('a0') + '88000010' + rand, sw='9000')
+
+    async def authenticate(self, rand: Hexstr, autn: Hexstr, context: str = '3g') -> ResTuple:
+        """Execute AUTHENTICATE (USIM/ISIM).
+
+        Args:
+                rand : 16 byte random data as hex string (RAND)
+                autn : 8 byte Autentication Token (AUTN)
+                context : security context ('3g', 'gsm' or 'gba')
+        """
+        data, sw = await self.send_apdu_checksw(self._auth_pdu(rand, autn, context))
+        return (self._auth_result(data, context), sw)
+
+    async def authenticate_batch(self, vectors: Iterable[Tuple[Hexstr, Optional[Hexstr]]],
+                                 context: str = '3g') -> AsyncGenerator[Tuple[Optional[dict], SwHexstr], None]:
+        """Execute AUTHENTICATE for each (RAND, AUTN) pair (see SimCardCommands.authenticate_batch)."""
+        if context == '2g':
+            await self.select_path(['3f00', '7f20'])
+        for rand, autn in vectors:
+            try:
+                data, sw = await self.send_apdu_checksw(self._auth_pdu(rand, autn, context))
+            except SwMatchError as e:
+                yield (None, e.sw_actual)
+                continue
+            yield (self._auth_result(data, context), sw)
+
+    async def status(self) -> ResTuple:
+        """Execute a STATUS command as per TS 102 221 Section 11.1.2."""
+        return await self.send_apdu_checksw(self.cla4lchan('80') + 'F20000ff')
+
+    async def manage_channel(self, mode: str = 'open', lchan_nr: int =0) -> ResTuple:
+        """Execute MANAGE CHANNEL command as per TS 102 221 Section 11.1.17.
+
+        Args:
+                mode : logical channel operation code ('open' or 'close')
+                lchan_nr : logical channel number (1-19, 0=assigned by UICC)
+        """
+        p1 = 0x80 if mode == 'close' else 0x00
+        return await self.send_apdu_checksw(self.cla_byte + '70%02x%02x00' % (p1, lchan_nr))
+
+    async def reset_card(self) -> Hexstr:
+        """Physically reset the card"""
+        self.invalidate_sel_cache(all_lchans=True)
+        return await self._tp.reset_card()
+
+    async def verify_chv(self, chv_no: int, code: Hexstr) -> ResTuple:
+        """Verify a given CHV (Card Holder Verification == PIN)
+
+        Args:
+                chv_no : chv number (1=CHV1, 2=CHV2, ...)
+                code : chv code as hex string
+        """
+        fc = rpad(b2h(code), 16)
+        data, sw = await self.send_apdu(self.cla_byte + '2000' + ('%02X' % chv_no) + '08' + fc)
+        self._chv_process_sw('verify', chv_no, code, sw)
+        return (data, sw)
@@ -1,20 +1,69 @@
+import os
 import sys
+import pickle
+import hashlib
 from typing import Optional
 from importlib import resources
 
 
+def _asn1_cache_dir() -> str:
+    """Directory in which compiled ASN.1 specifications are cached."""
+    if 'PYSIM_ASN1_CACHE_DIR' in os.environ:
+        return os.environ['PYSIM_ASN1_CACHE_DIR']
+    cache_home = os.environ.get('XDG_CACHE_HOME', os.path.join(os.path.expanduser('~'), '.cache'))
+    return os.path.join(cache_home, 'pysim', 'asn1')
+
 def compile_asn1_subdir(subdir_name:str):
-    """Helper function that compiles ASN.1 syntax from all files within given subdir"""
+    """Helper function that compiles ASN.1 syntax from all files within given subdir.
+
+    The compiled specification is cached on disk, keyed by a hash over the contents of the
+    ASN.1 files as well as the asn1tools and python versions; subsequent calls (also from other
+    processes) will simply load it from there."""
     import asn1tools
     asn_txt = ''
     __ver = sys.version_info
     if (__ver.major, __ver.minor) >= (3, 9):
-        for i in resources.files('pySim.esim').joinpath('asn1').joinpath(subdir_name).iterdir():
+        for i in sorted(resources.files('pySim.esim').joinpath('asn1').joinpath(subdir_name).iterdir(),
+                        key=lambda x: x.name):
             asn_txt += i.read_text()
             asn_txt += "\n"
     #else:
         #print(resources.read_text(__name__, 'asn1/rsp.asn'))
-    return asn1tools.compile_string(asn_txt, codec='der')
+    h = hashlib.sha256(asn_txt.encode('utf-8'))
+    h.update(('%s %u.%u' % (asn1tools.__version__, __ver.major, __ver.minor)).encode('ascii'))
+    cache_path = os.path.join(_asn1_cache_dir(), '%s-%s.pickle' % (subdir_name, h.hexdigest()[:32]))
+    try:
+        with open(cache_path, 'rb') as f:
+            return pickle.load(f)
+    except Exception:
+        pass
+    spec = asn1tools.compile_string(asn_txt, codec='der')
+    try:
+        os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+        # write to a temporary file first, so concurrent processes never see a partial file
+        tmp_path = '%s.%u' % (cache_path, os.getpid())
+        with open(tmp_path, 'wb') as f:
+            pickle.dump(spec, f)
+        os.replace(tmp_path, cache_path)
+    except Exception:
+        # caching is an optimization only; e.g. the home directory may not be writable
+        pass
+    return spec
+
+
+class LazyAsn1:
+    """Placeholder for a compiled ASN.1 specification that is only compiled (or loaded from the
+    cache) when it is first used.  All attribute accesses (like encode/decode) are forwarded to the
+    asn1tools compiled specification."""
+    def __init__(self, subdir_name:str):
+        self._subdir_name = subdir_name
+        self._spec = None
+
+    def __getattr__(self, name):
+        # only called for attributes not found in the instance, i.e. everything except the above
+        if self._spec is None:
+            self._spec = compile_asn1_subdir(self._subdir_name)
+        return getattr(self._spec, name)
 
 
 # SGP.22 section 4.1 Activation Code
@@ -35,7 +35,7 @@ from cryptography.hazmat.primitives.kdf.x963kdf import X963KDF
 from Cryptodome.Cipher import AES
 from Cryptodome.Hash import CMAC
 
-from pySim.utils import bertlv_encode_len, bertlv_parse_one, b2h
+from pySim.utils import bertlv_encode_len, BerTlvReader, b2h
 
 # don't log by default
 logger = logging.getLogger(__name__)
@@ -275,8 +275,9 @@ class BspInstance:
 
     def demac_and_decrypt_one(self, ciphertext: bytes) -> bytes:
         payload = self.m_algo.verify(ciphertext)
-        tdict, l, val, remain = bertlv_parse_one(payload)
-        logger.debug("tag=%s, l=%u, val=%s, remain=%s", tdict, l, b2h(val), b2h(remain))
+        tag, offset, l = next(BerTlvReader(payload))
+        val = payload[offset:offset+l]
+        logger.debug("tag=0x%x, l=%u, val=%s, remain=%s", tag, l, b2h(val), b2h(payload[offset+l:]))
         plaintext = self.c_algo.decrypt(val)
         return plaintext
 
@@ -286,8 +287,8 @@ class BspInstance:
 
     def demac_only_one(self, ciphertext: bytes) -> bytes:
         payload = self.m_algo.verify(ciphertext)
-        _tdict, _l, val, _remain = bertlv_parse_one(payload)
-        return val
+        _tag, offset, l = next(BerTlvReader(payload))
+        return payload[offset:offset+l]
 
     def demac_only(self, ciphertext_list: List[bytes]) -> bytes:
         plaintext_list = [self.demac_only_one(x) for x in ciphertext_list]
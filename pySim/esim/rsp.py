@@ -24,9 +24,9 @@ from cryptography.hazmat.primitives.asymmetric import ec
 from cryptography.hazmat.primitives.serialization import Encoding
 from cryptography import x509
 
-from pySim.esim import compile_asn1_subdir
+from pySim.esim import LazyAsn1
 
-asn1 = compile_asn1_subdir('rsp')
+asn1 = LazyAsn1('rsp')
 
 class RspSessionState:
     """Encapsulates the state of a RSP session.  It is created during the initiateAuthentication
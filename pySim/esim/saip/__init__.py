@@ -21,13 +21,13 @@ from typing import Tuple, List, Optional, Dict, Union
 
 import asn1tools
 
-from pySim.utils import bertlv_parse_tag, bertlv_parse_len
+from pySim.utils import BerTlvReader
 from pySim.ts_102_221 import FileDescriptor
 from pySim.construct import build_construct
-from pySim.esim import compile_asn1_subdir
+from pySim.esim import LazyAsn1
 from pySim.esim.saip import templates
 
-asn1 = compile_asn1_subdir('saip')
+asn1 = LazyAsn1('saip')
 
 class File:
     """Internal representation of a file in a profile filesystem.
@@ -212,11 +212,9 @@ class ProfileElement:
 def bertlv_first_segment(binary: bytes) -> Tuple[bytes, bytes]:
     """obtain the first segment of a binary concatenation of BER-TLV objects.
         Returns: tuple of first TLV and remainder."""
-    _tagdict, remainder = bertlv_parse_tag(binary)
-    length, remainder = bertlv_parse_len(remainder)
-    tl_length = len(binary) - len(remainder)
-    tlv_length = tl_length + length
-    return binary[:tlv_length], binary[tlv_length:]
+    reader = BerTlvReader(binary)
+    _tag, offset, length = next(reader)
+    return binary[:offset+length], binary[offset+length:]
 
 class ProfileElementSequence:
     """A sequence of ProfileElement objects, which is the overall representation of an eSIM profile."""
@@ -241,10 +239,9 @@ class ProfileElementSequence:
     def parse_der(self, der: bytes) -> None:
         """Parse a sequence of PE and store the result in self.pe_list."""
         self.pe_list = []
-        remainder = der
-        while len(remainder):
-            first_tlv, remainder = bertlv_first_segment(remainder)
-            self.pe_list.append(ProfileElement.from_der(first_tlv))
+        reader = BerTlvReader(der)
+        for _tag, offset, length in reader:
+            self.pe_list.append(ProfileElement.from_der(der[reader.tlv_offset:offset+length]))
         self._process_pelist()
 
     def _process_pelist(self) -> None:
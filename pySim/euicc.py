@@ -318,7 +318,7 @@ class CardApplicationISDR(pySim.global_platform.CardApplicationSD):
     def store_data(scc: SimCardCommands, tx_do: Hexstr, exp_sw: SwMatchstr ="9000") -> Tuple[Hexstr, SwHexstr]:
         """Perform STORE DATA according to Table 47+48 in Section 5.7.2 of SGP.22.
         Only single-block store supported for now."""
-        capdu = '%sE29100%02x%s' % (scc.cla4lchan('80'), len(tx_do)//2, tx_do)
+        capdu = '%sE29100%s%s' % (scc.cla4lchan('80'), scc.encode_lc(len(tx_do)//2), tx_do)
         return scc.send_apdu_checksw(capdu, exp_sw)
 
     @staticmethod
@@ -328,8 +328,8 @@ class CardApplicationISDR(pySim.global_platform.CardApplicationSD):
         if cmd_do:
             cmd_do_enc = cmd_do.to_tlv()
             cmd_do_len = len(cmd_do_enc)
-            if cmd_do_len > 255:
-                return ValueError('DO > 255 bytes not supported yet')
+            if cmd_do_len > scc.max_cmd_len:
+                raise ValueError('DO > %u bytes not supported yet' % scc.max_cmd_len)
         else:
             cmd_do_enc = b''
         (data, _sw) = CardApplicationISDR.store_data(scc, b2h(cmd_do_enc), exp_sw=exp_sw)
@@ -30,6 +30,7 @@ import tempfile
 import json
 import abc
 import inspect
+import importlib
 
 import cmd2
 from cmd2 import CommandSet, with_default_category
@@ -132,34 +133,51 @@ class CardFile:
         return ret
 
     def build_select_path_to(self, target: 'CardFile') -> Optional[List['CardFile']]:
-        """Build the relative sequence of files we need to traverse to get from us to 'target'."""
+        """Build the relative sequence of files we need to traverse to get from us to 'target'.
 
-        # special-case handling for applications. Applications may be selected
-        # any time from any location. If there is an ADF somewhere in the path,
-        # we may clip everything before that ADF.
-        def clip_path(inter_path):
-            for i in reversed(range(0, len(inter_path))):
-                if isinstance(inter_path[i], CardADF):
-                    return inter_path[i:]
-            return inter_path
+        Following TS 102 221 Section 8.4.1, the files which can be selected by FID are the children,
+        the parent and the sibling DFs of the current DF, the current DF itself and the MF; ADFs can be
+        selected by AID from anywhere.  Selecting an EF does not change the current DF.  Of the
+        possible sequences, the one with the fewest SELECT commands is returned."""
 
+        mf = target.get_mf()
         # special-case handling for selecting MF while the MF is selected
-        if target == target.get_mf():
+        if target == mf:
             return [target]
-        cur_fqpath = self.fully_qualified_path_fobj()
+        # when an EF is selected, we start from the DF it is located in
+        cur = self if isinstance(self, CardDF) else self.parent
+        if cur is None:
+            return None
+        if target == cur:
+            return [target]
+        cur_fqpath = cur.fully_qualified_path_fobj()
         target_fqpath = target.fully_qualified_path_fobj()
-        inter_path = []
-        cur_fqpath.reverse()
-        for ce in cur_fqpath:
-            inter_path.append(ce)
-            for i in range(0, len(target_fqpath)-1):
-                te = target_fqpath[i]
-                if te == ce:
-                    for te2 in target_fqpath[i+1:]:
-                        inter_path.append(te2)
-                    # we found our common ancestor
-                    return clip_path(inter_path[1:])
-        return None
+        if cur_fqpath[0] != target_fqpath[0]:
+            return None
+        # number of path elements the current DF and the target have in common
+        common = 0
+        while common < min(len(cur_fqpath), len(target_fqpath)) and cur_fqpath[common] == target_fqpath[common]:
+            common += 1
+        down = target_fqpath[common:]
+        if common == len(cur_fqpath):
+            # target is located below the current DF
+            candidates = [down]
+        else:
+            # climb up to the common ancestor, select its child on the target path directly if that
+            # is a sibling DF of where we are by then
+            up = list(reversed(cur_fqpath[common-1:-1]))
+            if down and isinstance(down[0], CardDF) and not isinstance(cur_fqpath[common], CardADF):
+                up = up[:-1]
+            candidates = [up + down]
+        # select the MF and descend from there
+        candidates.append(target_fqpath)
+        # applications may be selected any time from any location, so if there is an ADF in the
+        # target path, we may clip everything before that ADF.
+        for i in reversed(range(0, len(target_fqpath))):
+            if isinstance(target_fqpath[i], CardADF):
+                candidates.append(target_fqpath[i:])
+                break
+        return min(candidates, key=len)
 
     def get_mf(self) -> Optional['CardMF']:
         """Return the MF (root) of the file system."""
@@ -804,9 +822,11 @@ class LinFixedEF(CardEF):
         @cmd2.with_argparser(read_rec_parser)
         def do_read_record(self, opts):
             """Read one or multiple records from a record-oriented EF"""
-            for r in range(opts.count):
-                recnr = opts.record_nr + r
-                (data, _sw) = self._cmd.lchan.read_record(recnr)
+            if opts.count == 1:
+                recs = [(opts.record_nr, self._cmd.lchan.read_record(opts.record_nr)[0])]
+            else:
+                recs = self._cmd.lchan.read_records(range(opts.record_nr, opts.record_nr + opts.count))
+            for recnr, data in recs:
                 if len(data) > 0:
                     recstr = str(data)
                 else:
@@ -826,13 +846,16 @@ class LinFixedEF(CardEF):
             self._cmd.poutput_json(data, opts.oneline)
 
         read_recs_parser = argparse.ArgumentParser()
+        read_recs_parser.add_argument('--next', action='store_true',
+                                      help='Use the NEXT mode of READ RECORD instead of record numbers')
+        read_recs_parser.add_argument('--stop-on-empty', action='store_true',
+                                      help='Stop at the first unused record (all bytes FF)')
 
         @cmd2.with_argparser(read_recs_parser)
-        def do_read_records(self, _opts):
+        def do_read_records(self, opts):
             """Read all records from a record-oriented EF"""
-            num_of_rec = self._cmd.lchan.selected_file_num_of_rec()
-            for recnr in range(1, 1 + num_of_rec):
-                (data, _sw) = self._cmd.lchan.read_record(recnr)
+            for recnr, data in self._cmd.lchan.read_records(next_mode=opts.next,
+                                                            stop_on_empty=opts.stop_on_empty):
                 if len(data) > 0:
                     recstr = str(data)
                 else:
@@ -842,16 +865,20 @@ class LinFixedEF(CardEF):
         read_recs_dec_parser = argparse.ArgumentParser()
         read_recs_dec_parser.add_argument('--oneline', action='store_true',
                                           help='No JSON pretty-printing, dump as a single line')
+        read_recs_dec_parser.add_argument('--next', action='store_true',
+                                          help='Use the NEXT mode of READ RECORD instead of record numbers')
+        read_recs_dec_parser.add_argument('--stop-on-empty', action='store_true',
+                                          help='Stop at the first unused record (all bytes FF)')
 
         @cmd2.with_argparser(read_recs_dec_parser)
         def do_read_records_decoded(self, opts):
             """Read + decode all records from a record-oriented EF"""
-            num_of_rec = self._cmd.lchan.selected_file_num_of_rec()
+            ef = self._cmd.lchan.selected_file
             # collect all results in list so they are rendered as JSON list when printing
             data_list = []
-            for recnr in range(1, 1 + num_of_rec):
-                (data, _sw) = self._cmd.lchan.read_record_dec(recnr)
-                data_list.append(data)
+            for recnr, data in self._cmd.lchan.read_records(next_mode=opts.next,
+                                                            stop_on_empty=opts.stop_on_empty):
+                data_list.append(ef.decode_record_hex(data, recnr))
             self._cmd.poutput_json(data_list, opts.oneline)
 
         upd_rec_parser = argparse.ArgumentParser()
@@ -1264,6 +1291,62 @@ class BerTlvEF(CardEF):
         self.size = size
         self.shell_commands = [self.ShellCommands()]
 
+class WalkPlan:
+    """Order in which a walk through the file system visits the files below a DF, chosen so that
+    each file can be reached from the one visited before with few SELECT commands: the EFs of a DF
+    are visited before its sub-DFs, so that they can all be selected by FID relative to that DF
+    without ever climbing back into it.  Moving on from one sub-tree to the next is done by the
+    shortest path as determined by CardFile.build_select_path_to(), which selects sibling DFs
+    directly and starts over from the MF when that is cheaper than climbing up.
+
+    The plan also predicts the number of SELECT commands (and of EFs read using SFI addressing
+    instead of a SELECT) that walking the entire tree takes, assuming all files exist."""
+
+    def __init__(self, start: CardDF, efs: bool = True, sfi: bool = False):
+        """
+        Args:
+            start : DF at which the walk starts (and ends)
+            efs : EFs are selected (otherwise only DFs are selected, e.g. to list the tree)
+            sfi : transparent and record oriented EFs which have a SFI are read using SFI addressing,
+                  without SELECT
+        """
+        self.start = start
+        self.efs = efs
+        self.sfi = sfi
+        self.selects = 0
+        self.sfi_reads = 0
+        cur = start
+        for f in self.files():
+            if self.use_sfi(f):
+                self.sfi_reads += 1
+            elif isinstance(f, CardDF) or efs:
+                self.selects += len(cur.build_select_path_to(f))
+                cur = f
+        if cur != start:
+            self.selects += len(cur.build_select_path_to(start))
+
+    def __str__(self):
+        return "%u SELECT commands, %u SFI reads" % (self.selects, self.sfi_reads)
+
+    def use_sfi(self, f: CardFile) -> bool:
+        """Whether the given EF is read using SFI addressing instead of being selected."""
+        return self.sfi and isinstance(f, (TransparentEF, LinFixedEF)) and f.sfid is not None
+
+    def children(self, df: CardDF) -> List[CardFile]:
+        """Return the files (and applications) directly below the given DF in the order to visit them."""
+        files = list(df.get_selectables(flags=['FNAMES', 'ANAMES']).values())
+        if not self.efs:
+            return files
+        return [f for f in files if not isinstance(f, CardDF)] + [f for f in files if isinstance(f, CardDF)]
+
+    def files(self, df: Optional[CardDF] = None) -> Iterable[CardFile]:
+        """Iterate over all files below the given DF (default: the start DF) in the order to visit them."""
+        for f in self.children(df or self.start):
+            yield f
+            if isinstance(f, CardDF):
+                yield from self.files(f)
+
+
 def interpret_sw(sw_data: dict, sw: str):
     """Interpret a given status word.
 
@@ -1319,6 +1402,26 @@ class CardApplication:
         return interpret_sw(self.sw, sw)
 
 
+class LazyCardApplication:
+    """Placeholder for a CardApplication whose implementing module has not been imported yet.  It
+    carries just enough information (name, AID) to match it against the applications present on a
+    card; the module is only imported once load() is called for an application that was found."""
+
+    def __init__(self, name: str, aid: str, module_name: str, class_name: str):
+        self.name = name
+        self.aid = aid
+        self.module_name = module_name
+        self.class_name = class_name
+
+    def __str__(self):
+        return "APP(%s)" % (self.name)
+
+    def load(self) -> CardApplication:
+        """Import the implementing module and instantiate the actual CardApplication."""
+        module = importlib.import_module(self.module_name)
+        return getattr(module, self.class_name)()
+
+
 class CardModel(abc.ABC):
     """A specific card model, typically having some additional vendor-specific files. All
     you need to do is to define a sub-class with a list of ATRs or an overridden match
@@ -503,7 +503,7 @@ class ADF_SD(CardADF):
                 p1b = build_construct(ADF_SD.StoreData,
                                       {'last_block': len(remainder) == 0, 'encryption': encryption,
                                        'structure': structure, 'response': response_permitted})
-                hdr = "80E2%02x%02x%02x" % (p1b[0], block_nr, len(chunk))
+                hdr = "80E2%02x%02x" % (p1b[0], block_nr) + self._cmd.lchan.scc.encode_lc(len(chunk))
                 data, _sw = self._cmd.lchan.scc.send_apdu_checksw(hdr + b2h(chunk))
                 block_nr += 1
                 response += data
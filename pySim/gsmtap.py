@@ -203,6 +203,11 @@ class GsmtapSource:
         self.bind_ip = bind_ip
         self.bind_port = bind_port
         self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        # a larger receive buffer helps to not lose packets during bursts of traffic
+        try:
+            self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 4 * 1024 * 1024)
+        except OSError:
+            pass
         self.sock.bind((self.bind_ip, self.bind_port))
 
     def read_packet(self) -> GsmtapMessage:
@@ -0,0 +1,106 @@
+# -*- coding: utf-8 -*-
+
+""" pySim: measure the time spent importing python modules.
+
+This is used to implement the --profile-startup option of pySim-shell.  It must
+be started before any of the modules of interest are imported and hence has no
+dependencies on any other pySim module.
+"""
+
+#
+# (C) 2024 by Sysmocom s.f.m.c. GmbH
+# All Rights Reserved
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+import sys
+import time
+import builtins
+import importlib
+
+
+class ImportProfiler:
+    """Record the time it takes to import each module (both via the import statement and via
+    importlib.import_module).  For every module, the cumulative time (including the import of
+    any modules it imports in turn) and the self time (excluding those) is recorded."""
+
+    def __init__(self):
+        self.t_start = None
+        # module name -> [cumulative time, self time], in order of completion
+        self.timings = {}
+        self._stack = []
+        self._orig_import = None
+        self._orig_import_module = None
+
+    def _timed(self, name: str, fn, *args, **kwargs):
+        if name in sys.modules:
+            return fn(*args, **kwargs)
+        # time spent in nested imports is subtracted from the self time of the parent
+        self._stack.append(0.0)
+        t_start = time.perf_counter()
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            cumulative = time.perf_counter() - t_start
+            nested = self._stack.pop()
+            if self._stack:
+                self._stack[-1] += cumulative
+            if name in sys.modules and name not in self.timings:
+                self.timings[name] = [cumulative, cumulative - nested]
+
+    def _import(self, name, globals=None, locals=None, fromlist=(), level=0):
+        if level != 0:
+            # relative import: resolve the absolute name so we can check sys.modules
+            package = globals.get('__package__') if globals else None
+            if package:
+                base = package.rsplit('.', level - 1)[0]
+                name_abs = '%s.%s' % (base, name) if name else base
+            else:
+                name_abs = name
+        else:
+            name_abs = name
+        return self._timed(name_abs, self._orig_import, name, globals, locals, fromlist, level)
+
+    def _import_module(self, name, package=None):
+        return self._timed(name, self._orig_import_module, name, package)
+
+    def start(self):
+        """Start recording imports."""
+        self.t_start = time.perf_counter()
+        self._orig_import = builtins.__import__
+        self._orig_import_module = importlib.import_module
+        builtins.__import__ = self._import
+        importlib.import_module = self._import_module
+
+    def stop(self):
+        """Stop recording imports."""
+        builtins.__import__ = self._orig_import
+        importlib.import_module = self._orig_import_module
+
+    def report(self, num: int = 25, prefix: str = None) -> str:
+        """Return a human readable report of the slowest imports.
+
+        Args:
+                num : number of modules to include in the report
+                prefix : only include modules whose name starts with prefix
+        """
+        items = [(k, v) for k, v in self.timings.items() if prefix is None or k.startswith(prefix)]
+        items.sort(key=lambda x: x[1][0], reverse=True)
+        lines = ['%10s %10s  %s' % ('cumul[ms]', 'self[ms]', 'module')]
+        for name, (cumulative, self_time) in items[:num]:
+            lines.append('%10.1f %10.1f  %s' % (cumulative * 1000, self_time * 1000, name))
+        total_self = sum([x[1] for x in self.timings.values()])
+        lines.append('%u modules imported, %.1f ms in total' % (len(self.timings), total_self * 1000))
+        return '\n'.join(lines)
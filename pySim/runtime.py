@@ -17,9 +17,9 @@
 # You should have received a copy of the GNU General Public License
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
-from typing import Optional, Tuple
+from typing import Optional, Tuple, Generator
 
-from pySim.utils import h2b, i2h, is_hex, bertlv_parse_one, Hexstr
+from pySim.utils import h2b, i2h, is_hex, bertlv_parse_one, expand_hex, lpad, rpad, Hexstr, ResTuple
 from pySim.exceptions import *
 from pySim.filesystem import *
 
@@ -34,6 +34,85 @@ def lchan_nr_from_cla(cla: int) -> int:
         return 4 + (cla & 0x0F)
     raise ValueError('Could not determine logical channel for CLA=%2X' % cla)
 
+class ContentCache:
+    """Cache of the content of transparent EFs and of the records of linear fixed / cyclic EFs of a card,
+    keyed by the fully qualified path of the file.  It is populated by reads and updated write-through by
+    writes performed via RuntimeLchan.  Anything that modifies the card in other ways must invalidate the
+    affected files (or the entire cache)."""
+
+    def __init__(self):
+        # path -> hex string of entire file content
+        self._binary = {}
+        # path -> dict of record number -> hex string of record content
+        self._records = {}
+
+    @staticmethod
+    def _key(ef: CardFile) -> Tuple[str, ...]:
+        return tuple(ef.fully_qualified_path(prefer_name=False))
+
+    def get_binary(self, ef: CardFile, length: Optional[int] = None, offset: int = 0) -> Optional[Hexstr]:
+        """Return [part of] the cached content of a transparent EF, or None if not cached."""
+        data = self._binary.get(self._key(ef))
+        if data is None:
+            return None
+        if length is None:
+            return data[offset*2:]
+        if offset + length > len(data) // 2:
+            return None
+        return data[offset*2:(offset+length)*2]
+
+    def put_binary(self, ef: CardFile, data: Hexstr):
+        """Store the entire content of a transparent EF."""
+        self._binary[self._key(ef)] = data.lower()
+
+    def update_binary(self, ef: CardFile, data: Hexstr, offset: int = 0):
+        """Apply a write of [part of] a transparent EF to the cached content (if any)."""
+        key = self._key(ef)
+        cur = self._binary.get(key)
+        if cur is None:
+            return
+        if '.' in data or offset + len(data) // 2 > len(cur) // 2:
+            del self._binary[key]
+            return
+        self._binary[key] = cur[:offset*2] + data.lower() + cur[(offset*2 + len(data)):]
+
+    def get_record(self, ef: CardFile, rec_nr: int) -> Optional[Hexstr]:
+        """Return the cached content of a record, or None if not cached."""
+        return self._records.get(self._key(ef), {}).get(rec_nr)
+
+    def put_record(self, ef: CardFile, rec_nr: int, data: Hexstr):
+        """Store the content of a record."""
+        self._records.setdefault(self._key(ef), {})[rec_nr] = data.lower()
+
+    def update_record(self, ef: CardFile, rec_nr: int, data: Hexstr, rec_len: Optional[int] = None):
+        """Apply a write of a record to the cache.  As the card pads the data to the record length, the
+        record length must be known (either from a cached copy of the record, or via 'rec_len')."""
+        cur = self.get_record(ef, rec_nr)
+        if cur is not None:
+            rec_len = len(cur) // 2
+        if rec_len is None:
+            return
+        data = expand_hex(data, rec_len)
+        if '.' in data or len(data) // 2 > rec_len:
+            self._records.get(self._key(ef), {}).pop(rec_nr, None)
+            return
+        if len(data) // 2 < rec_len:
+            data = lpad(data, rec_len * 2) if getattr(ef, 'leftpad', False) else rpad(data, rec_len * 2)
+        self.put_record(ef, rec_nr, data)
+
+    def invalidate(self, file: Optional[CardFile] = None):
+        """Forget the cached content of the given file (or of all files, if it is a DF, located below
+        it), or of all files."""
+        if file is None:
+            self._binary.clear()
+            self._records.clear()
+            return
+        prefix = self._key(file)
+        for d in (self._binary, self._records):
+            for key in [k for k in d.keys() if k[:len(prefix)] == prefix]:
+                del d[key]
+
+
 class RuntimeState:
     """Represent the runtime state of a session with a card."""
 
@@ -73,6 +152,10 @@ class RuntimeState:
         for f in self.profile.files_in_mf:
             self.mf.add_file(f)
         self.conserve_write = True
+        # use SFI addressing to access EFs in the currently selected DF without SELECT
+        self.use_sfi = False
+        # opt-in cache of file contents (ContentCache), see RuntimeLchan.read_binary
+        self.content_cache = None
 
         # make sure that when the runtime state is created, the card is also
         # in a defined state.
@@ -122,6 +205,13 @@ class RuntimeState:
                     apps_taken.append(f)
             except (SwMatchError, ProtocolError):
                 pass
+
+        # import the modules of those applications that are actually present on the card
+        for i, f in enumerate(apps_taken):
+            if isinstance(f, LazyCardApplication):
+                app = f.load()
+                apps_profile[apps_profile.index(f)] = app
+                apps_taken[i] = app
         return apps_taken
 
     def reset(self, cmd_app=None) -> Hexstr:
@@ -134,6 +224,8 @@ class RuntimeState:
             if lchan_nr == 0:
                 continue
             del self.lchan[lchan_nr]
+        if self.content_cache:
+            self.content_cache.invalidate()
         atr = i2h(self.card.reset())
         # select MF to reset internal state and to verify card really works
         self.lchan[0].select('MF', cmd_app)
@@ -405,6 +497,43 @@ class RuntimeLchan:
         sels = self.selected_file.get_selectables()
         f = sels[name]
         data, sw = self.scc.activate_file(f.fid)
+        self.invalidate_content(f)
+        return data, sw
+
+    def deactivate_file(self):
+        """Request DEACTIVATE FILE of the currently selected file."""
+        data, sw = self.scc.deactivate_file()
+        self.invalidate_content(self.selected_file)
+        return data, sw
+
+    def invalidate_content(self, file: Optional[CardFile] = None):
+        """Forget the cached content (see RuntimeState.content_cache) of the given file (including all
+        files below it, in case of a DF) or of all files.  Must be called after modifying the card by other
+        means than the read/update methods of this class."""
+        if self.rs.content_cache:
+            self.rs.content_cache.invalidate(file)
+
+    def _read_binary_cached(self, ef: TransparentEF, length: Optional[int], offset: int, read) -> ResTuple:
+        cache = self.rs.content_cache
+        if cache is None:
+            return read()
+        data = cache.get_binary(ef, length, offset)
+        if data is not None:
+            return data, '9000'
+        data, sw = read()
+        if length is None and offset == 0 and data is not None:
+            cache.put_binary(ef, data)
+        return data, sw
+
+    def _read_record_cached(self, ef: LinFixedEF, rec_nr: int, read) -> ResTuple:
+        cache = self.rs.content_cache
+        if cache is None:
+            return read()
+        data = cache.get_record(ef, rec_nr)
+        if data is not None:
+            return data, '9000'
+        data, sw = read()
+        cache.put_record(ef, rec_nr, data)
         return data, sw
 
     def read_binary(self, length: int = None, offset: int = 0):
@@ -418,7 +547,91 @@ class RuntimeLchan:
         """
         if not isinstance(self.selected_file, TransparentEF):
             raise TypeError("Only works with TransparentEF")
-        return self.scc.read_binary(self.selected_file.fid, length, offset)
+        ef = self.selected_file
+        return self._read_binary_cached(ef, length, offset, lambda: self.scc.read_binary(ef.fid, length, offset))
+
+    def _sfi_for_ef(self, ef: CardEF) -> Optional[int]:
+        """Determine the SFI which may be used to access the given EF without selecting it."""
+        if ef.parent != self.get_cwd():
+            raise ValueError('%s is not located in the currently selected DF %s' % (ef, self.get_cwd()))
+        if not self.rs.use_sfi or ef.sfid is None:
+            return None
+        return int(str(ef.sfid))
+
+    def _sfi_for_selected(self) -> Optional[int]:
+        """Determine the SFI which may be used to access the currently selected EF (if SFI addressing
+        is enabled), so that it doesn't matter whether the card still has it selected."""
+        if not self.rs.use_sfi or self.selected_file.sfid is None:
+            return None
+        return self._sfi_for_ef(self.selected_file)
+
+    def _record_len_hint(self, ef: LinFixedEF) -> int:
+        """Record length of the given EF as known from its select response (0: unknown)."""
+        if ef != self.selected_file or not self.selected_file_fcp:
+            return 0
+        return self.selected_file_fcp.get('file_descriptor', {}).get('record_len') or 0
+
+    def read_ef_binary(self, ef: TransparentEF, length: int = None, offset: int = 0):
+        """Read [part of] a transparent EF located in the currently selected DF without changing
+        the selected file of this lchan.  If SFI addressing is enabled (RuntimeState.use_sfi)
+        and the EF has a SFI, no SELECT is sent to the card at all.
+
+        Args:
+            ef : TransparentEF [or derived class] instance
+            length : Amount of data to read (None: as much as possible)
+            offset : Offset into the file from which to read 'length' bytes
+        Returns:
+            binary data read from the file
+        """
+        if not isinstance(ef, TransparentEF):
+            raise TypeError("Only works with TransparentEF")
+        sfi = self._sfi_for_ef(ef)
+        if sfi is not None and offset <= 255:
+            return self._read_binary_cached(ef, length, offset, lambda: self.scc.read_binary_sfi(sfi, length, offset))
+        # selecting an EF by FID doesn't change the current DF, so we are still coherent
+        return self._read_binary_cached(ef, length, offset, lambda: self.scc.read_binary(ef.fid, length, offset))
+
+    def update_ef_binary(self, ef: TransparentEF, data_hex: str, offset: int = 0):
+        """Update a transparent EF located in the currently selected DF without changing the
+        selected file of this lchan.  See read_ef_binary() for the use of SFI addressing.
+
+        Args:
+            ef : TransparentEF [or derived class] instance
+            data_hex : hex string of data to be written
+            offset : Offset into the file from which to write 'data_hex'
+        """
+        if not isinstance(ef, TransparentEF):
+            raise TypeError("Only works with TransparentEF")
+        res = self._update_ef_binary(ef, data_hex, offset)
+        if self.rs.content_cache:
+            self.rs.content_cache.update_binary(ef, data_hex, offset)
+        return res
+
+    def _update_ef_binary(self, ef: TransparentEF, data_hex: str, offset: int = 0):
+        sfi = self._sfi_for_ef(ef)
+        # expanding '..' in data_hex requires the file size, which only the FCP can tell us
+        if sfi is None or offset > 255 or '.' in data_hex:
+            return self.scc.update_binary(ef.fid, data_hex, offset, conserve=self.rs.conserve_write)
+        data_current = None
+        sw = None
+        if self.rs.conserve_write:
+            try:
+                data_current, sw = self._read_binary_cached(ef, len(data_hex) // 2, offset,
+                                                            lambda: self.scc.read_binary_sfi(sfi, len(data_hex) // 2, offset))
+            except Exception:
+                # access conditions may permit UPDATE but not READ; see SimCardCommands.update_binary
+                pass
+        ranges = self.scc._write_ranges(data_hex, data_current)
+        if not ranges:
+            return None, sw
+        if offset + ranges[-1][0] > 255:
+            # not all changed ranges can be addressed via SFI: write everything from the first one
+            start = ranges[0][0] if offset + ranges[0][0] <= 255 else 0
+            ranges = [(start, len(data_hex) // 2 - start)]
+        for range_offset, range_len in ranges:
+            res = self.scc.update_binary_sfi(sfi, data_hex[range_offset*2:(range_offset+range_len)*2],
+                                             offset + range_offset)
+        return res
 
     def read_binary_dec(self) -> Tuple[dict, str]:
         """Read [part of] a transparent EF binary data and decode it.
@@ -442,7 +655,12 @@ class RuntimeLchan:
         """
         if not isinstance(self.selected_file, TransparentEF):
             raise TypeError("Only works with TransparentEF")
-        return self.scc.update_binary(self.selected_file.fid, data_hex, offset, conserve=self.rs.conserve_write)
+        if self._sfi_for_selected() is not None:
+            return self.update_ef_binary(self.selected_file, data_hex, offset)
+        res = self.scc.update_binary(self.selected_file.fid, data_hex, offset, conserve=self.rs.conserve_write)
+        if self.rs.content_cache:
+            self.rs.content_cache.update_binary(self.selected_file, data_hex, offset)
+        return res
 
     def update_binary_dec(self, data: dict):
         """Update transparent EF from abstract data. Encodes the data to binary and
@@ -464,8 +682,93 @@ class RuntimeLchan:
         """
         if not isinstance(self.selected_file, LinFixedEF):
             raise TypeError("Only works with Linear Fixed EF")
+        ef = self.selected_file
+        if self._sfi_for_selected() is not None:
+            return self.read_ef_record(ef, rec_nr)
         # returns a string of hex nibbles
-        return self.scc.read_record(self.selected_file.fid, rec_nr)
+        return self._read_record_cached(ef, rec_nr, lambda: self.scc.read_record(ef.fid, rec_nr))
+
+    def read_ef_record(self, ef: LinFixedEF, rec_nr: int):
+        """Read a record of a linear fixed / cyclic EF located in the currently selected DF without
+        changing the selected file of this lchan.  See read_ef_binary() for the use of SFI
+        addressing.
+
+        Args:
+            ef : LinFixedEF [or derived class] instance
+            rec_nr : Record number to read
+        Returns:
+            hex string of binary data contained in record
+        """
+        if not isinstance(ef, LinFixedEF):
+            raise TypeError("Only works with Linear Fixed EF")
+        sfi = self._sfi_for_ef(ef)
+        if sfi is not None:
+            rec_len = self._record_len_hint(ef)
+            return self._read_record_cached(ef, rec_nr, lambda: self.scc.read_record_sfi(sfi, rec_nr, rec_len))
+        return self._read_record_cached(ef, rec_nr, lambda: self.scc.read_record(ef.fid, rec_nr))
+
+    def read_ef_records(self, ef: LinFixedEF, rec_nrs: Optional[range] = None,
+                        stop_on_empty: bool = False) -> Generator[Tuple[int, Hexstr], None, None]:
+        """Read a range of records of a linear fixed / cyclic EF located in the currently selected DF
+        without changing the selected file of this lchan.  See read_ef_binary() for the use of SFI
+        addressing; when reading all records via SFI, the card tells us where the file ends.
+
+        Args:
+            ef : LinFixedEF [or derived class] instance
+            rec_nrs : Range of record numbers to read (None: all records)
+            stop_on_empty : Stop at the first unused record (all bytes FF)
+        Returns:
+            generator of (record number, hex string of binary data contained in record) tuples
+        """
+        if not isinstance(ef, LinFixedEF):
+            raise TypeError("Only works with Linear Fixed EF")
+        return self._read_records(ef, self._sfi_for_ef(ef), rec_nrs, False, stop_on_empty)
+
+    def read_records(self, rec_nrs: Optional[range] = None, next_mode: bool = False,
+                     stop_on_empty: bool = False) -> Generator[Tuple[int, Hexstr], None, None]:
+        """Read a range of records of the currently selected linear fixed / cyclic EF.  The EF is
+        selected and its record length determined only once (or, if SFI addressing is enabled, the
+        records are read using SFI addressing).
+
+        Args:
+            rec_nrs : Range of record numbers to read (None: all records)
+            next_mode : Use the NEXT mode of READ RECORD (requires reading from record 1)
+            stop_on_empty : Stop at the first unused record (all bytes FF)
+        Returns:
+            generator of (record number, hex string of binary data contained in record) tuples
+        """
+        if not isinstance(self.selected_file, LinFixedEF):
+            raise TypeError("Only works with Linear Fixed EF")
+        if rec_nrs is None and self.selected_file_num_of_rec():
+            rec_nrs = range(1, 1 + self.selected_file_num_of_rec())
+        # the record pointer used by the NEXT mode is only reset by actually selecting the EF
+        sfi = None if next_mode else self._sfi_for_selected()
+        return self._read_records(self.selected_file, sfi, rec_nrs, next_mode, stop_on_empty)
+
+    def _read_records(self, ef: LinFixedEF, sfi: Optional[int], rec_nrs: Optional[range], next_mode: bool,
+                      stop_on_empty: bool) -> Generator[Tuple[int, Hexstr], None, None]:
+        if rec_nrs is not None and rec_nrs.step != 1:
+            raise ValueError('Only contiguous ranges of records can be read')
+        cache = self.rs.content_cache
+        if cache and rec_nrs is not None:
+            cached = [cache.get_record(ef, rec_nr) for rec_nr in rec_nrs]
+            if None not in cached:
+                for rec_nr, data in zip(rec_nrs, cached):
+                    if stop_on_empty and data == 'ff' * (len(data) // 2):
+                        return
+                    yield rec_nr, data
+                return
+        if sfi is not None:
+            first, count = (1, None) if rec_nrs is None else (rec_nrs.start, len(rec_nrs))
+            recs = self.scc.read_records_sfi(sfi, first, count, self._record_len_hint(ef), stop_on_empty)
+        elif rec_nrs is None:
+            recs = self.scc.read_records(ef.fid, next_mode=next_mode, stop_on_empty=stop_on_empty)
+        else:
+            recs = self.scc.read_records(ef.fid, rec_nrs.start, len(rec_nrs), next_mode, stop_on_empty)
+        for rec_nr, data in recs:
+            if cache:
+                cache.put_record(ef, rec_nr, data)
+            yield rec_nr, data
 
     def read_record_dec(self, rec_nr: int = 0) -> Tuple[dict, str]:
         """Read a record and decode it to abstract data.
@@ -487,9 +790,15 @@ class RuntimeLchan:
         """
         if not isinstance(self.selected_file, LinFixedEF):
             raise TypeError("Only works with Linear Fixed EF")
-        return self.scc.update_record(self.selected_file.fid, rec_nr, data_hex,
+        res = self.scc.update_record(self.selected_file.fid, rec_nr, data_hex,
 					       conserve=self.rs.conserve_write,
 					       leftpad=self.selected_file.leftpad)
+        if self.rs.content_cache:
+            rec_len = None
+            if self.selected_file_fcp:
+                rec_len = self.selected_file_fcp.get('file_descriptor', {}).get('record_len')
+            self.rs.content_cache.update_record(self.selected_file, rec_nr, data_hex, rec_len)
+        return res
 
     def update_record_dec(self, rec_nr: int, data: dict):
         """Update a record with given abstract data.  Will encode abstract to binary data
@@ -16,7 +16,7 @@
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
 import abc
-from pySim.utils import b2h, h2b, ResTuple, Hexstr
+from pySim.utils import b2h, h2b, ResTuple, ResTupleBin, Hexstr
 
 class SecureChannel(abc.ABC):
     @abc.abstractmethod
@@ -35,3 +35,10 @@ class SecureChannel(abc.ABC):
         res, sw = send_fn(pdu_wrapped, *args, **kwargs)
         res_unwrapped = b2h(self.unwrap_rsp_apdu(h2b(sw), h2b(res)))
         return res_unwrapped, sw
+
+    def send_apdu_wrapper_bin(self, send_fn: callable, pdu: bytes, *args, **kwargs) -> ResTupleBin:
+        """Wrapper function to wrap command APDU and unwrap repsonse APDU around send_apdu_bin callable."""
+        pdu_wrapped = self.wrap_cmd_apdu(pdu)
+        res, sw = send_fn(pdu_wrapped, *args, **kwargs)
+        res_unwrapped = self.unwrap_rsp_apdu(sw, res)
+        return res_unwrapped, sw
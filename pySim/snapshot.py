@@ -0,0 +1,318 @@
+# -*- coding: utf-8 -*-
+
+""" pySim: compact binary snapshots of the file system of a card.
+
+A snapshot records the raw FCP and the raw content of every file of a card, so
+that two cards (or one card at two points in time) can be compared without
+decoding or re-parsing anything.  The file is written in one pass: a header
+with some JSON meta-data, followed by the FCP and content blobs of all files in
+the order they were visited, followed by an index and a fixed-size trailer
+pointing at the index.  For reading, the file is memory-mapped and only the
+index is parsed; blobs are accessed as memoryview slices on demand.
+
+Each index entry carries a digest of the FCP and of the content of the file, so
+that comparing two snapshots of identical cards only touches the two indices.
+
+ File layout (all integers big endian)::
+
+  header:  magic 'pySIMsnp', u16 version, u16 reserved, u32 meta_len, meta (JSON)
+  blobs:   fcp / content of each file
+  index:   one entry per file, see _ENTRY
+  trailer: u64 index offset, u32 number of entries, magic 'pySIMidx'
+"""
+
+#
+# (C) 2024 by Sysmocom s.f.m.c. GmbH
+# All Rights Reserved
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+import json
+import mmap
+import struct
+import hashlib
+import fnmatch
+from typing import Optional, List, Dict, Generator, NamedTuple, BinaryIO
+
+from pySim.utils import h2b, changed_ranges
+from pySim.filesystem import CardDF
+
+MAGIC = b'pySIMsnp'
+INDEX_MAGIC = b'pySIMidx'
+VERSION = 1
+
+STRUCTURES = ['df', 'transparent', 'linear_fixed', 'cyclic', 'ber_tlv']
+
+_HEADER = struct.Struct('>8sHHI')
+# path_len, fid_path_len, structure, error, rec_len, fcp_off, fcp_len, data_off, data_len,
+# fcp digest, data digest
+_ENTRY = struct.Struct('>HHBBHQIQI16s16s')
+_TRAILER = struct.Struct('>QI8s')
+
+
+def _digest(data: bytes) -> bytes:
+    return hashlib.blake2b(data, digest_size=16).digest()
+
+
+class SnapshotWriter:
+    """Write a snapshot to a binary file object in one pass.  The index is written by close(),
+    so the resulting file is only valid after that."""
+
+    def __init__(self, f: BinaryIO, meta: Optional[dict] = None):
+        self._f = f
+        self._index = []
+        meta_enc = json.dumps(meta or {}).encode('utf-8')
+        self._write(_HEADER.pack(MAGIC, VERSION, 0, len(meta_enc)) + meta_enc)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def _write(self, data: bytes) -> int:
+        """Write data, returning its offset in the file."""
+        offset = self._f.tell()
+        self._f.write(data)
+        return offset
+
+    def _add(self, path: str, fid_path: str, structure: str, fcp: bytes, data: bytes,
+             rec_len: int, error: bool):
+        path_enc = path.encode('utf-8')
+        fid_path_enc = fid_path.encode('utf-8')
+        fcp_off = self._write(fcp)
+        data_off = self._write(data)
+        self._index.append(_ENTRY.pack(len(path_enc), len(fid_path_enc), STRUCTURES.index(structure),
+                                       int(error), rec_len, fcp_off, len(fcp), data_off, len(data),
+                                       _digest(fcp), _digest(data)) + path_enc + fid_path_enc)
+
+    def add(self, path: str, fid_path: str, structure: str, fcp: bytes, data: bytes = b'', rec_len: int = 0):
+        """Add a file to the snapshot.
+
+        Args:
+            path : fully qualified path of the file (by name), used as key
+            fid_path : fully qualified path of the file (by FID)
+            structure : file structure (see STRUCTURES)
+            fcp : raw FCP returned when selecting the file
+            data : raw content of the file; for record oriented files all records concatenated
+            rec_len : record length of linear fixed / cyclic files
+        """
+        self._add(path, fid_path, structure, fcp, data, rec_len, False)
+
+    def add_error(self, path: str, fid_path: str, message: str):
+        """Record that a file could not be selected or read."""
+        self._add(path, fid_path, 'df', b'', message.encode('utf-8'), 0, True)
+
+    def add_selected(self, lchan):
+        """Add the file currently selected on the given RuntimeLchan, reading its content
+        from the card."""
+        f = lchan.selected_file
+        path = f.fully_qualified_path_str(True)
+        fid_path = f.fully_qualified_path_str(False)
+        fcp = h2b(lchan.selected_file_fcp_hex or '')
+        if isinstance(f, CardDF):
+            self.add(path, fid_path, 'df', fcp)
+            return
+        structure = lchan.selected_file_structure()
+        rec_len = 0
+        if structure == 'transparent':
+            data = h2b(lchan.read_binary()[0])
+        elif structure in ('linear_fixed', 'cyclic'):
+            records = [h2b(d) for r, d in lchan.read_records()]
+            rec_len = len(records[0]) if records else 0
+            data = b''.join(records)
+        elif structure == 'ber_tlv':
+            data = b''.join(h2b(lchan.retrieve_data(t)[0]) for t in lchan.retrieve_tags())
+        else:
+            raise ValueError('Unsupported structure "%s" of file "%s"' % (structure, path))
+        self.add(path, fid_path, structure, fcp, data, rec_len)
+
+    def close(self):
+        """Write index and trailer.  The underlying file object is not closed."""
+        if self._index is None:
+            return
+        index_off = self._write(b''.join(self._index))
+        self._write(_TRAILER.pack(index_off, len(self._index), INDEX_MAGIC))
+        self._index = None
+
+
+class SnapshotEntry:
+    """A file recorded in a snapshot.  FCP and content are memoryview slices of the snapshot."""
+    __slots__ = ['path', 'fid_path', 'structure', 'error', 'rec_len', 'fcp', 'data', 'fcp_digest',
+                 'data_digest']
+
+    def __init__(self, path: str, fid_path: str, structure: str, error: bool, rec_len: int,
+                 fcp: memoryview, data: memoryview, fcp_digest: bytes, data_digest: bytes):
+        self.path = path
+        self.fid_path = fid_path
+        self.structure = structure
+        self.error = error
+        self.rec_len = rec_len
+        self.fcp = fcp
+        self.data = data
+        self.fcp_digest = fcp_digest
+        self.data_digest = data_digest
+
+    def __str__(self):
+        return self.path
+
+    def records(self) -> List[bytes]:
+        """Content of a linear fixed / cyclic file, split into records."""
+        if not self.rec_len:
+            return []
+        return [bytes(self.data[i:i+self.rec_len]) for i in range(0, len(self.data), self.rec_len)]
+
+
+class Snapshot:
+    """Read access to a snapshot held in a buffer (bytes, mmap, ...).  Use Snapshot.open() to
+    memory-map a snapshot file."""
+
+    def __init__(self, buf, name: Optional[str] = None):
+        self.name = name
+        self._buf = memoryview(buf)
+        self._mmap = None
+        self.meta = {}
+        self.entries: Dict[str, SnapshotEntry] = {}
+        try:
+            self._parse()
+        except Exception:
+            self.close()
+            raise
+
+    def _parse(self):
+        name = self.name
+        if len(self._buf) < _HEADER.size + _TRAILER.size:
+            raise ValueError('%s: not a pySim snapshot (too short)' % name)
+        magic, version, _, meta_len = _HEADER.unpack_from(self._buf)
+        if magic != MAGIC:
+            raise ValueError('%s: not a pySim snapshot' % name)
+        if version != VERSION:
+            raise ValueError('%s: unsupported snapshot version %u' % (name, version))
+        index_off, count, magic = _TRAILER.unpack_from(self._buf, len(self._buf) - _TRAILER.size)
+        if magic != INDEX_MAGIC:
+            raise ValueError('%s: incomplete pySim snapshot (no index)' % name)
+        self.meta = json.loads(bytes(self._buf[_HEADER.size:_HEADER.size+meta_len]))
+        offset = index_off
+        for _ in range(count):
+            (path_len, fid_path_len, structure, error, rec_len, fcp_off, fcp_len, data_off, data_len,
+             fcp_digest, data_digest) = _ENTRY.unpack_from(self._buf, offset)
+            offset += _ENTRY.size
+            path = str(self._buf[offset:offset+path_len], 'utf-8')
+            offset += path_len
+            fid_path = str(self._buf[offset:offset+fid_path_len], 'utf-8')
+            offset += fid_path_len
+            self.entries[path] = SnapshotEntry(path, fid_path, STRUCTURES[structure], bool(error), rec_len,
+                                               self._buf[fcp_off:fcp_off+fcp_len],
+                                               self._buf[data_off:data_off+data_len],
+                                               fcp_digest, data_digest)
+
+    @classmethod
+    def open(cls, filename: str) -> 'Snapshot':
+        """Memory-map a snapshot file."""
+        with open(filename, 'rb') as f:
+            mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            snap = cls(mm, filename)
+        except Exception:
+            mm.close()
+            raise
+        snap._mmap = mm
+        return snap
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def close(self):
+        """Release the buffer.  Entries of the snapshot must no longer be accessed."""
+        for e in self.entries.values():
+            e.fcp.release()
+            e.data.release()
+        self.entries = {}
+        self._buf.release()
+        if self._mmap:
+            self._mmap.close()
+            self._mmap = None
+
+
+class SnapshotDiff(NamedTuple):
+    """A difference between two snapshots.  kind is one of 'removed', 'added', 'error', 'structure',
+    'fcp' or 'content'."""
+    path: str
+    kind: str
+    detail: str = ''
+
+    def __str__(self):
+        if self.detail:
+            return '%-9s %s: %s' % (self.kind, self.path, self.detail)
+        return '%-9s %s' % (self.kind, self.path)
+
+
+def _ranges_str(ranges: List[tuple]) -> str:
+    return ', '.join('%u+%u' % r for r in ranges)
+
+
+def _diff_content(a: SnapshotEntry, b: SnapshotEntry) -> str:
+    if len(a.data) != len(b.data) or a.rec_len != b.rec_len:
+        return 'size %u -> %u' % (len(a.data), len(b.data))
+    if a.rec_len:
+        recs = [str(i + 1) for i, (ra, rb) in enumerate(zip(a.records(), b.records())) if ra != rb]
+        return 'records %s' % ', '.join(recs)
+    return 'bytes %s' % _ranges_str(changed_ranges(a.data, b.data))
+
+
+def diff_snapshots(a: Snapshot, b: Snapshot, ignore: Optional[List[str]] = None,
+                   compare_fcp: bool = True) -> Generator[SnapshotDiff, None, None]:
+    """Compare two snapshots, yielding the differences of b relative to a.
+
+    Args:
+        a : reference snapshot
+        b : snapshot to compare against the reference
+        ignore : list of glob patterns of file paths (by name or by FID, case-insensitive) to skip
+        compare_fcp : also report differences in the FCP of files
+    """
+    ignore = [p.lower() for p in ignore or []]
+    def ignored(e: SnapshotEntry) -> bool:
+        path, fid_path = e.path.lower(), e.fid_path.lower()
+        return any(fnmatch.fnmatchcase(path, p) or fnmatch.fnmatchcase(fid_path, p) for p in ignore)
+
+    for path, ea in a.entries.items():
+        eb = b.entries.get(path)
+        if eb is None:
+            if not ignored(ea):
+                yield SnapshotDiff(path, 'removed')
+            continue
+        if ea.data_digest == eb.data_digest and ea.error == eb.error and \
+           (not compare_fcp or ea.fcp_digest == eb.fcp_digest):
+            continue
+        if ignored(ea):
+            continue
+        if ea.error or eb.error:
+            if ea.error != eb.error or ea.data != eb.data:
+                yield SnapshotDiff(path, 'error', str(eb.data if eb.error else ea.data, 'utf-8'))
+            continue
+        if ea.structure != eb.structure:
+            yield SnapshotDiff(path, 'structure', '%s -> %s' % (ea.structure, eb.structure))
+            continue
+        if compare_fcp and ea.fcp != eb.fcp:
+            yield SnapshotDiff(path, 'fcp', _ranges_str(changed_ranges(ea.fcp, eb.fcp))
+                               if len(ea.fcp) == len(eb.fcp) else 'size %u -> %u' % (len(ea.fcp), len(eb.fcp)))
+        if ea.data != eb.data:
+            yield SnapshotDiff(path, 'content', _diff_content(ea, eb))
+    for path, eb in b.entries.items():
+        if path not in a.entries and not ignored(eb):
+            yield SnapshotDiff(path, 'added')
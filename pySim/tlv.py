@@ -19,9 +19,11 @@
 import inspect
 import abc
 import re
-from typing import List, Tuple
+import functools
+from typing import List, Tuple, Optional
 
 from pySim.utils import bertlv_encode_len, bertlv_parse_len, bertlv_encode_tag, bertlv_parse_tag
+from pySim.utils import bertlv_parse_tag_raw_at, bertlv_parse_len_at
 from pySim.utils import comprehensiontlv_encode_tag, comprehensiontlv_parse_tag
 from pySim.utils import bertlv_parse_tag_raw, comprehensiontlv_parse_tag_raw
 from pySim.utils import dgi_parse_tag_raw, dgi_parse_len, dgi_encode_tag, dgi_encode_len
@@ -65,8 +67,17 @@ class TlvCollectionMeta(abc.ABCMeta):
         x = super().__new__(mcs, name, bases, namespace)
         # this becomes a _class_ variable, not an instance variable
         x.possible_nested = namespace.get('nested', kwargs.get('nested', None))
+        # dispatch tables are computed once here, rather than for each instance
+        x._members_by_tag, x._members_by_name = TlvCollectionMeta.build_dispatch_tables(x.possible_nested or [])
         return x
 
+    @staticmethod
+    def build_dispatch_tables(members) -> Tuple[dict, dict]:
+        """Return dicts mapping tags and (snake case) names to the respective member classes."""
+        members_by_tag = {m.tag: m for m in members}
+        members_by_name = {camel_to_snake(m.__name__): m for m in members}
+        return members_by_tag, members_by_name
+
 
 class Transcodable(abc.ABC):
     _construct = None
@@ -207,6 +218,20 @@ class TLV_IE(IE):
     def _parse_len(cls, do: bytes) -> Tuple[int, bytes]:
         """Obtain the length encoded at the start of the bytes provided by the user."""
 
+    @classmethod
+    def _parse_tag_raw_at(cls, do: bytes, offset: int) -> Tuple[Optional[int], int]:
+        """Obtain the raw TAG at the given offset of the bytes provided by the user; returns the
+        tag and the offset after it.  Derived classes may override this to avoid copying."""
+        tag, remainder = cls._parse_tag_raw(do[offset:])
+        return tag, len(do) - len(remainder)
+
+    @classmethod
+    def _parse_len_at(cls, do: bytes, offset: int) -> Tuple[int, int]:
+        """Obtain the length encoded at the given offset of the bytes provided by the user; returns
+        the length and the offset after it.  Derived classes may override this to avoid copying."""
+        length, remainder = cls._parse_len(do[offset:])
+        return length, len(do) - len(remainder)
+
     @abc.abstractmethod
     def _encode_tag(self) -> bytes:
         """Encode the tag part. Must be provided by derived (TLV format specific) class."""
@@ -227,14 +252,14 @@ class TLV_IE(IE):
     def from_tlv(self, do: bytes, context: dict = {}):
         if len(do) == 0:
             return {}, b''
-        (rawtag, remainder) = self.__class__._parse_tag_raw(do)
+        (rawtag, offset) = self.__class__._parse_tag_raw_at(do, 0)
         if rawtag:
             if rawtag != self._compute_tag():
                 raise ValueError("%s: Encountered tag %s doesn't match our supported tag %s" %
                                  (self, rawtag, self.tag))
-            (length, remainder) = self.__class__._parse_len(remainder)
-            value = remainder[:length]
-            remainder = remainder[length:]
+            (length, offset) = self.__class__._parse_len_at(do, offset)
+            value = do[offset:offset+length]
+            remainder = do[offset+length:]
         else:
             value = do
             remainder = b''
@@ -257,6 +282,14 @@ class BER_TLV_IE(TLV_IE):
     def _parse_len(cls, do: bytes) -> Tuple[int, bytes]:
         return bertlv_parse_len(do)
 
+    @classmethod
+    def _parse_tag_raw_at(cls, do: bytes, offset: int) -> Tuple[Optional[int], int]:
+        return bertlv_parse_tag_raw_at(do, offset)
+
+    @classmethod
+    def _parse_len_at(cls, do: bytes, offset: int) -> Tuple[int, int]:
+        return bertlv_parse_len_at(do, offset)
+
     def _encode_tag(self) -> bytes:
         return bertlv_encode_tag(self._compute_tag())
 
@@ -283,6 +316,10 @@ class COMPR_TLV_IE(TLV_IE):
     def _parse_len(cls, do: bytes) -> Tuple[int, bytes]:
         return bertlv_parse_len(do)
 
+    @classmethod
+    def _parse_len_at(cls, do: bytes, offset: int) -> Tuple[int, int]:
+        return bertlv_parse_len_at(do, offset)
+
     def _encode_tag(self) -> bytes:
         return comprehensiontlv_encode_tag(self._compute_tag())
 
@@ -308,6 +345,28 @@ class DGI_TLV_IE(TLV_IE):
         return dgi_encode_len(len(val))
 
 
+def _unknown_from_bytes(self, do: bytes):
+    return {'raw': do.hex()}
+
+def _unknown_to_bytes(self) -> bytes:
+    return bytes.fromhex(self.decoded['raw'])
+
+@functools.lru_cache(maxsize=256)
+def unknown_tag_class(base: type, tag: int) -> type:
+    """Return a TLV_IE sub-class of 'base' representing an unknown 'tag', whose value is
+    simply decoded to/encoded from a hex string.  The classes are cached, so that decoding
+    the same unknown tags over and over doesn't create new classes each time; statistics
+    about this can be obtained via unknown_tag_class_stats()."""
+    name = 'unknown_%s_%X' % (base.__name__, tag)
+    return type(name, (base,), {'tag': tag, 'possible_nested': [], 'nested_collection_cls': None,
+                                '_from_bytes': _unknown_from_bytes, '_to_bytes': _unknown_to_bytes})
+
+def unknown_tag_class_stats() -> dict:
+    """Return the cache statistics of unknown_tag_class() as dict with the keys 'hits',
+    'misses', 'maxsize' and 'currsize'."""
+    return unknown_tag_class.cache_info()._asdict() # pylint: disable=no-value-for-parameter
+
+
 class TLV_IE_Collection(metaclass=TlvCollectionMeta):
     # we specify the metaclass so any downstream subclasses will automatically use it
     """A TLV_IE_Collection consists of multiple TLV_IE classes identified by their tags.
@@ -315,15 +374,20 @@ class TLV_IE_Collection(metaclass=TlvCollectionMeta):
     of each DO."""
     # this is overridden by the TlvCollectionMeta metaclass, if it is used to create subclasses
     possible_nested = []
+    _members_by_tag = {}
+    _members_by_name = {}
 
     def __init__(self, desc=None, **kwargs):
         self.desc = desc
         #print("possible_nested: ", self.possible_nested)
-        self.members = kwargs.get('nested', self.possible_nested)
-        self.members_by_tag = {}
-        self.members_by_name = {}
-        self.members_by_tag = {m.tag: m for m in self.members}
-        self.members_by_name = {camel_to_snake(m.__name__): m for m in self.members}
+        if 'nested' in kwargs:
+            self.members = kwargs['nested']
+            self.members_by_tag, self.members_by_name = TlvCollectionMeta.build_dispatch_tables(self.members)
+        else:
+            # share the (read-only) dispatch tables computed at class creation time
+            self.members = self.possible_nested
+            self.members_by_tag = self._members_by_tag
+            self.members_by_name = self._members_by_name
         # if we are a constructed IE, [ordered] list of actual child-IE instances
         self.children = kwargs.get('children', [])
         self.encoded = None
@@ -358,31 +422,31 @@ class TLV_IE_Collection(metaclass=TlvCollectionMeta):
         self.encoded = binary
         # list of instances of TLV_IE collection member classes appearing in the data
         res = []
-        remainder = binary
+        offset = 0
         first = next(iter(self.members_by_tag.values()))
-        # iterate until no binary trailer is left
-        while len(remainder):
+        # iterate until no binary trailer is left; we only ever slice out the current TLV
+        # instead of the remainder, so the overall parsing effort stays linear
+        while offset < len(binary):
             context['siblings'] = res
-            # obtain the tag at the start of the remainder
-            tag, _r = first._parse_tag_raw(remainder)
+            # obtain the tag + length at the current offset
+            tag, value_offset = first._parse_tag_raw_at(binary, offset)
             if tag is None:
                 break
+            length, value_offset = first._parse_len_at(binary, value_offset)
+            tlv = binary[offset:value_offset+length]
+            offset = value_offset + length
             if tag in self.members_by_tag:
                 cls = self.members_by_tag[tag]
                 # create an instance and parse accordingly
                 inst = cls()
-                _dec, remainder = inst.from_tlv(remainder, context=context)
+                inst.from_tlv(tlv, context=context)
                 res.append(inst)
             else:
-                # unknown tag; create the related class on-the-fly using the same base class
-                name = 'unknown_%s_%X' % (first.__base__.__name__, tag)
-                cls = type(name, (first.__base__,), {'tag': tag, 'possible_nested': [],
-                                                     'nested_collection_cls': None})
-                cls._from_bytes = lambda s, a: {'raw': a.hex()}
-                cls._to_bytes = lambda s: bytes.fromhex(s.decoded['raw'])
+                # unknown tag; use a class created on-the-fly using the same base class
+                cls = unknown_tag_class(first.__base__, tag)
                 # create an instance and parse accordingly
                 inst = cls()
-                _dec, remainder = inst.from_tlv(remainder, context=context)
+                inst.from_tlv(tlv, context=context)
                 res.append(inst)
         self.children = res
         return res
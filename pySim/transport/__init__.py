@@ -5,13 +5,18 @@
 
 import os
 import abc
+import time
+import logging
 import argparse
-from typing import Optional, Tuple
+import collections
+from typing import Optional, Tuple, List
 from construct import Construct
 
 from pySim.exceptions import *
-from pySim.utils import sw_match, b2h, h2b, i2h, Hexstr, SwHexstr, SwMatchstr, ResTuple
-from pySim.cat import ProactiveCommand, CommandDetails, DeviceIdentities, Result
+from pySim.utils import sw_match, b2h, h2b, i2h, Hexstr, SwHexstr, SwMatchstr, ResTuple, ResTupleBin, restuple_b2h
+from pySim.cat import ProactiveCommand
+
+logger = logging.getLogger(__name__)
 
 #
 # Copyright (C) 2009-2010  Sylvain Munaut <tnt@246tNt.com>
@@ -32,6 +37,28 @@ from pySim.cat import ProactiveCommand, CommandDetails, DeviceIdentities, Result
 #
 
 
+# Instructions of commands which (may) return response data, but are sent by pySim as case 3
+# commands (i.e. without Le), as is common in T=0 where response data is retrieved via GET RESPONSE.
+# SELECT, RUN GSM ALGORITHM/AUTHENTICATE, RETRIEVE DATA, STORE DATA, ENVELOPE, INCREASE
+CASE4_INS = (0xa4, 0x88, 0x89, 0xcb, 0xe2, 0xc2, 0x32)
+
+def case3_to_case4(pdu: bytes) -> bytes:
+    """Append Le (all available data) to a command APDU that is expected to return response
+    data but was formatted without Le.  This is required with T=1, where response data is not
+    retrieved via GET RESPONSE."""
+    if len(pdu) <= 5 or pdu[1] not in CASE4_INS:
+        return pdu
+    # SELECT without response data
+    if pdu[1] == 0xa4 and pdu[3] & 0x0c == 0x0c:
+        return pdu
+    if pdu[4] == 0 and len(pdu) > 7:
+        # extended Lc: Le is two bytes
+        if len(pdu) == 7 + ((pdu[5] << 8) | pdu[6]):
+            return pdu + b'\x00\x00'
+    elif len(pdu) == 5 + pdu[4]:
+        return pdu + b'\x00'
+    return pdu
+
 class ApduTracer:
     def trace_command(self, cmd):
         pass
@@ -56,24 +83,121 @@ class ProactiveHandler(abc.ABC):
         """Default handler for not otherwise handled proactive commands."""
         raise NotImplementedError('No handler method for %s' % pcmd.decoded)
 
-
+    def receive_fetch_batch(self, pcmds: List[Tuple[ProactiveCommand, Hexstr]]):
+        """Handle a batch of proactive commands (see ProactiveSession).  Handlers which can process
+        several commands more efficiently at once may override this."""
+        for pcmd, parsed in pcmds:
+            self.receive_fetch_raw(pcmd, parsed)
+
+def proactive_command_details(fetch_data: bytes) -> bytes:
+    """Return the (encoded) Command Details COMPREHENSION-TLV of a proactive command, without decoding
+    the entire command."""
+    if len(fetch_data) < 2 or fetch_data[0] != 0xd0:
+        raise ValueError('Not a proactive command: %s' % b2h(fetch_data))
+    offset = 2
+    end = offset + fetch_data[1]
+    if fetch_data[1] == 0x81:
+        offset = 3
+        end = offset + fetch_data[2]
+    while offset < end:
+        start = offset
+        tag = fetch_data[offset]
+        # TS 101 220 Section 7.1.1: three byte tags start with 0x7F
+        offset += 3 if tag == 0x7f else 1
+        length = fetch_data[offset]
+        if length == 0x81:
+            length = fetch_data[offset + 1]
+            offset += 1
+        offset += 1 + length
+        if tag & 0x7f == 0x01:
+            return bytes(fetch_data[start:offset])
+    raise ValueError('Proactive command without Command Details: %s' % b2h(fetch_data))
+
+class ProactiveSession:
+    """Processing of the proactive commands a card has pending (SW 91xx), as per TS 102 221 Section
+    7.4.2.  Each proactive command returned by FETCH is acknowledged right away with a TERMINAL
+    RESPONSE (echoing its Command Details), so that the card can continue with the next one.  The
+    commands are queued and handed to the (optional) ProactiveHandler, either one by one (batch_size=1)
+    or in batches of up to batch_size commands; any remainder is handed over via flush() once the
+    card has no more proactive commands pending.  Without a handler, commands are not decoded at all
+    and are answered with 'command beyond terminal capability'."""
+
+    def __init__(self, handler: Optional[ProactiveHandler] = None, batch_size: int = 1):
+        self.handler = handler
+        self.batch_size = batch_size
+        self.pending = collections.deque()
+
+    def terminal_response(self, fetch_data: bytes) -> bytes:
+        """Queue a proactive command (the response data of FETCH) and return the TERMINAL RESPONSE
+        command APDU to be sent back to the card."""
+        command_details = proactive_command_details(fetch_data)
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("FETCH: %s (type of command %02x)", b2h(fetch_data), command_details[-2])
+        if self.handler:
+            self.pending.append(fetch_data)
+            if len(self.pending) >= self.batch_size:
+                self.flush()
+            result = b'\x83\x01\x00'  # performed successfully
+        else:
+            result = b'\x83\x01\x30'  # command beyond terminal capability
+        # Structure as per TS 102 223 Section 6.8: the Command Details are echoed from the command that
+        # has been processed, the Device Identities are fixed (terminal -> UICC).
+        tail = command_details + b'\x82\x02\x82\x81' + result
+        # Testing hint: In contrast to the content of tail (which does not influence the behavior of an
+        # SJA2 that sent an SMS), this part is positively essential to get the SJA2 to provide the later
+        # parts of a multipart SMS in response to an OTA RFM command.
+        return b'\x80\x14\x00\x00' + len(tail).to_bytes(1, 'big') + tail
+
+    def flush(self):
+        """Decode all queued proactive commands and hand them to the handler."""
+        if not self.pending:
+            return
+        pcmds = []
+        while self.pending:
+            pcmd = ProactiveCommand()
+            parsed = pcmd.from_tlv(self.pending.popleft())
+            pcmds.append((pcmd, parsed))
+        self.handler.receive_fetch_batch(pcmds)
 
 class LinkBase(abc.ABC):
     """Base class for link/transport to card."""
 
     def __init__(self, sw_interpreter=None, apdu_tracer: Optional[ApduTracer]=None,
-                 proactive_handler: Optional[ProactiveHandler]=None):
+                 proactive_handler: Optional[ProactiveHandler]=None, proactive_batch_size: int = 1):
         self.sw_interpreter = sw_interpreter
         self.apdu_tracer = apdu_tracer
-        self.proactive_handler = proactive_handler
+        self.proactive_session = ProactiveSession(proactive_handler, batch_size=proactive_batch_size)
+        # optional ApduMetrics collector (see pySim.transport.metrics)
+        self.metrics = None
+        # transmission protocol (T=0 or T=1) in use; drivers supporting T=1 update this on connect
+        self.protocol = 0
+        if type(self)._send_apdu_raw is LinkBase._send_apdu_raw and \
+           type(self)._send_apdu_raw_bin is LinkBase._send_apdu_raw_bin:
+            raise TypeError("%s must implement _send_apdu_raw or _send_apdu_raw_bin" % type(self).__name__)
 
     @abc.abstractmethod
     def __str__(self) -> str:
         """Implementation specific method for printing an information to identify the device."""
 
-    @abc.abstractmethod
+    @property
+    def proactive_handler(self) -> Optional[ProactiveHandler]:
+        return self.proactive_session.handler
+
+    @proactive_handler.setter
+    def proactive_handler(self, handler: Optional[ProactiveHandler]):
+        self.proactive_session.handler = handler
+
     def _send_apdu_raw(self, pdu: Hexstr) -> ResTuple:
-        """Implementation specific method for sending the PDU."""
+        """Implementation specific method for sending the PDU (hex-string variant).  Drivers must
+        implement at least one of _send_apdu_raw or _send_apdu_raw_bin."""
+        return restuple_b2h(self._send_apdu_raw_bin(h2b(pdu)))
+
+    def _send_apdu_raw_bin(self, pdu: bytes) -> ResTupleBin:
+        """Implementation specific method for sending the PDU (binary variant).  Drivers which
+        natively operate on bytes should override this to avoid any hex-string conversion."""
+        (data, sw) = self._send_apdu_raw(b2h(pdu))
+        return (bytes.fromhex(data) if data is not None else None,
+                bytes.fromhex(sw) if sw is not None else None)
 
     def set_sw_interpreter(self, interp):
         """Set an (optional) status word interpreter."""
@@ -103,25 +227,31 @@ class LinkBase(abc.ABC):
         """Resets the card (power down/up)
         """
 
-    def send_apdu_raw(self, pdu: Hexstr) -> ResTuple:
+    def send_apdu_raw_bin(self, pdu: bytes) -> ResTupleBin:
         """Sends an APDU with minimal processing
 
         Args:
-           pdu : string of hexadecimal characters (ex. "A0A40000023F00")
+           pdu : bytes of the command APDU (ex. A0 A4 00 00 02 3F 00)
         Returns:
            tuple(data, sw), where
-                        data : string (in hex) of returned data (ex. "074F4EFFFF")
-                        sw   : string (in hex) of status word (ex. "9000")
+                        data : bytes of returned data
+                        sw   : bytes of status word (ex. 90 00)
         """
         if self.apdu_tracer:
-            self.apdu_tracer.trace_command(pdu)
-        (data, sw) = self._send_apdu_raw(pdu)
+            self.apdu_tracer.trace_command(b2h(pdu))
+        if self.metrics:
+            t_start = time.perf_counter()
+            (data, sw) = self._send_apdu_raw_bin(pdu)
+            self.metrics.record_apdu(pdu, data, sw, time.perf_counter() - t_start)
+        else:
+            (data, sw) = self._send_apdu_raw_bin(pdu)
         if self.apdu_tracer:
-            self.apdu_tracer.trace_response(pdu, sw, data)
+            (data_hex, sw_hex) = restuple_b2h((data, sw))
+            self.apdu_tracer.trace_response(b2h(pdu), sw_hex, data_hex)
         return (data, sw)
 
-    def send_apdu(self, pdu: Hexstr) -> ResTuple:
-        """Sends an APDU and auto fetch response data
+    def send_apdu_raw(self, pdu: Hexstr) -> ResTuple:
+        """Sends an APDU with minimal processing
 
         Args:
            pdu : string of hexadecimal characters (ex. "A0A40000023F00")
@@ -130,26 +260,102 @@ class LinkBase(abc.ABC):
                         data : string (in hex) of returned data (ex. "074F4EFFFF")
                         sw   : string (in hex) of status word (ex. "9000")
         """
-        data, sw = self.send_apdu_raw(pdu)
+        return restuple_b2h(self.send_apdu_raw_bin(bytes.fromhex(pdu)))
+
+    def send_apdu_bin(self, pdu: bytes) -> ResTupleBin:
+        """Sends an APDU and auto fetch response data
+
+        Args:
+           pdu : bytes of the command APDU
+        Returns:
+           tuple(data, sw), where
+                        data : bytes of returned data
+                        sw   : bytes of status word (ex. 90 00)
+        """
+        pdu = bytes(pdu)
+        if self.protocol == 1:
+            pdu = case3_to_case4(pdu)
+        data, sw = self.send_apdu_raw_bin(pdu)
 
         # When we have sent the first APDU, the SW may indicate that there are response bytes
         # available. There are two SWs commonly used for this 9fxx (sim) and 61xx (usim), where
         # xx is the number of response bytes available.
         # See also:
         if sw is not None:
-            while ((sw[0:2] == '9f') or (sw[0:2] == '61')):
+            while sw[0] in (0x9f, 0x61):
                 # SW1=9F: 3GPP TS 51.011 9.4.1, Responses to commands which are correctly executed
                 # SW1=61: ISO/IEC 7816-4, Table 5 — General meaning of the interindustry values of SW1-SW2
-                pdu_gr = pdu[0:2] + 'c00000' + sw[2:4]
-                d, sw = self.send_apdu_raw(pdu_gr)
+                pdu_gr = pdu[0:1] + b'\xc0\x00\x00' + sw[1:2]
+                if self.metrics:
+                    self.metrics.count('get_response')
+                d, sw = self.send_apdu_raw_bin(pdu_gr)
                 data += d
-            if sw[0:2] == '6c':
+            if sw[0] == 0x6c:
                 # SW1=6C: ETSI TS 102 221 Table 7.1: Procedure byte coding
-                pdu_gr = pdu[0:8] + sw[2:4]
-                data, sw = self.send_apdu_raw(pdu_gr)
+                pdu_gr = pdu[0:4] + sw[1:2]
+                if self.metrics:
+                    self.metrics.count('le_retry')
+                data, sw = self.send_apdu_raw_bin(pdu_gr)
 
         return data, sw
 
+    def send_apdu(self, pdu: Hexstr) -> ResTuple:
+        """Sends an APDU and auto fetch response data
+
+        Args:
+           pdu : string of hexadecimal characters (ex. "A0A40000023F00")
+        Returns:
+           tuple(data, sw), where
+                        data : string (in hex) of returned data (ex. "074F4EFFFF")
+                        sw   : string (in hex) of status word (ex. "9000")
+        """
+        return restuple_b2h(self.send_apdu_bin(bytes.fromhex(pdu)))
+
+    def send_apdu_checksw_bin(self, pdu: bytes, sw: SwMatchstr = "9000") -> ResTupleBin:
+        """Sends an APDU and check returned SW
+
+        Args:
+           pdu : bytes of the command APDU
+           sw : string of 4 hexadecimal characters (ex. "9000"). The user may mask out certain
+                        digits using a '?' to add some ambiguity if needed.
+        Returns:
+                tuple(data, sw), where
+                        data : bytes of returned data
+                        sw   : bytes of status word (ex. 90 00)
+        """
+        rv = self.send_apdu_bin(pdu)
+
+        if sw == '9000' and rv[1][0] == 0x91:
+            # It *was* successful after all -- the proactive commands the card has pending
+            # need not concern the caller.
+            self._process_proactive(rv[1])
+            rv = (rv[0], b'\x90\x00')
+
+        # avoid the hex conversion for the by far most common case
+        if rv[1] == b'\x90\x00' and sw == '9000':
+            return rv
+        sw_hex = b2h(rv[1])
+        if not sw_match(sw_hex, sw):
+            raise SwMatchError(sw_hex, sw.lower(), self.sw_interpreter)
+        return rv
+
+    def _process_proactive(self, last_sw: bytes):
+        """Fetch and acknowledge proactive commands (see ProactiveSession) until the card has none
+        pending anymore."""
+        session = self.proactive_session
+        while last_sw[0] == 0x91:
+            if self.metrics:
+                t_start = time.perf_counter()
+            fetch_data, fetch_sw = self.send_apdu_bin(b'\x80\x12\x00\x00' + last_sw[1:2])
+            if fetch_sw != b'\x90\x00' and fetch_sw[0] != 0x91:
+                raise SwMatchError(b2h(fetch_sw), '9000', self.sw_interpreter)
+            # Send the response immediately, thus also flushing out any further proactive
+            # commands that the card already wants to send
+            last_sw = self.send_apdu_bin(session.terminal_response(fetch_data))[1]
+            if self.metrics:
+                self.metrics.count('proactive_fetch', time.perf_counter() - t_start)
+        session.flush()
+
     def send_apdu_checksw(self, pdu: Hexstr, sw: SwMatchstr = "9000") -> ResTuple:
         """Sends an APDU and check returned SW
 
@@ -162,61 +368,7 @@ class LinkBase(abc.ABC):
                         data : string (in hex) of returned data (ex. "074F4EFFFF")
                         sw   : string (in hex) of status word (ex. "9000")
         """
-        rv = self.send_apdu(pdu)
-        last_sw = rv[1]
-
-        while sw == '9000' and sw_match(last_sw, '91xx'):
-            # It *was* successful after all -- the extra pieces FETCH handled
-            # need not concern the caller.
-            rv = (rv[0], '9000')
-            # proactive sim as per TS 102 221 Setion 7.4.2
-            # TODO: Check SW manually to avoid recursing on the stack (provided this piece of code stays in this place)
-            fetch_rv = self.send_apdu_checksw('80120000' + last_sw[2:], sw)
-            # Setting this in case we later decide not to send a terminal
-            # response immediately unconditionally -- the card may still have
-            # something pending even though the last command was not processed
-            # yet.
-            last_sw = fetch_rv[1]
-            # parse the proactive command
-            pcmd = ProactiveCommand()
-            parsed = pcmd.from_tlv(h2b(fetch_rv[0]))
-            print("FETCH: %s (%s)" % (fetch_rv[0], type(parsed).__name__))
-            result = Result()
-            if self.proactive_handler:
-                # Extension point: If this does return a list of TLV objects,
-                # they could be appended after the Result; if the first is a
-                # Result, that cuold replace the one built here.
-                self.proactive_handler.receive_fetch_raw(pcmd, parsed)
-                result.from_dict({'general_result': 'performed_successfully', 'additional_information': ''})
-            else:
-                result.from_dict({'general_result': 'command_beyond_terminal_capability', 'additional_information': ''})
-
-            # Send response immediately, thus also flushing out any further
-            # proactive commands that the card already wants to send
-            #
-            # Structure as per TS 102 223 V4.4.0 Section 6.8
-
-            # The Command Details are echoed from the command that has been processed.
-            (command_details,) = [c for c in pcmd.decoded.children if isinstance(c, CommandDetails)]
-            # The Device Identities are fixed. (TS 102 223 V4.0.0 Section 6.8.2)
-            device_identities = DeviceIdentities()
-            device_identities.from_dict({'source_dev_id': 'terminal', 'dest_dev_id': 'uicc'})
-
-            # Testing hint: The value of tail does not influence the behavior
-            # of an SJA2 that sent ans SMS, so this is implemented only
-            # following TS 102 223, and not fully tested.
-            tail = command_details.to_tlv() + device_identities.to_tlv() + result.to_tlv()
-            # Testing hint: In contrast to the above, this part is positively
-            # essential to get the SJA2 to provide the later parts of a
-            # multipart SMS in response to an OTA RFM command.
-            terminal_response = '80140000' + b2h(len(tail).to_bytes(1, 'big') + tail)
-
-            terminal_response_rv = self.send_apdu(terminal_response)
-            last_sw = terminal_response_rv[1]
-
-        if not sw_match(rv[1], sw):
-            raise SwMatchError(rv[1], sw.lower(), self.sw_interpreter)
-        return rv
+        return restuple_b2h(self.send_apdu_checksw_bin(bytes.fromhex(pdu), sw))
 
 def argparse_add_reader_args(arg_parser: argparse.ArgumentParser):
     """Add all reader related arguments to the given argparse.Argumentparser instance."""
@@ -224,11 +376,20 @@ def argparse_add_reader_args(arg_parser: argparse.ArgumentParser):
     from pySim.transport.pcsc import PcscSimLink
     from pySim.transport.modem_atcmd import ModemATCommandLink
     from pySim.transport.calypso import CalypsoSimLink
+    from pySim.transport.simulated import SimulatedCardLink
+    from pySim.transport.replay import ReplayLink
+    from pySim.transport.metrics import ApduMetrics
 
     SerialSimLink.argparse_add_reader_args(arg_parser)
     PcscSimLink.argparse_add_reader_args(arg_parser)
     ModemATCommandLink.argparse_add_reader_args(arg_parser)
     CalypsoSimLink.argparse_add_reader_args(arg_parser)
+    SimulatedCardLink.argparse_add_reader_args(arg_parser)
+    ReplayLink.argparse_add_reader_args(arg_parser)
+    ApduMetrics.argparse_add_reader_args(arg_parser)
+
+    arg_parser.add_argument('--proactive-batch-size', type=int, metavar='N', default=1,
+                            help='Hand proactive commands fetched from the card to the handler in batches of up to N')
 
     return arg_parser
 
@@ -237,7 +398,14 @@ def init_reader(opts, **kwargs) -> LinkBase:
     """
     Init card reader driver
     """
-    if opts.pcsc_dev is not None or opts.pcsc_regex is not None:
+    kwargs.setdefault('proactive_batch_size', getattr(opts, 'proactive_batch_size', 1))
+    if getattr(opts, 'replay', None):
+        from pySim.transport.replay import ReplayLink
+        sl = ReplayLink(opts, **kwargs)
+    elif getattr(opts, 'simulated_card', False):
+        from pySim.transport.simulated import SimulatedCardLink
+        sl = SimulatedCardLink(opts, **kwargs)
+    elif opts.pcsc_dev is not None or opts.pcsc_regex is not None:
         from pySim.transport.pcsc import PcscSimLink
         sl = PcscSimLink(opts, **kwargs)
     elif opts.osmocon_sock is not None:
@@ -251,6 +419,15 @@ def init_reader(opts, **kwargs) -> LinkBase:
         from pySim.transport.serial import SerialSimLink
         sl = SerialSimLink(opts, **kwargs)
 
+    if getattr(opts, 'record_apdus', None):
+        from pySim.transport.replay import ApduRecorder
+        sl.apdu_tracer = ApduRecorder(opts.record_apdus, link=sl, chain=sl.apdu_tracer)
+
+    if getattr(opts, 'apdu_stats', None):
+        from pySim.transport.metrics import ApduMetrics
+        sl.metrics = ApduMetrics()
+        sl.metrics.write_at_exit(opts.apdu_stats, opts.apdu_stats_format)
+
     if os.environ.get('PYSIM_INTEGRATION_TEST') == "1":
         print("Using %s reader interface" % (sl.name))
     else:
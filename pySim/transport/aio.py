@@ -0,0 +1,367 @@
+# -*- coding: utf-8 -*-
+
+""" pySim: asyncio based transport link base
+
+The AsyncLinkBase mirrors LinkBase, but all methods exchanging data with the card are
+coroutines.  This way, a single event loop (e.g. of a web service) can drive dozens of cards
+concurrently, without requiring a thread per reader.
+
+Drivers for which the underlying API is blocking (PC/SC) are wrapped by the ExecutorLink, which
+runs all calls into the driver in a worker thread.  Drivers for serial ports (modem, Phoenix
+reader) watch the file descriptor of the port from the event loop, while the Calypso driver uses
+asyncio streams for the osmocon socket.
+"""
+
+#
+# (C) 2024 by Sysmocom s.f.m.c. GmbH
+# All Rights Reserved
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+import abc
+import time
+import asyncio
+import functools
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional
+
+from pySim.exceptions import SwMatchError
+from pySim.transport import LinkBase, ApduTracer, ProactiveHandler, ProactiveSession, case3_to_case4
+from pySim.utils import sw_match, b2h, Hexstr, SwMatchstr, ResTuple, ResTupleBin, restuple_b2h
+
+
+class AsyncLinkBase(abc.ABC):
+    """Base class for asyncio based link/transport to card."""
+
+    def __init__(self, sw_interpreter=None, apdu_tracer: Optional[ApduTracer]=None,
+                 proactive_handler: Optional[ProactiveHandler]=None, proactive_batch_size: int = 1):
+        self.sw_interpreter = sw_interpreter
+        self.apdu_tracer = apdu_tracer
+        self.proactive_session = ProactiveSession(proactive_handler, batch_size=proactive_batch_size)
+        # optional ApduMetrics collector (see pySim.transport.metrics)
+        self.metrics = None
+        # transmission protocol (T=0 or T=1) in use; drivers supporting T=1 update this on connect
+        self.protocol = 0
+        # a card processes only one command at a time: make sure that concurrent tasks using the
+        # same link do not interleave their commands and GET RESPONSE (created on first use, as
+        # the lock is bound to the event loop)
+        self._lock = None
+
+    @abc.abstractmethod
+    def __str__(self) -> str:
+        """Implementation specific method for printing an information to identify the device."""
+
+    @property
+    def proactive_handler(self) -> Optional[ProactiveHandler]:
+        return self.proactive_session.handler
+
+    @proactive_handler.setter
+    def proactive_handler(self, handler: Optional[ProactiveHandler]):
+        self.proactive_session.handler = handler
+
+    @abc.abstractmethod
+    async def _send_apdu_raw_bin(self, pdu: bytes) -> ResTupleBin:
+        """Implementation specific coroutine for sending the PDU."""
+
+    def set_sw_interpreter(self, interp):
+        """Set an (optional) status word interpreter."""
+        self.sw_interpreter = interp
+
+    @abc.abstractmethod
+    async def wait_for_card(self, timeout: Optional[int] = None, newcardonly: bool = False):
+        """Wait for a card and connect to it
+
+        Args:
+           timeout : Maximum wait time in seconds (None=no timeout)
+           newcardonly : Should we wait for a new card, or an already inserted one ?
+        """
+
+    @abc.abstractmethod
+    async def connect(self):
+        """Connect to a card immediately
+        """
+
+    @abc.abstractmethod
+    async def disconnect(self):
+        """Disconnect from card
+        """
+
+    @abc.abstractmethod
+    async def reset_card(self):
+        """Resets the card (power down/up)
+        """
+
+    async def send_apdu_raw_bin(self, pdu: bytes) -> ResTupleBin:
+        """Sends an APDU with minimal processing
+
+        Args:
+           pdu : bytes of the command APDU (ex. A0 A4 00 00 02 3F 00)
+        Returns:
+           tuple(data, sw), where
+                        data : bytes of returned data
+                        sw   : bytes of status word (ex. 90 00)
+        """
+        if self.apdu_tracer:
+            self.apdu_tracer.trace_command(b2h(pdu))
+        if self.metrics:
+            t_start = time.perf_counter()
+            (data, sw) = await self._send_apdu_raw_bin(pdu)
+            self.metrics.record_apdu(pdu, data, sw, time.perf_counter() - t_start)
+        else:
+            (data, sw) = await self._send_apdu_raw_bin(pdu)
+        if self.apdu_tracer:
+            (data_hex, sw_hex) = restuple_b2h((data, sw))
+            self.apdu_tracer.trace_response(b2h(pdu), sw_hex, data_hex)
+        return (data, sw)
+
+    async def send_apdu_raw(self, pdu: Hexstr) -> ResTuple:
+        """Sends an APDU with minimal processing (hex-string variant of send_apdu_raw_bin)."""
+        return restuple_b2h(await self.send_apdu_raw_bin(bytes.fromhex(pdu)))
+
+    async def send_apdu_bin(self, pdu: bytes) -> ResTupleBin:
+        """Sends an APDU and auto fetch response data
+
+        Args:
+           pdu : bytes of the command APDU
+        Returns:
+           tuple(data, sw), where
+                        data : bytes of returned data
+                        sw   : bytes of status word (ex. 90 00)
+        """
+        pdu = bytes(pdu)
+        if self.protocol == 1:
+            pdu = case3_to_case4(pdu)
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        async with self._lock:
+            data, sw = await self.send_apdu_raw_bin(pdu)
+            # see LinkBase.send_apdu_bin
+            if sw is not None:
+                while sw[0] in (0x9f, 0x61):
+                    pdu_gr = pdu[0:1] + b'\xc0\x00\x00' + sw[1:2]
+                    if self.metrics:
+                        self.metrics.count('get_response')
+                    d, sw = await self.send_apdu_raw_bin(pdu_gr)
+                    data += d
+                if sw[0] == 0x6c:
+                    pdu_gr = pdu[0:4] + sw[1:2]
+                    if self.metrics:
+                        self.metrics.count('le_retry')
+                    data, sw = await self.send_apdu_raw_bin(pdu_gr)
+        return data, sw
+
+    async def send_apdu(self, pdu: Hexstr) -> ResTuple:
+        """Sends an APDU and auto fetch response data (hex-string variant of send_apdu_bin)."""
+        return restuple_b2h(await self.send_apdu_bin(bytes.fromhex(pdu)))
+
+    async def send_apdu_checksw_bin(self, pdu: bytes, sw: SwMatchstr = "9000") -> ResTupleBin:
+        """Sends an APDU and check returned SW
+
+        Args:
+           pdu : bytes of the command APDU
+           sw : string of 4 hexadecimal characters (ex. "9000"). The user may mask out certain
+                        digits using a '?' to add some ambiguity if needed.
+        Returns:
+                tuple(data, sw), where
+                        data : bytes of returned data
+                        sw   : bytes of status word (ex. 90 00)
+        """
+        rv = await self.send_apdu_bin(pdu)
+
+        if sw == '9000' and rv[1][0] == 0x91:
+            # proactive commands pending in the card, see LinkBase.send_apdu_checksw_bin
+            await self._process_proactive(rv[1])
+            rv = (rv[0], b'\x90\x00')
+
+        if rv[1] == b'\x90\x00' and sw == '9000':
+            return rv
+        sw_hex = b2h(rv[1])
+        if not sw_match(sw_hex, sw):
+            raise SwMatchError(sw_hex, sw.lower(), self.sw_interpreter)
+        return rv
+
+    async def _process_proactive(self, last_sw: bytes):
+        """Fetch and acknowledge proactive commands, see LinkBase._process_proactive."""
+        session = self.proactive_session
+        while last_sw[0] == 0x91:
+            if self.metrics:
+                t_start = time.perf_counter()
+            fetch_data, fetch_sw = await self.send_apdu_bin(b'\x80\x12\x00\x00' + last_sw[1:2])
+            if fetch_sw != b'\x90\x00' and fetch_sw[0] != 0x91:
+                raise SwMatchError(b2h(fetch_sw), '9000', self.sw_interpreter)
+            last_sw = (await self.send_apdu_bin(session.terminal_response(fetch_data)))[1]
+            if self.metrics:
+                self.metrics.count('proactive_fetch', time.perf_counter() - t_start)
+        session.flush()
+
+    async def send_apdu_checksw(self, pdu: Hexstr, sw: SwMatchstr = "9000") -> ResTuple:
+        """Sends an APDU and check returned SW (hex-string variant of send_apdu_checksw_bin)."""
+        return restuple_b2h(await self.send_apdu_checksw_bin(bytes.fromhex(pdu), sw))
+
+
+class ExecutorLink(AsyncLinkBase):
+    """Asynchronous link using a blocking LinkBase driver, all calls into which are executed in a
+    worker thread.  Unless an executor is given, each link uses its own single worker thread, as
+    the drivers are not thread-safe (and a card processes only one command at a time anyway)."""
+
+    def __init__(self, link: LinkBase, executor: Optional[ThreadPoolExecutor] = None, **kwargs):
+        super().__init__(**kwargs)
+        self.link = link
+        self.name = link.name
+        self._executor = executor or ThreadPoolExecutor(max_workers=1, thread_name_prefix=str(link))
+
+    def __str__(self) -> str:
+        return str(self.link)
+
+    async def _run(self, func, *args, **kwargs):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, functools.partial(func, *args, **kwargs))
+
+    async def _send_apdu_raw_bin(self, pdu: bytes) -> ResTupleBin:
+        return await self._run(self.link._send_apdu_raw_bin, pdu)
+
+    async def wait_for_card(self, timeout: Optional[int] = None, newcardonly: bool = False):
+        await self._run(self.link.wait_for_card, timeout, newcardonly)
+        self.protocol = self.link.protocol
+
+    async def connect(self):
+        await self._run(self.link.connect)
+        self.protocol = self.link.protocol
+
+    async def disconnect(self):
+        await self._run(self.link.disconnect)
+
+    async def reset_card(self):
+        rv = await self._run(self.link.reset_card)
+        self.protocol = self.link.protocol
+        return rv
+
+    def get_atr(self) -> Hexstr:
+        return self.link.get_atr()
+
+    def close(self):
+        """Stop the worker thread of the link."""
+        self._executor.shutdown(wait=False)
+
+
+class AsyncSerialPort:
+    """Non-blocking access to a pySerial port from the event loop, by watching the file descriptor
+    of the port (POSIX only).  Received data is buffered until it is requested."""
+
+    def __init__(self, ser):
+        self.ser = ser
+        self._buf = bytearray()
+        self._event = None
+        self._loop = None
+
+    def attach(self):
+        """Start watching the port from the running event loop."""
+        if self._loop is None:
+            self._loop = asyncio.get_running_loop()
+            self._event = asyncio.Event()
+            self._loop.add_reader(self.ser.fileno(), self._on_readable)
+
+    def detach(self):
+        """Stop watching the port (e.g. to use it from blocking code) and discard buffered data."""
+        if self._loop is not None:
+            self._loop.remove_reader(self.ser.fileno())
+            self._loop = None
+        self._buf.clear()
+
+    def _on_readable(self):
+        data = self.ser.read(self.ser.in_waiting or 1)
+        if data:
+            self._buf += data
+            self._event.set()
+
+    async def _wait(self, deadline: float) -> bool:
+        """Wait for more data until the deadline (in event loop time); False on timeout."""
+        remaining = deadline - self._loop.time()
+        if remaining <= 0:
+            return False
+        self._event.clear()
+        try:
+            await asyncio.wait_for(self._event.wait(), remaining)
+        except asyncio.TimeoutError:
+            return False
+        return True
+
+    async def read(self, num: int, timeout: float) -> bytes:
+        """Read num bytes; less bytes are returned if the timeout (in seconds) expires."""
+        self.attach()
+        deadline = self._loop.time() + timeout
+        while len(self._buf) < num and await self._wait(deadline):
+            pass
+        data = bytes(self._buf[:num])
+        del self._buf[:num]
+        return data
+
+    async def read_some(self, timeout: float) -> bytes:
+        """Read all data received so far, waiting up to timeout (in seconds) if there is none."""
+        self.attach()
+        if not self._buf:
+            await self._wait(self._loop.time() + timeout)
+        data = bytes(self._buf)
+        self._buf.clear()
+        return data
+
+    def write(self, data: bytes) -> int:
+        return self.ser.write(data)
+
+    def reset_input_buffer(self):
+        self._buf.clear()
+        self.ser.reset_input_buffer()
+
+    def close(self):
+        self.detach()
+        self.ser.close()
+
+
+def init_reader_async(opts, **kwargs) -> AsyncLinkBase:
+    """
+    Init card reader driver for use with asyncio (see init_reader).  The returned link must be
+    connected using 'await link.connect()'.
+    """
+    kwargs.setdefault('proactive_batch_size', getattr(opts, 'proactive_batch_size', 1))
+    if getattr(opts, 'replay', None):
+        from pySim.transport.replay import ReplayLink
+        sl = ExecutorLink(ReplayLink(opts), **kwargs)
+    elif getattr(opts, 'simulated_card', False):
+        from pySim.transport.simulated import SimulatedCardLink
+        sl = ExecutorLink(SimulatedCardLink(opts), **kwargs)
+    elif opts.pcsc_dev is not None or opts.pcsc_regex is not None:
+        from pySim.transport.pcsc import PcscSimLink
+        sl = ExecutorLink(PcscSimLink(opts), **kwargs)
+    elif opts.osmocon_sock is not None:
+        from pySim.transport.calypso import AsyncCalypsoSimLink
+        sl = AsyncCalypsoSimLink(opts, **kwargs)
+    elif opts.modem_dev is not None:
+        from pySim.transport.modem_atcmd_aio import AsyncModemATCommandLink
+        sl = AsyncModemATCommandLink(opts, **kwargs)
+    else:  # Serial reader is default
+        from pySim.transport.serial_aio import AsyncSerialSimLink
+        sl = AsyncSerialSimLink(opts, **kwargs)
+
+    if getattr(opts, 'record_apdus', None):
+        from pySim.transport.replay import ApduRecorder
+        sl.apdu_tracer = ApduRecorder(opts.record_apdus, link=sl, chain=sl.apdu_tracer)
+
+    if getattr(opts, 'apdu_stats', None):
+        from pySim.transport.metrics import ApduMetrics
+        sl.metrics = ApduMetrics()
+        sl.metrics.write_at_exit(opts.apdu_stats, opts.apdu_stats_format)
+
+    print("Using reader %s" % sl)
+    return sl
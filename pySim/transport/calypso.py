@@ -16,6 +16,7 @@
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 #
 
+import asyncio
 import select
 import struct
 import socket
@@ -24,8 +25,9 @@ import argparse
 from typing import Optional
 
 from pySim.transport import LinkBase
+from pySim.transport.aio import AsyncLinkBase
 from pySim.exceptions import ReaderError, ProtocolError
-from pySim.utils import h2b, b2h, Hexstr, ResTuple
+from pySim.utils import ResTupleBin
 
 
 class L1CTLMessage:
@@ -128,10 +130,10 @@ class CalypsoSimLink(LinkBase):
     def wait_for_card(self, timeout: Optional[int] = None, newcardonly: bool = False):
         pass  # Nothing to do really ...
 
-    def _send_apdu_raw(self, pdu: Hexstr) -> ResTuple:
+    def _send_apdu_raw_bin(self, pdu: bytes) -> ResTupleBin:
 
         # Request FULL reset
-        req_msg = L1CTLMessageSIM(h2b(pdu))
+        req_msg = L1CTLMessageSIM(pdu)
         self.sock.send(req_msg.gen_msg())
 
         # Read message length first
@@ -160,7 +162,7 @@ class CalypsoSimLink(LinkBase):
         data = rsp[:-2]
         sw = rsp[-2:]
 
-        return b2h(data), b2h(sw)
+        return data, sw
 
     def __str__(self) -> str:
         return "osmocon:%s" % (self._sock_path)
@@ -173,3 +175,78 @@ the phone (can be ram-loaded).  It also requires that you run the ``osmocon`` pr
 domain socket to which this reader driver can attach.""")
         osmobb_group.add_argument('--osmocon', dest='osmocon_sock', metavar='PATH', default=None,
                                   help='Socket path for Calypso (e.g. Motorola C1XX) based reader (via OsmocomBB)')
+
+
+class AsyncCalypsoSimLink(AsyncLinkBase):
+    """Asynchronous variant of the CalypsoSimLink, using asyncio streams for the osmocon socket."""
+    name = CalypsoSimLink.name
+
+    def __init__(self, opts: argparse.Namespace = argparse.Namespace(osmocon_sock="/tmp/osmocom_l2"), **kwargs):
+        super().__init__(**kwargs)
+        if not os.path.exists(opts.osmocon_sock):
+            raise ReaderError(
+                "There is no such ('%s') UNIX socket" % opts.osmocon_sock)
+        self._sock_path = opts.osmocon_sock
+        self._reader = None
+        self._writer = None
+
+    async def _read_msg(self, timeout: float = 3.0) -> bytes:
+        """Read a single L1CTL message (without the length prefix) from osmocon."""
+        async def read():
+            msg_len = struct.unpack("!H", await self._reader.readexactly(struct.calcsize("!H")))[0]
+            return await self._reader.readexactly(msg_len)
+        try:
+            return await asyncio.wait_for(read(), timeout)
+        except asyncio.TimeoutError as exc:
+            raise ReaderError("Timeout waiting for card response") from exc
+        except asyncio.IncompleteReadError as exc:
+            raise ReaderError("Connection to osmocon closed") from exc
+
+    async def reset_card(self):
+        # Request FULL reset
+        self._writer.write(L1CTLMessageReset().gen_msg())
+        await self._writer.drain()
+
+        # Wait for confirmation
+        rsp = await self._read_msg()
+        if not rsp or rsp[0] != L1CTLMessageReset.L1CTL_RESET_CONF:
+            raise ReaderError("Failed to reset Calypso PHY")
+
+    async def connect(self):
+        print("Connecting to osmocon at '%s'..." % self._sock_path)
+        self._reader, self._writer = await asyncio.open_unix_connection(self._sock_path)
+        await self.reset_card()
+
+    async def disconnect(self):
+        if self._writer:
+            self._writer.close()
+            await self._writer.wait_closed()
+            self._reader = self._writer = None
+
+    async def wait_for_card(self, timeout: Optional[int] = None, newcardonly: bool = False):
+        pass  # Nothing to do really ...
+
+    async def _send_apdu_raw_bin(self, pdu: bytes) -> ResTupleBin:
+        self._writer.write(L1CTLMessageSIM(pdu).gen_msg())
+        await self._writer.drain()
+
+        rsp = await self._read_msg()
+        if len(rsp) < struct.calcsize("BBxx"):
+            raise ReaderError("Missing L1CTL header for L1CTL_SIM_CONF")
+
+        # Verify L1CTL header
+        hdr = struct.unpack_from("BBxx", rsp)
+        if hdr[0] != L1CTLMessageSIM.L1CTL_SIM_CONF:
+            raise ReaderError("Unexpected L1CTL message received")
+
+        # Verify the payload length
+        offset = struct.calcsize("BBxx")
+        if len(rsp) <= offset:
+            raise ProtocolError("Empty response from SIM?!?")
+
+        # Omit L1CTL header, unpack data and SW
+        rsp = rsp[offset:]
+        return rsp[:-2], rsp[-2:]
+
+    def __str__(self) -> str:
+        return "osmocon:%s" % (self._sock_path)
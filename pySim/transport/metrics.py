@@ -0,0 +1,235 @@
+# -*- coding: utf-8 -*-
+
+""" pySim: APDU latency and byte-count instrumentation
+
+The ApduMetrics collector is attached to a transport link (LinkBase.metrics) and is
+called for each command/response pair exchanged with the card.  It keeps latency
+histograms and byte counters per instruction (INS) and per file, as well as counters
+for the GET RESPONSE / 6Cxx retries and proactive FETCH round trips performed by the
+link.  The result can be dumped as JSON or in the Prometheus text exposition format
+(e.g. for the node_exporter textfile collector).
+"""
+
+#
+# (C) 2024 by Sysmocom s.f.m.c. GmbH
+# All Rights Reserved
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+import os
+import json
+import atexit
+import argparse
+from typing import Optional, Dict, List
+
+from pySim.utils import b2h
+
+# upper bounds (in seconds) of the latency histogram buckets
+BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5)
+
+# events counted by the link in addition to the individual APDUs
+EVENTS = {
+    'get_response': 'GET RESPONSE commands sent due to SW 61xx/9Fxx',
+    'le_retry': 'commands re-sent with corrected Le due to SW 6Cxx',
+    'proactive_fetch': 'proactive FETCH + TERMINAL RESPONSE round trips',
+}
+
+
+class ApduStats:
+    """Latency histogram and byte counters of a group of command/response pairs."""
+
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+        self.bytes_out = 0
+        self.bytes_in = 0
+        # one counter per bucket plus one for +Inf (not cumulative)
+        self.buckets = [0] * (len(BUCKETS) + 1)
+
+    def add(self, bytes_out: int, bytes_in: int, duration: float):
+        self.count += 1
+        self.duration += duration
+        self.bytes_out += bytes_out
+        self.bytes_in += bytes_in
+        for i, bound in enumerate(BUCKETS):
+            if duration <= bound:
+                self.buckets[i] += 1
+                return
+        self.buckets[-1] += 1
+
+    def cumulative_buckets(self) -> List[int]:
+        """Bucket counters in the (cumulative) Prometheus semantics, the last one being +Inf."""
+        result = []
+        total = 0
+        for n in self.buckets:
+            total += n
+            result.append(total)
+        return result
+
+    def to_dict(self) -> dict:
+        return {'count': self.count, 'duration': self.duration,
+                'bytes_out': self.bytes_out, 'bytes_in': self.bytes_in,
+                'buckets': dict(zip([str(b) for b in BUCKETS] + ['+Inf'], self.cumulative_buckets()))}
+
+
+class ApduMetrics:
+    """Collector of per-INS and per-file APDU statistics of a transport link.
+
+    The file a command operates on is tracked per logical channel from the SELECT commands
+    seen on the link: it is the FID (or last FID of a path) selected, the AID for selection by
+    DF name, or 'sfiXX' for READ/UPDATE commands using a short file identifier.  Commands sent
+    before any SELECT are accounted to the file '-'."""
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        """Discard all statistics collected so far."""
+        self.total = ApduStats()
+        self.per_ins: Dict[int, ApduStats] = {}
+        self.per_file: Dict[str, ApduStats] = {}
+        self.events = {name: {'count': 0, 'duration': 0.0} for name in EVENTS}
+        self._cur_file: Dict[int, str] = {}
+
+    @staticmethod
+    def _lchan_nr(cla: int) -> int:
+        if cla & 0x40:
+            # ISO/IEC 7816-4 further interindustry class
+            return 4 + (cla & 0x0f)
+        if cla == 0xa0:
+            # TS 51.011 (no logical channels)
+            return 0
+        return cla & 0x03
+
+    def _file_key(self, pdu: bytes) -> str:
+        lchan_nr = self._lchan_nr(pdu[0])
+        ins = pdu[1]
+        if ins == 0xa4 and len(pdu) >= 5:
+            p1 = pdu[2]
+            data = pdu[5:5+pdu[4]]
+            if p1 == 0x04:
+                key = b2h(data)
+            elif len(data) >= 2:
+                key = b2h(data[-2:])
+            else:
+                # SELECT MF / parent DF without data
+                key = '3f00' if p1 == 0x00 else '-'
+            self._cur_file[lchan_nr] = key
+            return key
+        if ins in (0xb0, 0xd6) and len(pdu) >= 4 and pdu[2] & 0x80:
+            # READ/UPDATE BINARY: SFI in P1
+            return 'sfi%02x' % (pdu[2] & 0x1f)
+        if ins in (0xb2, 0xdc) and len(pdu) >= 4 and pdu[3] >> 3:
+            # READ/UPDATE RECORD: SFI in P2
+            return 'sfi%02x' % (pdu[3] >> 3)
+        return self._cur_file.get(lchan_nr, '-')
+
+    def record_apdu(self, pdu: bytes, data: Optional[bytes], sw: Optional[bytes], duration: float):
+        """Account for one command/response pair exchanged with the card.
+
+        Args:
+           pdu : bytes of the command APDU
+           data : bytes of returned data
+           sw : bytes of status word
+           duration : response time of the card in seconds
+        """
+        bytes_out = len(pdu)
+        bytes_in = len(data or b'') + len(sw or b'')
+        self.total.add(bytes_out, bytes_in, duration)
+        if len(pdu) < 2:
+            return
+        ins_stats = self.per_ins.get(pdu[1])
+        if ins_stats is None:
+            ins_stats = self.per_ins[pdu[1]] = ApduStats()
+        ins_stats.add(bytes_out, bytes_in, duration)
+        fkey = self._file_key(pdu)
+        file_stats = self.per_file.get(fkey)
+        if file_stats is None:
+            file_stats = self.per_file[fkey] = ApduStats()
+        file_stats.add(bytes_out, bytes_in, duration)
+
+    def count(self, event: str, duration: float = 0.0):
+        """Count an event (see EVENTS), optionally with the time it took."""
+        self.events[event]['count'] += 1
+        self.events[event]['duration'] += duration
+
+    def to_dict(self) -> dict:
+        """Return all statistics as a JSON-serializable dict."""
+        return {'total': self.total.to_dict(),
+                'per_ins': {'%02x' % ins: s.to_dict() for ins, s in sorted(self.per_ins.items())},
+                'per_file': {f: s.to_dict() for f, s in sorted(self.per_file.items())},
+                'events': {name: dict(e) for name, e in self.events.items()}}
+
+    def to_json(self) -> str:
+        return json.dumps(self.to_dict(), indent=4)
+
+    @staticmethod
+    def _prom_histogram(lines: List[str], name: str, label: str, stats: Dict[str, ApduStats]):
+        lines.append('# TYPE %s histogram' % name)
+        for lval, s in stats.items():
+            for bound, n in zip([str(b) for b in BUCKETS] + ['+Inf'], s.cumulative_buckets()):
+                lines.append('%s_bucket{%s="%s",le="%s"} %u' % (name, label, lval, bound, n))
+            lines.append('%s_sum{%s="%s"} %f' % (name, label, lval, s.duration))
+            lines.append('%s_count{%s="%s"} %u' % (name, label, lval, s.count))
+
+    def to_prometheus(self) -> str:
+        """Return all statistics in the Prometheus text exposition format."""
+        per_ins = {'%02x' % ins: s for ins, s in sorted(self.per_ins.items())}
+        per_file = dict(sorted(self.per_file.items()))
+        lines = ['# HELP pysim_apdu_duration_seconds Response time of the card per instruction']
+        self._prom_histogram(lines, 'pysim_apdu_duration_seconds', 'ins', per_ins)
+        lines.append('# HELP pysim_file_apdu_duration_seconds Response time of the card per file')
+        self._prom_histogram(lines, 'pysim_file_apdu_duration_seconds', 'file', per_file)
+        for direction, descr in (('out', 'sent to'), ('in', 'received from')):
+            name = 'pysim_apdu_bytes_%s_total' % direction
+            lines.append('# HELP %s Bytes %s the card per instruction' % (name, descr))
+            lines.append('# TYPE %s counter' % name)
+            for ins, s in per_ins.items():
+                lines.append('%s{ins="%s"} %u' % (name, ins, getattr(s, 'bytes_' + direction)))
+        for event, descr in EVENTS.items():
+            lines.append('# HELP pysim_%s_total Number of %s' % (event, descr))
+            lines.append('# TYPE pysim_%s_total counter' % event)
+            lines.append('pysim_%s_total %u' % (event, self.events[event]['count']))
+        lines.append('# HELP pysim_proactive_fetch_seconds_total Time spent in proactive round trips')
+        lines.append('# TYPE pysim_proactive_fetch_seconds_total counter')
+        lines.append('pysim_proactive_fetch_seconds_total %f' % self.events['proactive_fetch']['duration'])
+        return '\n'.join(lines) + '\n'
+
+    def write(self, filename: str, fmt: str = 'json'):
+        """Write all statistics to a file, either as 'json' or 'prometheus'.  The file is replaced
+        atomically, so that it can be picked up by the node_exporter textfile collector at any time."""
+        if fmt == 'prometheus':
+            content = self.to_prometheus()
+        elif fmt == 'json':
+            content = self.to_json() + '\n'
+        else:
+            raise ValueError('Unsupported format %s' % fmt)
+        tmpname = filename + '.tmp'
+        with open(tmpname, 'w') as f:
+            f.write(content)
+        os.replace(tmpname, filename)
+
+    def write_at_exit(self, filename: str, fmt: str = 'json'):
+        """Register writing all statistics to a file when the program exits."""
+        atexit.register(self.write, filename, fmt)
+
+    @staticmethod
+    def argparse_add_reader_args(arg_parser: argparse.ArgumentParser):
+        stats_group = arg_parser.add_argument_group('APDU statistics', """Collect latency and byte-count
+statistics of all APDUs exchanged with the card, per instruction and per file.""")
+        stats_group.add_argument('--apdu-stats', metavar='FILE', default=None,
+                                 help='Write the APDU statistics to the given file when the program exits')
+        stats_group.add_argument('--apdu-stats-format', choices=['json', 'prometheus'], default='json',
+                                 help='Format of the APDU statistics file')
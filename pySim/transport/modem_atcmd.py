@@ -20,10 +20,11 @@ import logging as log
 import time
 import re
 import argparse
-from typing import Optional
+import selectors
+from typing import Optional, List, Tuple
 import serial
 
-from pySim.utils import Hexstr, ResTuple
+from pySim.utils import Hexstr, ResTuple, ResTupleBin, b2h, h2b
 from pySim.transport import LinkBase
 from pySim.exceptions import ReaderError, ProtocolError
 
@@ -31,6 +32,70 @@ from pySim.exceptions import ReaderError, ProtocolError
 # log.root.setLevel(log.DEBUG)
 
 
+def _is_final_result(line: bytes) -> bool:
+    """Is the given line a final result code (3GPP TS 27.007 / ITU-T V.250)?"""
+    return line in [b'OK', b'ERROR'] or line.startswith(b'+CME ERROR:') or line.startswith(b'+CMS ERROR:')
+
+
+def _split_lines(buf: bytes) -> Tuple[List[bytes], bytes]:
+    """Split the received data into complete, non-empty lines and the remaining incomplete line."""
+    *complete, rest = re.split(b'[\r\n]', buf)
+    return [line for line in complete if line], rest
+
+
+def _parse_session_id(rsp: List[bytes]) -> int:
+    """Parse the session id from the response to AT+CCHO."""
+    if not rsp or rsp[-1] != b'OK':
+        raise ReaderError('Failed to open logical channel: %s' % str(rsp))
+    session_id = None
+    for line in rsp[:-1]:
+        # some modems prefix the session id with '+CCHO: '
+        result = re.match(rb'(\+CCHO: *)?(\d+)$', line)
+        if result:
+            session_id = int(result.group(2))
+    if session_id is None:
+        raise ReaderError('Failed to parse response from modem: %s' % str(rsp))
+    return session_id
+
+
+def _format_apdu_cmd(pdu: Hexstr, session_id: Optional[int]) -> Tuple[str, bytes]:
+    """Build the AT+CSIM (or AT+CGLA, if a session_id is given) command for the given command APDU.
+    Returns the command and the prefix of the expected response line."""
+    # Make sure pdu has upper case hex digits [A-F]
+    pdu = pdu.upper()
+
+    if session_id is not None:
+        # Prepare the command as described in 8.43.  The session id is an opaque handle of the
+        # modem (not the logical channel number), which routes the APDU to the logical channel
+        # of the session, so the APDU is passed on unmodified.
+        return 'AT+CGLA=%d,%d,\"%s\"' % (session_id, len(pdu), pdu), b'+CGLA'
+    # Prepare the command as described in 8.17
+    return 'AT+CSIM=%d,\"%s\"' % (len(pdu), pdu), b'+CSIM'
+
+
+def _parse_apdu_rsp(rsp: List[bytes], prefix: bytes) -> ResTuple:
+    """Parse the response to an AT+CSIM (or AT+CGLA) command."""
+    if rsp and rsp[-1].startswith(b'+CME ERROR:'):
+        raise ProtocolError('%s failed with: %s' % (prefix.decode()[1:], str(rsp)))
+    if not rsp or rsp[-1] != b'OK':
+        raise ReaderError('APDU transfer failed: %s' % str(rsp))
+
+    # Make sure that the response has format: b'+CSIM: %d,\"%s\"'
+    for line in rsp[:-1]:
+        result = re.match(re.escape(prefix) + rb': *(\d+),"([0-9A-Fa-f]+)"', line)
+        if result:
+            break
+    else:
+        raise ReaderError('Failed to parse response from modem: %s' % str(rsp))
+    (_rsp_pdu_len, rsp_pdu) = result.groups()
+
+    # TODO: make sure we have at least SW
+    data = rsp_pdu[:-4].decode().lower()
+    sw = rsp_pdu[-4:].decode().lower()
+    log.debug('Command response: %s, %s',  data, sw)
+    return data, sw
+
+
 class ModemATCommandLink(LinkBase):
     """Transport Link for 3GPP TS 27.007 compliant modems."""
     name = "modem for Generic SIM Access (3GPP TS 27.007)"
@@ -44,6 +109,16 @@ class ModemATCommandLink(LinkBase):
         self._echo = False		# this will be auto-detected by _check_echo()
         self._device = device
         self._atr = None
+        # AID of the application to open a logical channel (AT+CCHO) to; None: use AT+CSIM
+        self._channel_aid = getattr(opts, 'modem_channel_aid', None)
+        self._session_id = None
+
+        # Wait for modem output using select/poll where the port supports it (POSIX)
+        try:
+            self._selector = selectors.DefaultSelector()
+            self._selector.register(self._sl.fileno(), selectors.EVENT_READ)
+        except Exception:
+            self._selector = None
 
         # Check the AT interface
         self._check_echo()
@@ -53,12 +128,37 @@ class ModemATCommandLink(LinkBase):
 
     def __del__(self):
         if hasattr(self, '_sl'):
+            self._close_channel()
             self._sl.close()
 
-    def send_at_cmd(self, cmd, timeout=0.2, patience=0.002):
+    def _read_lines(self, timeout: float) -> List[bytes]:
+        """Read response lines from the modem until a final result code is received or the
+        timeout expires.  Empty lines are skipped."""
+        lines = []
+        buf = b''
+        deadline = time.monotonic() + timeout
+        while True:
+            complete, buf = _split_lines(buf)
+            for line in complete:
+                lines.append(line)
+                if _is_final_result(line):
+                    return lines
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                log.info('Command finished with timeout >= %ss', timeout)
+                return lines
+            if self._selector:
+                if not self._selector.select(remaining):
+                    continue
+            else:
+                self._sl.timeout = remaining
+            buf += self._sl.read(self._sl.in_waiting or 1)
+
+    def send_at_cmd(self, cmd, timeout: float = 5.0) -> List[bytes]:
+        """Send an AT command and return the lines of the response (without echo), the last of
+        which is the final result code (unless the command timed out)."""
         # Convert from string to bytes, if needed
         bcmd = cmd if isinstance(cmd, bytes) else cmd.encode()
-        bcmd += b'\r'
 
         # Clean input buffer from previous/unexpected data
         self._sl.reset_input_buffer()
@@ -66,39 +166,21 @@ class ModemATCommandLink(LinkBase):
         # Send command to the modem
         log.debug('Sending AT command: %s', cmd)
         try:
-            wlen = self._sl.write(bcmd)
-            assert wlen == len(bcmd)
+            wlen = self._sl.write(bcmd + b'\r')
+            assert wlen == len(bcmd) + 1
         except Exception as exc:
             raise ReaderError('Failed to send AT command: %s' % cmd) from exc
 
-        rsp = b''
-        its = 1
-        t_start = time.time()
-        while True:
-            rsp = rsp + self._sl.read(self._sl.in_waiting)
-            lines = rsp.split(b'\r\n')
-            if len(lines) >= 2:
-                res = lines[-2]
-                if res == b'OK':
-                    log.debug('Command finished with result: %s', res)
-                    break
-                if res == b'ERROR' or res.startswith(b'+CME ERROR:'):
-                    log.error('Command failed with result: %s', res)
-                    break
-
-            if time.time() - t_start >= timeout:
-                log.info('Command finished with timeout >= %ss', timeout)
-                break
-            time.sleep(patience)
-            its += 1
-        log.debug('Command took %0.6fs (%d cycles a %fs)', time.time() - t_start, its, patience)
+        t_start = time.monotonic()
+        rsp = self._read_lines(timeout)
+        log.debug('Command took %0.6fs', time.monotonic() - t_start)
 
-        if self._echo:
-            # Skip echo chars
-            rsp = rsp[wlen:]
-        rsp = rsp.strip()
-        rsp = rsp.split(b'\r\n\r\n')
+        if self._echo and rsp and rsp[0] == bcmd:
+            # Skip echo
+            rsp = rsp[1:]
 
+        if rsp and rsp[-1] != b'OK':
+            log.error('Command failed with result: %s', rsp[-1])
         log.debug('Got response from modem: %s', rsp)
         return rsp
 
@@ -115,26 +197,44 @@ class ModemATCommandLink(LinkBase):
         result = self.send_at_cmd('AT')
 
         # Verify the response
-        if len(result) > 0:
-            if result[-1] == b'OK':
-                self._echo = False
-                return
-            if result[-1] == b'AT\r\r\nOK':
-                self._echo = True
-                return
+        if result and result[-1] == b'OK':
+            self._echo = result[0] == b'AT'
+            return
         raise ReaderError('Interface \'%s\' does not respond to \'AT\' command' % self._device)
 
     def reset_card(self):
+        self._close_channel()
+
         # Reset the modem, just to be sure
-        if self.send_at_cmd('ATZ') != [b'OK']:
+        if self.send_at_cmd('ATZ')[-1:] != [b'OK']:
             raise ReaderError('Failed to reset the modem')
 
         # Make sure that generic SIM access is supported
-        if self.send_at_cmd('AT+CSIM=?') != [b'OK']:
+        if self.send_at_cmd('AT+CSIM=?')[-1:] != [b'OK']:
             raise ReaderError('The modem does not seem to support SIM access')
 
+        if self._channel_aid:
+            self._open_channel()
+
         log.info('Modem at \'%s\' is ready!', self._device)
 
+    def _open_channel(self):
+        """Open a logical channel to the application with the configured AID (AT+CCHO, 3GPP TS 27.007
+        Section 8.45), which is used for all subsequent APDUs (AT+CGLA)."""
+        self._session_id = None
+        rsp = self.send_at_cmd('AT+CCHO="%s"' % self._channel_aid.upper())
+        self._session_id = _parse_session_id(rsp)
+        log.info('Opened logical channel (session id %d)', self._session_id)
+
+    def _close_channel(self):
+        """Close the logical channel opened by _open_channel (AT+CCHC)."""
+        if self._session_id is not None:
+            try:
+                self.send_at_cmd('AT+CCHC=%d' % self._session_id)
+            except Exception:
+                pass
+            self._session_id = None
+
     def connect(self):
         pass  # Nothing to do really ...
 
@@ -145,33 +245,11 @@ class ModemATCommandLink(LinkBase):
         pass  # Nothing to do really ...
 
     def _send_apdu_raw(self, pdu: Hexstr) -> ResTuple:
-        # Make sure pdu has upper case hex digits [A-F]
-        pdu = pdu.upper()
-
-        # Prepare the command as described in 8.17
-        cmd = 'AT+CSIM=%d,\"%s\"' % (len(pdu), pdu)
+        cmd, prefix = _format_apdu_cmd(pdu, self._session_id)
         log.debug('Sending command: %s',  cmd)
 
-        # Send AT+CSIM command to the modem
-        rsp = self.send_at_cmd(cmd)
-        if rsp[-1].startswith(b'+CME ERROR:'):
-            raise ProtocolError('AT+CSIM failed with: %s' % str(rsp))
-        if len(rsp) != 2 or rsp[-1] != b'OK':
-            raise ReaderError('APDU transfer failed: %s' % str(rsp))
-        rsp = rsp[0]  # Get rid of b'OK'
-
-        # Make sure that the response has format: b'+CSIM: %d,\"%s\"'
-        try:
-            result = re.match(b'\+CSIM: (\d+),\"([0-9A-F]+)\"', rsp)
-            (_rsp_pdu_len, rsp_pdu) = result.groups()
-        except Exception as exc:
-            raise ReaderError('Failed to parse response from modem: %s' % rsp) from exc
-
-        # TODO: make sure we have at least SW
-        data = rsp_pdu[:-4].decode().lower()
-        sw = rsp_pdu[-4:].decode().lower()
-        log.debug('Command response: %s, %s',  data, sw)
-        return data, sw
+        # Send AT+CSIM/AT+CGLA command to the modem
+        return _parse_apdu_rsp(self.send_at_cmd(cmd), prefix)
 
     def __str__(self) -> str:
         return "modem:%s" % self._device
@@ -185,3 +263,7 @@ the AT+CSIM interface for Generic SIM access as specified in 3GPP TS 27.007.""")
                                  help='Serial port of modem for Generic SIM Access (3GPP TS 27.007)')
         modem_group.add_argument('--modem-baud', type=int, metavar='BAUD', default=115200,
                                  help='Baud rate used for modem port')
+        modem_group.add_argument('--modem-channel-aid', metavar='AID', default=None,
+                                 help='Open a logical channel to the application with the given AID (AT+CCHO) '
+                                 'and send all APDUs via this channel (AT+CGLA) instead of using AT+CSIM')
+
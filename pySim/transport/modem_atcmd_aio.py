@@ -0,0 +1,142 @@
+# -*- coding: utf-8 -*-
+
+""" pySim: asyncio variant of the transport link for AT command modems
+
+This is kept separate from pySim.transport.modem_atcmd, so that the synchronous driver does not
+pull in asyncio.
+"""
+
+# Copyright (C) 2020 Vadim Yanitskiy <axilirator@gmail.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+import logging as log
+import time
+import argparse
+from typing import Optional, List
+import serial
+
+from pySim.utils import ResTupleBin, b2h, h2b
+from pySim.transport.aio import AsyncLinkBase, AsyncSerialPort
+from pySim.transport.modem_atcmd import ModemATCommandLink, _split_lines, _is_final_result, \
+    _parse_session_id, _format_apdu_cmd, _parse_apdu_rsp
+from pySim.exceptions import ReaderError
+
+
+class AsyncModemATCommandLink(AsyncLinkBase):
+    """Asynchronous variant of the ModemATCommandLink: the serial port of the modem is watched by
+    the event loop, so that many modems can be driven concurrently from a single thread."""
+    name = ModemATCommandLink.name
+
+    def __init__(self, opts: argparse.Namespace = argparse.Namespace(modem_dev='/dev/ttyUSB0',
+                                                                     modem_baud=115200), **kwargs):
+        super().__init__(**kwargs)
+        self._port = AsyncSerialPort(serial.Serial(opts.modem_dev, opts.modem_baud, timeout=5))
+        self._echo = False		# this will be auto-detected by _check_echo()
+        self._device = opts.modem_dev
+        self._channel_aid = getattr(opts, 'modem_channel_aid', None)
+        self._session_id = None
+
+    async def _read_lines(self, timeout: float) -> List[bytes]:
+        """Read response lines from the modem until a final result code is received or the
+        timeout expires.  Empty lines are skipped."""
+        lines = []
+        buf = b''
+        deadline = time.monotonic() + timeout
+        while True:
+            complete, buf = _split_lines(buf)
+            for line in complete:
+                lines.append(line)
+                if _is_final_result(line):
+                    return lines
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                log.info('Command finished with timeout >= %ss', timeout)
+                return lines
+            buf += await self._port.read_some(remaining)
+
+    async def send_at_cmd(self, cmd, timeout: float = 5.0) -> List[bytes]:
+        """Send an AT command and return the lines of the response (without echo), the last of
+        which is the final result code (unless the command timed out)."""
+        bcmd = cmd if isinstance(cmd, bytes) else cmd.encode()
+        self._port.attach()
+        self._port.reset_input_buffer()
+        log.debug('Sending AT command: %s', cmd)
+        try:
+            wlen = self._port.write(bcmd + b'\r')
+            assert wlen == len(bcmd) + 1
+        except Exception as exc:
+            raise ReaderError('Failed to send AT command: %s' % cmd) from exc
+
+        rsp = await self._read_lines(timeout)
+        if self._echo and rsp and rsp[0] == bcmd:
+            # Skip echo
+            rsp = rsp[1:]
+        if rsp and rsp[-1] != b'OK':
+            log.error('Command failed with result: %s', rsp[-1])
+        return rsp
+
+    async def _check_echo(self):
+        """Verify the correct response to 'AT' command and detect if inputs are echoed by the device
+        (see ModemATCommandLink._check_echo)."""
+        self._echo = False
+        result = await self.send_at_cmd('AT')
+        if result and result[-1] == b'OK':
+            self._echo = result[0] == b'AT'
+            return
+        raise ReaderError('Interface \'%s\' does not respond to \'AT\' command' % self._device)
+
+    async def reset_card(self):
+        await self._close_channel()
+        if (await self.send_at_cmd('ATZ'))[-1:] != [b'OK']:
+            raise ReaderError('Failed to reset the modem')
+        if (await self.send_at_cmd('AT+CSIM=?'))[-1:] != [b'OK']:
+            raise ReaderError('The modem does not seem to support SIM access')
+        if self._channel_aid:
+            rsp = await self.send_at_cmd('AT+CCHO="%s"' % self._channel_aid.upper())
+            self._session_id = _parse_session_id(rsp)
+            log.info('Opened logical channel (session id %d)', self._session_id)
+        log.info('Modem at \'%s\' is ready!', self._device)
+
+    async def _close_channel(self):
+        if self._session_id is not None:
+            try:
+                await self.send_at_cmd('AT+CCHC=%d' % self._session_id)
+            except Exception:
+                pass
+            self._session_id = None
+
+    async def connect(self):
+        await self._check_echo()
+        await self.reset_card()
+
+    async def disconnect(self):
+        await self._close_channel()
+
+    async def wait_for_card(self, timeout: Optional[int] = None, newcardonly: bool = False):
+        pass  # Nothing to do really ...
+
+    async def _send_apdu_raw_bin(self, pdu: bytes) -> ResTupleBin:
+        cmd, prefix = _format_apdu_cmd(b2h(pdu), self._session_id)
+        log.debug('Sending command: %s',  cmd)
+        data, sw = _parse_apdu_rsp(await self.send_at_cmd(cmd), prefix)
+        return h2b(data), h2b(sw)
+
+    def close(self):
+        """Close the serial port of the modem."""
+        self._port.close()
+
+    def __str__(self) -> str:
+        return "modem:%s" % self._device
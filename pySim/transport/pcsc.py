@@ -29,7 +29,13 @@ from smartcard.ExclusiveConnectCardConnection import ExclusiveConnectCardConnect
 
 from pySim.exceptions import NoCardError, ProtocolError, ReaderError
 from pySim.transport import LinkBase
-from pySim.utils import h2i, i2h, Hexstr, ResTuple
+from pySim.utils import Hexstr, ResTupleBin
+
+PROTOCOLS = {
+    't0': CardConnection.T0_protocol,
+    't1': CardConnection.T1_protocol,
+    'auto': CardConnection.T0_protocol | CardConnection.T1_protocol,
+}
 
 
 class PcscSimLink(LinkBase):
@@ -59,6 +65,7 @@ class PcscSimLink(LinkBase):
         self._con = self._reader.createConnection()
         if not opts.pcsc_shared:
             self._con = ExclusiveConnectCardConnection(self._con)
+        self._protocol = PROTOCOLS[getattr(opts, 'pcsc_protocol', 't0')]
 
     def __del__(self):
         try:
@@ -82,12 +89,14 @@ class PcscSimLink(LinkBase):
             # is disconnected
             self.disconnect()
 
-            # Explicitly select T=0 communication protocol
-            self._con.connect(CardConnection.T0_protocol)
+            # Explicitly select the communication protocol (by default T=0); if both T=0 and
+            # T=1 are permitted, PC/SC picks the first protocol offered in the ATR
+            self._con.connect(self._protocol)
         except CardConnectionException as exc:
             raise ProtocolError() from exc
         except NoCardException as exc:
             raise NoCardError() from exc
+        self.protocol = 1 if self._con.getProtocol() == CardConnection.T1_protocol else 0
 
     def get_atr(self) -> Hexstr:
         return self._con.getATR()
@@ -100,16 +109,12 @@ class PcscSimLink(LinkBase):
         self.connect()
         return 1
 
-    def _send_apdu_raw(self, pdu: Hexstr) -> ResTuple:
-
-        apdu = h2i(pdu)
-
-        data, sw1, sw2 = self._con.transmit(apdu)
+    def _send_apdu_raw_bin(self, pdu: bytes) -> ResTupleBin:
 
-        sw = [sw1, sw2]
+        data, sw1, sw2 = self._con.transmit(list(pdu))
 
         # Return value
-        return i2h(data), i2h(sw)
+        return bytes(data), bytes([sw1, sw2])
 
     def __str__(self) -> str:
         return "PCSC[%s]" % (self._reader)
@@ -124,6 +129,9 @@ interface, if not even a generic USB CCID driver is used.  You can use a tool li
 to obtain a list of readers available on your system. """)
         pcsc_group.add_argument('--pcsc-shared', action='store_true',
                                 help='Open PC/SC reaer in SHARED access (default: EXCLUSIVE)')
+        pcsc_group.add_argument('--pcsc-protocol', choices=list(PROTOCOLS.keys()), default='t0',
+                                help='Transmission protocol (auto: first protocol offered in the ATR). '
+                                'T=1 permits the use of extended length APDUs, if supported by the card')
         dev_group = pcsc_group.add_mutually_exclusive_group()
         dev_group.add_argument('-p', '--pcsc-device', type=int, dest='pcsc_dev', metavar='PCSC', default=None,
                                help='Number of PC/SC reader to use for SIM access')
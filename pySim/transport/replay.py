@@ -0,0 +1,218 @@
+# -*- coding: utf-8 -*-
+
+""" pySim: Recording of APDU sessions and transport link replaying them
+
+The ApduRecorder records all command/response pairs exchanged with a card (including
+the time the card took to respond) into a compact, append-only binary file.  The
+ReplayLink then serves the recorded responses back, in order, without any card.  This
+allows to run e.g. the same provisioning run over and over in order to profile the
+CPU overhead of pySim itself, independent of the latency of the card and reader.
+
+File format: a header (magic + version), followed by records of the form
+'<BIHH' (type, duration in microseconds, length of A, length of B) + A + B.  For
+APDU records, A is the command and B the response data followed by the status word;
+for ATR records (which start a new session), A is the ATR and B is empty.
+"""
+
+#
+# (C) 2024 by Sysmocom s.f.m.c. GmbH
+# All Rights Reserved
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+import time
+import struct
+import argparse
+from typing import Optional, List
+
+from pySim.exceptions import ProtocolError
+from pySim.transport import LinkBase, ApduTracer
+from pySim.utils import h2b, b2h, ResTupleBin
+
+FILE_MAGIC = b'pySimAPDU\x01'
+
+RECORD_APDU = 0x01
+RECORD_ATR = 0x02
+
+_record_hdr = struct.Struct('<BIHH')
+
+
+class ApduRecorder(ApduTracer):
+    """ApduTracer writing all command/response pairs (with the response time of the card) to a
+    recording file.  If a link is given, its ATR is recorded at the start of the session.  Another
+    ApduTracer may be chained, which is then called for each command/response as well."""
+
+    def __init__(self, filename: str, link: Optional[LinkBase] = None, chain: Optional[ApduTracer] = None):
+        self.link = link
+        self.chain = chain
+        self._f = open(filename, 'ab')
+        if self._f.tell() == 0:
+            self._f.write(FILE_MAGIC)
+        self._atr_recorded = False
+        self._t_cmd = None
+
+    def _write(self, rtype: int, duration: float, a: bytes, b: bytes):
+        duration_us = min(int(duration * 1000000), 0xffffffff)
+        self._f.write(_record_hdr.pack(rtype, duration_us, len(a), len(b)) + a + b)
+        # flush every record, so that nothing is lost in case the program crashes
+        self._f.flush()
+
+    def record_atr(self, atr: bytes):
+        """Record an ATR, which starts a new session in the recording."""
+        self._write(RECORD_ATR, 0, atr, b'')
+        self._atr_recorded = True
+
+    def trace_command(self, cmd):
+        if not self._atr_recorded and self.link:
+            self.record_atr(bytes(self.link.get_atr()))
+        if self.chain:
+            self.chain.trace_command(cmd)
+        self._t_cmd = time.perf_counter()
+
+    def trace_response(self, cmd, sw, resp):
+        duration = time.perf_counter() - self._t_cmd if self._t_cmd else 0
+        self._write(RECORD_APDU, duration, h2b(cmd), h2b(resp or '') + h2b(sw or ''))
+        if self.chain:
+            self.chain.trace_response(cmd, sw, resp)
+
+    def close(self):
+        self._f.close()
+
+
+class ApduRecord:
+    """A single command/response pair of a recording."""
+
+    def __init__(self, cmd: bytes, rsp: bytes, sw: bytes, duration: float):
+        self.cmd = cmd
+        self.rsp = rsp
+        self.sw = sw
+        # response time of the card in seconds
+        self.duration = duration
+
+    def __str__(self):
+        return "%s -> %s %s" % (b2h(self.cmd), b2h(self.rsp), b2h(self.sw))
+
+
+class ApduSession:
+    """A recorded session: the ATR of the card followed by a list of command/response pairs."""
+
+    def __init__(self, atr: Optional[bytes] = None):
+        self.atr = atr
+        self.records = []
+
+    @property
+    def duration(self) -> float:
+        """Total response time of the card during the session, in seconds."""
+        return sum([r.duration for r in self.records])
+
+
+def read_recording(filename: str) -> List[ApduSession]:
+    """Read all sessions from a recording file."""
+    with open(filename, 'rb') as f:
+        data = f.read()
+    if not data.startswith(FILE_MAGIC):
+        raise ValueError('%s is not a pySim APDU recording' % filename)
+    sessions = []
+    offset = len(FILE_MAGIC)
+    while offset + _record_hdr.size <= len(data):
+        rtype, duration_us, len_a, len_b = _record_hdr.unpack_from(data, offset)
+        offset += _record_hdr.size
+        a = data[offset:offset+len_a]
+        b = data[offset+len_a:offset+len_a+len_b]
+        offset += len_a + len_b
+        if len(a) + len(b) != len_a + len_b:
+            # truncated last record (e.g. the recording program was killed)
+            break
+        if rtype == RECORD_ATR:
+            sessions.append(ApduSession(a))
+        elif rtype == RECORD_APDU:
+            if not sessions:
+                sessions.append(ApduSession())
+            sessions[-1].records.append(ApduRecord(a, b[:-2], b[-2:], duration_us / 1000000))
+    return sessions
+
+
+class ReplayLink(LinkBase):
+    """Transport link which responds to each command with the response of the next command/response
+    pair of a recorded session.  In strict mode, each command must match the recorded one exactly,
+    otherwise a ProtocolError is raised.  If 'timing' is set, the recorded response time of the card is
+    reproduced."""
+    name = 'Replay'
+
+    def __init__(self, opts: argparse.Namespace = None, session: Optional[ApduSession] = None,
+                 strict: bool = True, timing: bool = False, **kwargs):
+        super().__init__(**kwargs)
+        if session is None:
+            sessions = read_recording(opts.replay)
+            if opts.replay_session >= len(sessions):
+                raise ValueError('Recording %s contains only %u sessions' % (opts.replay, len(sessions)))
+            session = sessions[opts.replay_session]
+            timing = opts.replay_timing
+        self.session = session
+        self.strict = strict
+        self.timing = timing
+        self.rewind()
+
+    def __str__(self) -> str:
+        return "replay (%u APDUs)" % len(self.session.records)
+
+    def rewind(self):
+        """Restart replaying at the beginning of the session."""
+        self.pos = 0
+
+    @property
+    def remaining(self) -> int:
+        """Number of recorded command/response pairs not yet replayed."""
+        return len(self.session.records) - self.pos
+
+    def wait_for_card(self, timeout: Optional[int] = None, newcardonly: bool = False):
+        pass
+
+    def connect(self):
+        pass
+
+    def disconnect(self):
+        pass
+
+    def get_atr(self) -> List[int]:
+        return list(self.session.atr or b'')
+
+    def reset_card(self):
+        return 1
+
+    def _send_apdu_raw_bin(self, pdu: bytes) -> ResTupleBin:
+        if self.pos >= len(self.session.records):
+            raise ProtocolError('Replay: end of recording reached, unexpected command %s' % b2h(pdu))
+        rec = self.session.records[self.pos]
+        if self.strict and rec.cmd != pdu:
+            raise ProtocolError('Replay: command %s does not match recorded command %s (APDU #%u)' %
+                                (b2h(pdu), b2h(rec.cmd), self.pos))
+        self.pos += 1
+        if self.timing:
+            time.sleep(rec.duration)
+        return rec.rsp, rec.sw
+
+    @staticmethod
+    def argparse_add_reader_args(arg_parser: argparse.ArgumentParser):
+        replay_group = arg_parser.add_argument_group('APDU recording/replay', """Record all APDUs exchanged
+with the card into a file, or replay such a recording instead of using a real card reader.""")
+        replay_group.add_argument('--record-apdus', metavar='FILE', default=None,
+                                  help='Append all command/response pairs (with timing) to the given recording file')
+        replay_group.add_argument('--replay', metavar='FILE', default=None,
+                                  help='Replay the responses of the given recording file')
+        replay_group.add_argument('--replay-session', metavar='N', type=int, default=0,
+                                  help='Number of the session within the recording file to be replayed')
+        replay_group.add_argument('--replay-timing', action='store_true', default=False,
+                                  help='Reproduce the recorded response time of the card')
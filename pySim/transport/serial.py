@@ -24,14 +24,20 @@ import serial
 
 from pySim.exceptions import NoCardError, ProtocolError
 from pySim.transport import LinkBase
-from pySim.utils import h2b, b2h, Hexstr, ResTuple
+from pySim.utils import b2h, Hexstr, ResTupleBin, atr_parse
+
+# ISO/IEC 7816-3 Table 7: clock rate conversion integer Fi (by upper nibble of TA1)
+FI_TABLE = {0x0: 372, 0x1: 372, 0x2: 558, 0x3: 744, 0x4: 1116, 0x5: 1488, 0x6: 1860,
+            0x9: 512, 0xa: 768, 0xb: 1024, 0xc: 1536, 0xd: 2048}
+# ISO/IEC 7816-3 Table 8: baud rate adjustment integer Di (by lower nibble of TA1)
+DI_TABLE = {0x1: 1, 0x2: 2, 0x3: 4, 0x4: 8, 0x5: 16, 0x6: 32, 0x7: 64, 0x8: 12, 0x9: 20}
 
 
 class SerialSimLink(LinkBase):
     """ pySim: Transport Link for serial (RS232) based readers included with simcard"""
     name = 'Serial'
 
-    def __init__(self, opts = argparse.Namespace(device='/dev/ttyUSB0', baudrate=9600), rst: str = '-rts',
+    def __init__(self, opts = argparse.Namespace(device='/dev/ttyUSB0', baudrate=9600, pps=True), rst: str = '-rts',
                  debug: bool = False, **kwargs):
         super().__init__(**kwargs)
         if not os.path.exists(opts.device):
@@ -49,6 +55,10 @@ class SerialSimLink(LinkBase):
         self._rst_pin = rst
         self._debug = debug
         self._atr = None
+        # baud rate at the default Fi/Di (372/1), i.e. before any PPS
+        self._baudrate = opts.baudrate
+        self._pps = getattr(opts, 'pps', True)
+        self._set_timing(372, 1, 10)
 
     def __del__(self):
         if hasattr(self, "_sl"):
@@ -122,6 +132,10 @@ class SerialSimLink(LinkBase):
         except Exception as exc:
             raise ValueError('Invalid reset pin %s' % self._rst_pin) from exc
 
+        # after a reset, the card always starts at the default Fi/Di
+        self._set_baudrate(self._baudrate)
+        self._set_timing(372, 1, 10)
+
         rst_meth(rst_val)
         time.sleep(0.1)  # 100 ms
         self._sl.flushInput()
@@ -141,28 +155,86 @@ class SerialSimLink(LinkBase):
             return -1
         t0 = ord(b)
         self._dbg_print("T0: 0x%x" % t0)
-        self._atr = [0x3b, ord(b)]
-
-        for i in range(4):
-            if t0 & (0x10 << i):
-                b = self._rx_byte()
-                self._atr.append(ord(b))
-                self._dbg_print("T%si = %x" % (chr(ord('A')+i), ord(b)))
-
-        for i in range(0, t0 & 0xf):
-            b = self._rx_byte()
-            self._atr.append(ord(b))
-            self._dbg_print("Historical = %x" % ord(b))
-
-        while True:
-            x = self._rx_byte()
-            if not x:
+        self._atr = [0x3b, t0]
+
+        # interface bytes: follow the chain of TDi bytes
+        y = t0 >> 4
+        tck = False
+        while y:
+            num = bin(y).count('1')
+            b = self._rx_bytes(num)
+            if len(b) != num:
+                return -1
+            self._atr += list(b)
+            self._dbg_print("Interface bytes: %s" % b2h(b))
+            if not y & 0x8:
                 break
-            self._atr.append(ord(x))
-            self._dbg_print("Extra: %x" % ord(x))
+            # presence of any protocol other than T=0 indicates the presence of TCK
+            if b[-1] & 0x0f:
+                tck = True
+            y = b[-1] >> 4
+
+        num = (t0 & 0xf) + (1 if tck else 0)
+        b = self._rx_bytes(num)
+        if len(b) != num:
+            return -1
+        self._atr += list(b)
+        self._dbg_print("Historical bytes / TCK: %s" % b2h(b))
+
+        if self._pps:
+            try:
+                self._negotiate_pps()
+            except ProtocolError as e:
+                # the card is in an undefined state after a failed PPS exchange, reset it again
+                self._dbg_print("PPS failed (%s), resetting card" % e)
+                self._pps = False
+                try:
+                    return self._reset_card()
+                finally:
+                    self._pps = True
 
         return 1
 
+    def _set_baudrate(self, baudrate: int):
+        if self._sl.baudrate != baudrate:
+            self._sl.baudrate = baudrate
+
+    def _set_timing(self, fi: int, di: int, wi: int):
+        """Compute the timeouts for the given Fi, Di and WI (ISO/IEC 7816-3 Section 10.2)."""
+        # the reader clock, derived from the configured (default Fi/Di) baud rate
+        clock = self._baudrate * 372
+        # one character takes 12 ETU (start, 8 data, parity, guard time)
+        self._char_time = 12.0 * fi / (di * clock)
+        # work waiting time: maximum delay between two characters sent by the card
+        self._wwt = 960.0 * wi * fi / clock
+
+    def _negotiate_pps(self) -> bool:
+        """Perform a PPS exchange (ISO/IEC 7816-3 Section 9) to switch to the Fi/Di advertised in TA1.
+        Returns True if the Fi/Di was changed; raises ProtocolError if the PPS exchange failed."""
+        ib = atr_parse(self._atr)
+        ta1 = ib.get('TA1', 0x11)
+        fi = FI_TABLE.get(ta1 >> 4)
+        di = DI_TABLE.get(ta1 & 0x0f)
+        # TA2 indicates the specific mode, in which no PPS exchange is permitted
+        if ta1 == 0x11 or 'TA2' in ib or fi is None or di is None:
+            return False
+        wi = ib.get('TC2', 10)
+        pps = bytes([0xff, 0x10, ta1])
+        pps += bytes([pps[0] ^ pps[1] ^ pps[2]])
+        self._dbg_print("PPS request: %s" % b2h(pps))
+        self._tx_string(pps)
+        rsp = self._rx_bytes(4)
+        self._dbg_print("PPS response: %s" % b2h(rsp))
+        if rsp != pps:
+            raise ProtocolError("PPS exchange failed (response: %s)" % b2h(rsp))
+        try:
+            self._set_baudrate(round(self._baudrate * 372 * di / fi))
+        except (ValueError, serial.SerialException) as e:
+            raise ProtocolError("Cannot set baud rate: %s" % e) from e
+        self._set_timing(fi, di, wi)
+        self._dbg_print("Using Fi=%u Di=%u, %u baud" % (fi, di, self._sl.baudrate))
+        return True
+
     def _dbg_print(self, s):
         if self._debug:
             print(s)
@@ -178,17 +250,35 @@ class SerialSimLink(LinkBase):
         """This is only safe if it's guaranteed the card won't send any data
         during the time of tx of the string !!!"""
         self._sl.write(s)
-        r = self._sl.read(len(s))
+        r = self._rx_bytes(len(s))
         if r != s:  # TX and RX are tied, so we must clear the echo
             raise ProtocolError(
                 "Bad echo value (Expected: %s, got %s)" % (b2h(s), b2h(r)))
 
+    def _rx_bytes(self, num: int) -> bytes:
+        """Read num bytes in a single call, allowing for the work waiting time plus the
+        transmission time of the characters."""
+        timeout = self._wwt + num * self._char_time
+        if self._sl.timeout != timeout:
+            self._sl.timeout = timeout
+        return self._sl.read(num)
+
     def _rx_byte(self):
-        return self._sl.read()
+        return self._rx_bytes(1)
+
+    def _rx_sw(self, sw1: Optional[bytes] = None) -> bytes:
+        """Receive the status word, skipping any NULL procedure bytes."""
+        while not sw1 or sw1 == b'\x60':
+            sw1 = self._rx_byte()
+            if not sw1:
+                raise ProtocolError("Timeout waiting for status word")
+        sw2 = self._rx_byte()
+        if not sw2:
+            raise ProtocolError("Timeout waiting for SW2")
+        return sw1 + sw2
 
-    def _send_apdu_raw(self, pdu: Hexstr) -> ResTuple:
+    def _send_apdu_raw_bin(self, pdu: bytes) -> ResTupleBin:
 
-        pdu = h2b(pdu)
         data_len = pdu[4]  # P3
 
         # Send first CLASS,INS,P1,P2,P3
@@ -200,43 +290,24 @@ class SerialSimLink(LinkBase):
         #  - SW1: The card can apparently proceed ...
         while True:
             b = self._rx_byte()
+            if not b:
+                raise ProtocolError("Timeout waiting for procedure byte")
             if ord(b) == pdu[1]:
                 break
-            if b != '\x60':
+            if b != b'\x60':
                 # Ok, it 'could' be SW1
-                sw1 = b
-                sw2 = self._rx_byte()
-                nil = self._rx_byte()
-                if (sw2 and not nil):
-                    return '', b2h(sw1+sw2)
-
-                raise ProtocolError()
+                return b'', self._rx_sw(b)
 
         # Send data (if any)
         if len(pdu) > 5:
             self._tx_string(pdu[5:])
+            return b'', self._rx_sw()
 
-        # Receive data (including SW !)
-        #  length = [P3 - tx_data (=len(pdu)-len(hdr)) + 2 (SW1//2) ]
-        to_recv = data_len - len(pdu) + 5 + 2
-
-        data = bytes(0)
-        while len(data) < to_recv:
-            b = self._rx_byte()
-            if (to_recv == 2) and (b == '\x60'):  # Ignore NIL if we have no RX data (hack ?)
-                continue
-            if not b:
-                break
-            data += b
-
-        # Split datafield from SW
-        if len(data) < 2:
-            return None, None
-        sw = data[-2:]
-        data = data[0:-2]
-
-        # Return value
-        return b2h(data), b2h(sw)
+        # Receive data in one go, followed by the SW
+        data = self._rx_bytes(data_len)
+        if len(data) != data_len:
+            raise ProtocolError("Timeout receiving response data (%u of %u bytes)" % (len(data), data_len))
+        return data, self._rx_sw()
 
     def __str__(self) -> str:
         return "serial:%s" % (self._sl.name)
@@ -250,3 +321,6 @@ readers, only with the very primitive readers following the ancient `Phoenix` or
                                   help='Serial Device for SIM access')
         serial_group.add_argument('-b', '--baud', dest='baudrate', type=int, metavar='BAUD', default=9600,
                                   help='Baud rate used for SIM access')
+        serial_group.add_argument('--no-pps', dest='pps', action='store_false', default=True,
+                                  help='Do not negotiate a higher baud rate (PPS) based on the ATR')
+
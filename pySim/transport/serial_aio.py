@@ -0,0 +1,111 @@
+# -*- coding: utf-8 -*-
+
+""" pySim: asyncio variant of the transport link for serial (RS232) based readers
+
+This is kept separate from pySim.transport.serial, so that the synchronous driver does not
+pull in asyncio.
+"""
+
+# Copyright (C) 2009-2010  Sylvain Munaut <tnt@246tNt.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+import asyncio
+import argparse
+from typing import Optional
+
+from pySim.exceptions import ProtocolError
+from pySim.transport.aio import AsyncLinkBase, AsyncSerialPort
+from pySim.transport.serial import SerialSimLink
+from pySim.utils import b2h, Hexstr, ResTupleBin
+
+
+class AsyncSerialSimLink(AsyncLinkBase):
+    """Asynchronous variant of the SerialSimLink.  The APDU exchange is performed by the event loop
+    watching the serial port; the reset (ATR and PPS exchange, which involve fixed delays and
+    happen once per session) is performed by a SerialSimLink in a worker thread."""
+    name = SerialSimLink.name
+
+    def __init__(self, opts = argparse.Namespace(device='/dev/ttyUSB0', baudrate=9600, pps=True), rst: str = '-rts',
+                 debug: bool = False, **kwargs):
+        super().__init__(**kwargs)
+        self._link = SerialSimLink(opts, rst=rst, debug=debug)
+        self._port = AsyncSerialPort(self._link._sl)
+
+    async def _run(self, func, *args):
+        # the port is used by blocking code: stop watching it meanwhile
+        self._port.detach()
+        return await asyncio.get_running_loop().run_in_executor(None, func, *args)
+
+    async def wait_for_card(self, timeout: Optional[int] = None, newcardonly: bool = False):
+        await self._run(self._link.wait_for_card, timeout, newcardonly)
+
+    async def connect(self):
+        await self.reset_card()
+
+    async def disconnect(self):
+        pass  # Nothing to do really ...
+
+    async def reset_card(self):
+        return await self._run(self._link.reset_card)
+
+    def get_atr(self) -> Hexstr:
+        return self._link.get_atr()
+
+    async def _rx_bytes(self, num: int) -> bytes:
+        return await self._port.read(num, self._link._wwt + num * self._link._char_time)
+
+    async def _tx_string(self, s: bytes):
+        self._port.write(s)
+        r = await self._rx_bytes(len(s))
+        if r != s:  # TX and RX are tied, so we must clear the echo
+            raise ProtocolError(
+                "Bad echo value (Expected: %s, got %s)" % (b2h(s), b2h(r)))
+
+    async def _rx_sw(self, sw1: Optional[bytes] = None) -> bytes:
+        """Receive the status word, skipping any NULL procedure bytes."""
+        while not sw1 or sw1 == b'\x60':
+            sw1 = await self._rx_bytes(1)
+            if not sw1:
+                raise ProtocolError("Timeout waiting for status word")
+        sw2 = await self._rx_bytes(1)
+        if not sw2:
+            raise ProtocolError("Timeout waiting for SW2")
+        return sw1 + sw2
+
+    async def _send_apdu_raw_bin(self, pdu: bytes) -> ResTupleBin:
+        # see SerialSimLink._send_apdu_raw_bin
+        data_len = pdu[4]  # P3
+        await self._tx_string(pdu[0:5])
+        while True:
+            b = await self._rx_bytes(1)
+            if not b:
+                raise ProtocolError("Timeout waiting for procedure byte")
+            if ord(b) == pdu[1]:
+                break
+            if b != b'\x60':
+                return b'', await self._rx_sw(b)
+
+        if len(pdu) > 5:
+            await self._tx_string(pdu[5:])
+            return b'', await self._rx_sw()
+
+        data = await self._rx_bytes(data_len)
+        if len(data) != data_len:
+            raise ProtocolError("Timeout receiving response data (%u of %u bytes)" % (len(data), data_len))
+        return data, await self._rx_sw()
+
+    def __str__(self) -> str:
+        return str(self._link)
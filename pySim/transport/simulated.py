@@ -0,0 +1,652 @@
+# -*- coding: utf-8 -*-
+
+""" pySim: Transport Link to a simulated, in-process card
+
+This allows to run pySim programs (and measure their APDU count and wall time)
+without any card reader.  The simulated card is a (very) simple UICC, whose file
+system can be built from the pySim file system model and seeded from a
+pySim-shell 'export' script or from a pySim-prog card data file.
+"""
+
+#
+# (C) 2024 by Sysmocom s.f.m.c. GmbH
+# All Rights Reserved
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+import re
+import time
+import argparse
+from typing import Optional, List, Dict, Tuple
+
+from pySim.transport import LinkBase
+from pySim.utils import h2b, b2h, bertlv_encode_len, bertlv_parse_tag_raw_at, bertlv_parse_len_at, enc_iccid, enc_imsi, ResTupleBin
+
+# generic UICC ATR (T=0), not matching any of the specific CardModel classes
+DEFAULT_ATR = '3b9f96801fc78031e073fe211b630000000000000000'
+
+# number of records created for record oriented files, if not specified otherwise
+DEFAULT_NUM_RECORDS = 2
+
+# record lengths of files whose record length is left open by the specifications, as found on real
+# cards (EF.SMSP with a 24 byte alpha identifier, as expected e.g. by pySim-prog for sysmoISIM-SJA2)
+DEFAULT_REC_LENS = {'6f42': 52}
+
+SW_OK = b'\x90\x00'
+
+
+def _tlv(tag: int, val: bytes) -> bytes:
+    return bytes([tag]) + bertlv_encode_len(len(val)) + val
+
+
+class SimulatedFile:
+    """A file (MF, DF, ADF or EF) on the simulated card."""
+
+    def __init__(self, fid: Optional[str], name: Optional[str] = None, structure: str = 'df',
+                 aid: Optional[str] = None, sfid: Optional[int] = None, parent: 'SimulatedFile' = None):
+        self.fid = fid.lower() if fid else None
+        self.name = name
+        self.structure = structure
+        self.aid = aid.lower() if aid else None
+        self.sfid = sfid
+        self.parent = parent
+        # DF/ADF/MF: children by (lower case) FID
+        self.children = {}
+        # transparent EF
+        self.data = bytearray()
+        # linear fixed / cyclic EF
+        self.rec_len = 0
+        self.records = []
+        # BER-TLV EF: values by (single byte) tag
+        self.objects = {}
+        # raw FCP (as seeded from an export); otherwise generated on demand
+        self.raw_fcp = None
+
+    def __str__(self):
+        return self.name or self.aid or self.fid
+
+    @property
+    def is_df(self) -> bool:
+        return self.structure == 'df'
+
+    def add_child(self, child: 'SimulatedFile') -> 'SimulatedFile':
+        child.parent = self
+        self.children[child.fid] = child
+        return child
+
+    def fcp(self) -> bytes:
+        """Return the FCP template (TS 102 221 Section 11.1.1.3) of this file."""
+        if self.raw_fcp:
+            return self.raw_fcp
+        if self.is_df:
+            fcp = _tlv(0x82, b'\x78\x21')
+            fcp += _tlv(0x83, h2b(self.fid) if self.fid else b'\x7f\xff')
+            if self.aid:
+                fcp += _tlv(0x84, h2b(self.aid))
+            fcp += _tlv(0x8a, b'\x05') + _tlv(0x8c, b'\x00')
+            # PIN status template: PIN1 (01) and ADM1 (0A) enabled
+            fcp += _tlv(0xc6, _tlv(0x90, b'\xc0') + _tlv(0x83, b'\x01') + _tlv(0x83, b'\x0a'))
+        else:
+            if self.structure == 'transparent':
+                fcp = _tlv(0x82, b'\x41\x21')
+                size = len(self.data)
+            elif self.structure in ['linear_fixed', 'cyclic']:
+                fdb = 0x42 if self.structure == 'linear_fixed' else 0x46
+                fcp = _tlv(0x82, bytes([fdb, 0x21]) + self.rec_len.to_bytes(2, 'big') +
+                           bytes([len(self.records)]))
+                size = self.rec_len * len(self.records)
+            else:
+                fcp = _tlv(0x82, b'\x39\x21')
+                size = 0
+            fcp += _tlv(0x83, h2b(self.fid)) + _tlv(0x8a, b'\x05') + _tlv(0x8c, b'\x00')
+            fcp += _tlv(0x80, size.to_bytes(2, 'big'))
+            fcp += _tlv(0x88, bytes([self.sfid << 3]) if self.sfid else b'')
+        return _tlv(0x62, fcp)
+
+    def gsm_select_response(self) -> bytes:
+        """Return the response to a SELECT of this file in the classic SIM class (CLA A0), as
+        specified in TS 51.011 Section 9.2.1."""
+        fid = h2b(self.fid) if self.fid else b'\x7f\xff'
+        if self.is_df:
+            num_dfs = len([c for c in self.children.values() if c.is_df])
+            num_efs = len(self.children) - num_dfs
+            ftype = b'\x01' if self.parent is None else b'\x02'
+            # file characteristics, number of DFs/EFs/CHVs, status of CHV1/UNBLOCK CHV1/CHV2/UNBLOCK CHV2
+            gsm_data = bytes([0x83, num_dfs, num_efs, 4, 0, 0x83, 0x8a, 0x83, 0x8a])
+            return b'\x00\x00\x00\x00' + fid + ftype + b'\x00' * 5 + bytes([len(gsm_data)]) + gsm_data
+        if self.structure in ['linear_fixed', 'cyclic']:
+            size = self.rec_len * len(self.records)
+            gsm_data = bytes([0x01 if self.structure == 'linear_fixed' else 0x03, self.rec_len])
+        else:
+            size = len(self.data)
+            gsm_data = b'\x00\x00'
+        # access conditions: READ/UPDATE CHV1, INVALIDATE/REHABILITATE ADM; not invalidated
+        return b'\x00\x00' + size.to_bytes(2, 'big') + fid + b'\x04\x00\x11\xff\x55\x01' + \
+            bytes([len(gsm_data)]) + gsm_data
+
+    def set_fcp(self, fcp: bytes):
+        """Set the raw FCP of this file and (re-)configure it according to the FCP."""
+        # avoid a dependency on the (heavy) file system model at import time
+        from pySim.ts_102_221 import CardProfileUICC
+        fcp_dec = CardProfileUICC.decode_select_response(b2h(fcp))
+        self.raw_fcp = fcp
+        fdesc = fcp_dec['file_descriptor']
+        structure = fdesc['file_descriptor_byte'].get('structure')
+        if fdesc['file_descriptor_byte'].get('file_type') == 'df':
+            self.structure = 'df'
+            return
+        self.structure = structure
+        self.sfid = fcp_dec.get('short_file_identifier', None)
+        if structure == 'transparent':
+            size = fcp_dec.get('file_size', len(self.data))
+            self.data = (self.data + b'\xff' * size)[:size]
+        elif structure in ['linear_fixed', 'cyclic']:
+            self.rec_len = fdesc['record_len']
+            self.records = [bytearray(b'\xff' * self.rec_len) for i in range(fdesc['num_of_rec'])]
+
+
+class SimulatedCard:
+    """A (very) simple, stateful, in-process UICC.  It supports SELECT, STATUS, READ/UPDATE BINARY,
+    READ/UPDATE RECORD, GET RESPONSE, MANAGE CHANNEL as well as dummy PIN related commands, all on
+    an in-memory file system.  Protocol T=0 is emulated, i.e. response data is returned via
+    61xx + GET RESPONSE, as is the case on real cards in PC/SC readers.  Like most real UICCs, it
+    also accepts commands in the classic SIM class (CLA A0) of TS 51.011, returning 9Fxx and the
+    SELECT response defined there."""
+
+    def __init__(self, atr: str = DEFAULT_ATR):
+        self.atr = h2b(atr)
+        self.mf = SimulatedFile('3f00', 'MF')
+        # ADFs by AID
+        self.adfs = {}
+        self.reset()
+
+    def reset(self):
+        """Reset the volatile state of the card (selected files, logical channels)."""
+        # per logical channel: [current DF, current EF, record pointer]
+        self.lchan = {0: [self.mf, None, 0]}
+        self.pending_rsp = b''
+        self.set_data_buf = b''
+
+    def add_adf(self, aid: str, name: Optional[str] = None) -> SimulatedFile:
+        adf = SimulatedFile(None, name, aid=aid, parent=self.mf)
+        self.adfs[adf.aid] = adf
+        return adf
+
+    @classmethod
+    def from_model(cls, mf, atr: str = DEFAULT_ATR, num_records: int = DEFAULT_NUM_RECORDS,
+                   rec_lens: Dict[str, int] = DEFAULT_REC_LENS) -> 'SimulatedCard':
+        """Create a simulated card whose file system mirrors the given pySim file system model (CardMF)
+        including its applications.  Transparent files are filled with 0xFF bytes of their
+        recommended size, record oriented files contain num_records records of 0xFF bytes; their
+        record length can be overridden per FID via rec_lens."""
+        from construct import SizeofError
+        from pySim.filesystem import CardADF, CardDF, TransparentEF, LinFixedEF, CyclicEF
+        card = cls(atr)
+
+        def size_of(size: Tuple) -> int:
+            return size[1] or size[0] or 1
+
+        def transparent_size_of(f: TransparentEF) -> int:
+            # files without a recommended size, but with a fixed size encoding (e.g. proprietary files
+            # of a CardModel) are sized according to their encoding
+            if not f.size[1] and f._construct is not None:
+                try:
+                    return max(f._construct.sizeof(), f.size[0] or 1)
+                except SizeofError:
+                    pass
+            return size_of(f.size)
+
+        def add_children(sdf: SimulatedFile, mdf):
+            for f in mdf.children.values():
+                sfid = f.sfid if isinstance(f.sfid, int) else None
+                if isinstance(f, CardDF):
+                    child = sdf.add_child(SimulatedFile(f.fid, f.name))
+                    add_children(child, f)
+                elif isinstance(f, TransparentEF):
+                    child = sdf.add_child(SimulatedFile(f.fid, f.name, 'transparent', sfid=sfid))
+                    child.data = bytearray(b'\xff' * transparent_size_of(f))
+                elif isinstance(f, LinFixedEF):
+                    structure = 'cyclic' if isinstance(f, CyclicEF) else 'linear_fixed'
+                    child = sdf.add_child(SimulatedFile(f.fid, f.name, structure, sfid=sfid))
+                    child.rec_len = rec_lens.get(f.fid) or size_of(f.rec_len)
+                    child.records = [bytearray(b'\xff' * child.rec_len) for i in range(num_records)]
+                else:
+                    sdf.add_child(SimulatedFile(f.fid, f.name, 'ber_tlv', sfid=sfid))
+
+        add_children(card.mf, mf)
+        for a in mf.applications.values():
+            adf = card.add_adf(a.aid, a.name)
+            add_children(adf, a)
+
+        # list all applications in EF.DIR
+        ef_dir = card.mf.children.get('2f00', None)
+        if ef_dir and ef_dir.structure == 'linear_fixed':
+            records = []
+            for adf in card.adfs.values():
+                label = (adf.name or '').encode('ascii')
+                rec = _tlv(0x61, _tlv(0x4f, h2b(adf.aid)) + _tlv(0x50, label))
+                records.append(bytearray(rec.ljust(max(ef_dir.rec_len, len(rec)), b'\xff')))
+            if records:
+                ef_dir.rec_len = max([len(r) for r in records])
+                ef_dir.records = [r.ljust(ef_dir.rec_len, b'\xff') for r in records]
+        return card
+
+    @classmethod
+    def default_uicc(cls, atr: str = DEFAULT_ATR) -> 'SimulatedCard':
+        """Create a simulated UICC based on the pySim models of UICC, USIM and ISIM.  If the ATR is
+        the one of a specific CardModel, the model specific files are added as well."""
+        from pySim.filesystem import CardMF, CardModel
+        from pySim.ts_102_221 import CardProfileUICC
+        from pySim.ts_51_011 import DF_GSM, DF_TELECOM
+        from pySim.ts_31_102 import CardApplicationUSIM
+        from pySim.ts_31_103 import CardApplicationISIM
+        profile = CardProfileUICC()
+        mf = CardMF(profile=profile)
+        for f in profile.files_in_mf + [DF_TELECOM(), DF_GSM()]:
+            mf.add_file(f)
+        for app in [CardApplicationUSIM(), CardApplicationISIM()]:
+            mf.add_application_df(app.adf)
+        # importing the card model modules registers them as CardModel sub-classes
+        import pySim.sysmocom_sja2 # pylint: disable=unused-import
+        for m in CardModel.__subclasses__():
+            if h2b(atr) in [h2b(a.replace(' ', '')) for a in m._atrs]:
+                m.add_files(argparse.Namespace(mf=mf))
+        return cls.from_model(mf, atr)
+
+    def _lookup_path(self, path: List[str]) -> SimulatedFile:
+        """Look up (or create) the DF/ADF identified by a list of FIDs/AIDs starting at the MF."""
+        cur = self.mf
+        for elem in path[1:]:
+            elem = elem.lower()
+            if len(elem) > 4:
+                cur = self.adfs.get(elem) or self.add_adf(elem)
+            else:
+                if elem not in cur.children:
+                    cur.add_child(SimulatedFile(elem))
+                cur = cur.children[elem]
+        return cur
+
+    def load_export_script(self, lines: List[str]):
+        """Seed the file system from the output of the pySim-shell 'export' command.  Files not yet
+        present are created; the FCP recorded in the export is returned when they are selected."""
+        cur_dir = None
+        cur_file = None
+        for line in lines:
+            line = line.strip()
+            m = re.match(r'^# directory: \S+ \((\S+)\)$', line)
+            if m:
+                cur_dir = self._lookup_path(m.group(1).split('/'))
+                cur_file = None
+                continue
+            m = re.match(r'^# file: (\S+) \(([0-9a-fA-F]{4})\)$', line)
+            if m and cur_dir:
+                fid = m.group(2).lower()
+                if fid not in cur_dir.children:
+                    cur_dir.add_child(SimulatedFile(fid, m.group(1), 'transparent'))
+                cur_file = cur_dir.children[fid]
+                continue
+            m = re.match(r'^# RAW FCP Template: ([0-9a-fA-F]+)$', line)
+            if m and cur_file:
+                cur_file.set_fcp(h2b(m.group(1)))
+                continue
+            m = re.match(r'^update_binary ([0-9a-fA-F]*)$', line)
+            if m and cur_file:
+                cur_file.data = bytearray(h2b(m.group(1)))
+                continue
+            m = re.match(r'^update_record (\d+) ([0-9a-fA-F]*)$', line)
+            if m and cur_file:
+                rec_nr = int(m.group(1))
+                while len(cur_file.records) < rec_nr:
+                    cur_file.records.append(bytearray(b'\xff' * cur_file.rec_len))
+                cur_file.records[rec_nr - 1] = bytearray(h2b(m.group(2)))
+                cur_file.rec_len = len(cur_file.records[rec_nr - 1])
+
+    def load_card_data(self, lines: List[str]):
+        """Seed the file system from a pySim-prog card data file (KEY=VALUE lines, as used in
+        pysim-testdata).  Currently ICCID and IMSI are supported."""
+        params = {}
+        for line in lines:
+            if '=' in line:
+                k, v = line.strip().split('=', 1)
+                params[k.upper()] = v
+
+        def write_transparent(path: List[str], data: bytes):
+            cur = self.mf
+            for elem in path:
+                cur = self.adfs.get(elem) if len(elem) > 4 else cur.children.get(elem)
+                if cur is None:
+                    return
+            cur.data[:len(data)] = data
+
+        if 'ICCID' in params:
+            write_transparent(['2fe2'], h2b(enc_iccid(params['ICCID'])))
+        if 'IMSI' in params:
+            imsi = h2b(enc_imsi(params['IMSI']))
+            write_transparent(['7f20', '6f07'], imsi)
+            for aid in self.adfs:
+                if aid.startswith('a0000000871002'):
+                    write_transparent([aid, '6f07'], imsi)
+
+    def load_seed_file(self, filename: str):
+        """Seed the file system from either a pySim-shell export script or a card data file."""
+        with open(filename, 'r') as f:
+            lines = f.readlines()
+        if any([l.startswith('# directory:') for l in lines]):
+            self.load_export_script(lines)
+        else:
+            self.load_card_data(lines)
+
+    @staticmethod
+    def _lchan_nr(cla: int) -> int:
+        if cla & 0x40:
+            return 4 + (cla & 0x0f)
+        return cla & 0x03
+
+    def _select(self, lchan: List, p1: int, p2: int, data: bytes) -> Tuple[bytes, bytes]:
+        cur_df = lchan[0]
+        if p1 == 0x04:
+            aid = b2h(data)
+            for adf_aid, adf in self.adfs.items():
+                if adf_aid.startswith(aid):
+                    f = adf
+                    break
+            else:
+                return b'', b'\x6a\x82'
+        elif p1 in [0x08, 0x09]:
+            f = self.mf if p1 == 0x08 else cur_df
+            for i in range(0, len(data), 2):
+                f = f.children.get(b2h(data[i:i+2])) if f.is_df else None
+                if f is None:
+                    return b'', b'\x6a\x82'
+        elif p1 == 0x00 or p1 == 0x03:
+            fid = b2h(data) if data else (cur_df.parent and b2h(b'\x3f\x00'))
+            if p1 == 0x03:
+                f = cur_df.parent or self.mf
+            elif fid == '3f00':
+                f = self.mf
+            elif fid == '7fff':
+                f = cur_df
+                while f.parent and not f.aid:
+                    f = f.parent
+                if not f.aid:
+                    return b'', b'\x6a\x82'
+            elif fid == cur_df.fid:
+                f = cur_df
+            elif fid in cur_df.children:
+                f = cur_df.children[fid]
+            elif cur_df.parent and fid == cur_df.parent.fid:
+                f = cur_df.parent
+            elif cur_df.parent and fid in cur_df.parent.children and cur_df.parent.children[fid].is_df:
+                f = cur_df.parent.children[fid]
+            else:
+                return b'', b'\x6a\x82'
+        else:
+            return b'', b'\x6b\x00'
+        if f.is_df:
+            lchan[0] = f
+            lchan[1] = None
+        else:
+            lchan[0] = f.parent
+            lchan[1] = f
+        lchan[2] = 0
+        if p2 & 0x0c == 0x0c:
+            return b'', SW_OK
+        return f.fcp(), SW_OK
+
+    def _ef_for(self, lchan: List, sfi: Optional[int], structures: List[str]) -> Tuple[Optional[SimulatedFile], bytes]:
+        """Resolve the EF addressed by a READ/UPDATE command (current EF or SFI)."""
+        if sfi:
+            for f in lchan[0].children.values():
+                if not f.is_df and f.sfid == sfi:
+                    ef = f
+                    break
+            else:
+                return None, b'\x6a\x82'
+            if ef != lchan[1]:
+                lchan[1] = ef
+                lchan[2] = 0
+        else:
+            ef = lchan[1]
+            if ef is None:
+                return None, b'\x69\x86'
+        if ef.structure not in structures:
+            return None, b'\x69\x81'
+        return ef, SW_OK
+
+    def _read_binary(self, lchan, p1, p2, le) -> Tuple[bytes, bytes]:
+        if p1 & 0x80:
+            sfi, offset = p1 & 0x1f, p2
+        else:
+            sfi, offset = None, (p1 << 8) | p2
+        ef, sw = self._ef_for(lchan, sfi, ['transparent'])
+        if ef is None:
+            return b'', sw
+        if offset > len(ef.data):
+            return b'', b'\x6b\x00'
+        le = le or 256
+        data = bytes(ef.data[offset:offset+le])
+        if len(data) < le:
+            return data, b'\x62\x82'
+        return data, SW_OK
+
+    def _update_binary(self, lchan, p1, p2, data) -> Tuple[bytes, bytes]:
+        if p1 & 0x80:
+            sfi, offset = p1 & 0x1f, p2
+        else:
+            sfi, offset = None, (p1 << 8) | p2
+        ef, sw = self._ef_for(lchan, sfi, ['transparent'])
+        if ef is None:
+            return b'', sw
+        if offset + len(data) > len(ef.data):
+            return b'', b'\x67\x00'
+        ef.data[offset:offset+len(data)] = data
+        return b'', SW_OK
+
+    def _read_record(self, lchan, p1, p2, le) -> Tuple[bytes, bytes]:
+        mode = p2 & 0x07
+        if mode not in (0x02, 0x03, 0x04):
+            return b'', b'\x6b\x00'
+        ef, sw = self._ef_for(lchan, p2 >> 3, ['linear_fixed', 'cyclic'])
+        if ef is None:
+            return b'', sw
+        if mode == 0x04:
+            rec_nr = p1
+        elif mode == 0x02:
+            # NEXT: the first record after selection (or the one after the current record)
+            rec_nr = lchan[2] + 1
+        else:
+            # PREVIOUS: the last record after selection (or the one before the current record)
+            rec_nr = (lchan[2] or len(ef.records) + 1) - 1
+        if rec_nr < 1 or rec_nr > len(ef.records):
+            return b'', b'\x6a\x83'
+        if le != ef.rec_len:
+            return b'', bytes([0x6c, ef.rec_len & 0xff])
+        if mode != 0x04:
+            lchan[2] = rec_nr
+        return bytes(ef.records[rec_nr - 1]), SW_OK
+
+    def _update_record(self, lchan, p1, p2, data) -> Tuple[bytes, bytes]:
+        ef, sw = self._ef_for(lchan, p2 >> 3, ['linear_fixed', 'cyclic'])
+        if ef is None:
+            return b'', sw
+        if len(data) != ef.rec_len:
+            return b'', b'\x67\x00'
+        if p2 & 0x07 == 0x03 and ef.structure == 'cyclic':
+            ef.records = [bytearray(data)] + ef.records[:-1]
+        elif p2 & 0x07 == 0x04:
+            if p1 < 1 or p1 > len(ef.records):
+                return b'', b'\x6a\x83'
+            ef.records[p1 - 1] = bytearray(data)
+        else:
+            return b'', b'\x6b\x00'
+        return b'', SW_OK
+
+    def _retrieve_data(self, lchan, p1, p2, data) -> Tuple[bytes, bytes]:
+        ef, sw = self._ef_for(lchan, None, ['ber_tlv'])
+        if ef is None:
+            return b'', sw
+        if p2 != 0x80 or len(data) != 1:
+            return b'', b'\x6b\x00'
+        if data[0] == 0x5c:
+            return _tlv(0x5c, bytes(ef.objects.keys())), SW_OK
+        if data[0] not in ef.objects:
+            return b'', b'\x6a\x88'
+        return _tlv(data[0], ef.objects[data[0]]), SW_OK
+
+    def _set_data(self, lchan, p1, p2, data) -> Tuple[bytes, bytes]:
+        ef, sw = self._ef_for(lchan, None, ['ber_tlv'])
+        if ef is None:
+            return b'', sw
+        if p2 == 0x80:
+            if len(data) == 1:
+                # only a tag: delete the object
+                ef.objects.pop(data[0], None)
+                return b'', SW_OK
+            self.set_data_buf = data
+        else:
+            self.set_data_buf += data
+        tag, offset = bertlv_parse_tag_raw_at(self.set_data_buf)
+        length, offset = bertlv_parse_len_at(self.set_data_buf, offset)
+        if len(self.set_data_buf) >= offset + length:
+            ef.objects[tag] = self.set_data_buf[offset:offset+length]
+            self.set_data_buf = b''
+        return b'', SW_OK
+
+    def _manage_channel(self, p1, p2) -> Tuple[bytes, bytes]:
+        if p1 == 0x80:
+            if p2 not in self.lchan or p2 == 0:
+                return b'', b'\x68\x81'
+            del self.lchan[p2]
+            return b'', SW_OK
+        lchan_nr = p2
+        if lchan_nr == 0:
+            lchan_nr = min(set(range(1, 20)) - set(self.lchan.keys()))
+        self.lchan[lchan_nr] = [self.mf, None, 0]
+        return (bytes([lchan_nr]) if p2 == 0 else b''), SW_OK
+
+    def process_apdu(self, pdu: bytes) -> Tuple[bytes, bytes]:
+        """Process a command APDU (in T=0 TPDU form) and return (response data, status word)."""
+        cla, ins, p1, p2 = pdu[0], pdu[1], pdu[2], pdu[3]
+        p3 = pdu[4] if len(pdu) > 4 else 0
+        data = pdu[5:]
+        if ins == 0xc0:
+            rsp, self.pending_rsp = self.pending_rsp[:p3 or 256], b''
+            return rsp, SW_OK
+        self.pending_rsp = b''
+        gsm = cla == 0xa0
+        if cla & 0xf0 not in [0x00, 0x40, 0x80, 0xc0] and not gsm:
+            return b'', b'\x6e\x00'
+        lchan = self.lchan.get(self._lchan_nr(cla))
+        if lchan is None:
+            return b'', b'\x68\x81'
+        if ins == 0xa4 and gsm:
+            # TS 51.011 only knows SELECT by FID, the response has its own format
+            if p1 != 0 or p2 != 0:
+                return b'', b'\x6b\x00'
+            rsp, sw = self._select(lchan, p1, 0x0c, data)
+            if sw == SW_OK:
+                rsp = (lchan[1] or lchan[0]).gsm_select_response()
+        elif ins == 0xa4:
+            rsp, sw = self._select(lchan, p1, p2, data)
+        elif ins == 0xf2 and gsm:
+            rsp, sw = lchan[0].gsm_select_response(), SW_OK
+        elif ins == 0xf2:
+            rsp, sw = (b'' if p2 == 0x0c else lchan[0].fcp()), SW_OK
+        elif ins == 0xb0:
+            return self._read_binary(lchan, p1, p2, p3)
+        elif ins == 0xd6:
+            return self._update_binary(lchan, p1, p2, data)
+        elif ins == 0xb2:
+            return self._read_record(lchan, p1, p2, p3)
+        elif ins == 0xdc:
+            return self._update_record(lchan, p1, p2, data)
+        elif ins == 0xcb:
+            rsp, sw = self._retrieve_data(lchan, p1, p2, data)
+        elif ins == 0xdb:
+            return self._set_data(lchan, p1, p2, data)
+        elif ins == 0x70:
+            return self._manage_channel(p1, p2)
+        elif ins == 0x20 and not data:
+            # VERIFY PIN without data: query the remaining attempts
+            return b'', b'\x63\xc3'
+        elif ins in [0x20, 0x24, 0x26, 0x28, 0x2c, 0x10, 0x14]:
+            # PIN related commands, TERMINAL PROFILE, TERMINAL RESPONSE: accept anything
+            return b'', SW_OK
+        else:
+            return b'', b'\x6d\x00'
+        # T=0: case 4 commands return their data via GET RESPONSE
+        if rsp and sw == SW_OK:
+            self.pending_rsp = rsp
+            return b'', bytes([0x9f if gsm else 0x61, len(rsp) & 0xff])
+        return rsp, sw
+
+
+class SimulatedCardLink(LinkBase):
+    """Transport link to a SimulatedCard, optionally adding a fixed latency to each APDU in order
+    to approximate the timing behavior of a real card reader."""
+    name = 'Simulated card'
+
+    def __init__(self, opts: argparse.Namespace = argparse.Namespace(sim_seed=None, sim_latency=0.0),
+                 card: Optional[SimulatedCard] = None, **kwargs):
+        super().__init__(**kwargs)
+        if card is None:
+            card = SimulatedCard.default_uicc(getattr(opts, 'sim_atr', None) or DEFAULT_ATR)
+            for seed in opts.sim_seed or []:
+                card.load_seed_file(seed)
+        self.card = card
+        # latency per APDU, in seconds
+        self.latency = (opts.sim_latency or 0.0) / 1000.0
+        # statistics
+        self.apdu_count = 0
+
+    def __str__(self) -> str:
+        return "simulated card"
+
+    def wait_for_card(self, timeout: Optional[int] = None, newcardonly: bool = False):
+        pass
+
+    def connect(self):
+        pass
+
+    def disconnect(self):
+        pass
+
+    def get_atr(self) -> List[int]:
+        return list(self.card.atr)
+
+    def reset_card(self):
+        self.card.reset()
+        return 1
+
+    def _send_apdu_raw_bin(self, pdu: bytes) -> ResTupleBin:
+        self.apdu_count += 1
+        if self.latency:
+            time.sleep(self.latency)
+        return self.card.process_apdu(pdu)
+
+    @staticmethod
+    def argparse_add_reader_args(arg_parser: argparse.ArgumentParser):
+        sim_group = arg_parser.add_argument_group('Simulated card', """Use an in-process simulated UICC
+instead of a real card reader, e.g. for testing and benchmarking.  The file system of the simulated card is
+derived from the pySim UICC/USIM/ISIM models; it can be seeded from the output of the pySim-shell ``export``
+command or from a pySim-prog card data file.""")
+        sim_group.add_argument('--simulated-card', action='store_true', default=False,
+                               help='Use a simulated card')
+        sim_group.add_argument('--sim-seed', metavar='FILE', action='append', default=None,
+                               help='Seed the simulated card from an export script or card data file (may be repeated)')
+        sim_group.add_argument('--sim-atr', metavar='ATR', default=DEFAULT_ATR,
+                               help='ATR of the simulated card, e.g. the one of a specific card model')
+        sim_group.add_argument('--sim-latency', metavar='MS', type=float, default=0.0,
+                               help='Latency of the simulated card per APDU in milliseconds')
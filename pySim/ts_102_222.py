@@ -46,6 +46,7 @@ class Ts102222Commands(CommandSet):
             return
         f = self._cmd.lchan.get_file_for_selectable(opts.NAME)
         (_data, _sw) = self._cmd.lchan.scc.delete_file(f.fid)
+        self._cmd.lchan.invalidate_content(f)
 
     def complete_delete_file(self, text, line, begidx, endidx) -> List[str]:
         """Command Line tab completion for DELETE FILE"""
@@ -67,6 +68,7 @@ class Ts102222Commands(CommandSet):
             return
         f = self._cmd.lchan.get_file_for_selectable(opts.NAME)
         (_data, _sw) = self._cmd.lchan.scc.terminate_df(f.fid)
+        self._cmd.lchan.invalidate_content(f)
 
     def complete_terminate_df(self, text, line, begidx, endidx) -> List[str]:
         """Command Line tab completion for TERMINATE DF"""
@@ -83,6 +85,7 @@ class Ts102222Commands(CommandSet):
             return
         f = self._cmd.lchan.get_file_for_selectable(opts.NAME)
         (_data, _sw) = self._cmd.lchan.scc.terminate_ef(f.fid)
+        self._cmd.lchan.invalidate_content(f)
 
     def complete_terminate_ef(self, text, line, begidx, endidx) -> List[str]:
         """Command Line tab completion for TERMINATE EF"""
@@ -214,6 +217,7 @@ class Ts102222Commands(CommandSet):
                FileSize(decoded=opts.file_size)]
         fcp = FcpTemplate(children=ies)
         (_data, _sw) = self._cmd.lchan.scc.resize_file(b2h(fcp.to_tlv()))
+        self._cmd.lchan.invalidate_content(f)
         # the resized file is automatically selected but our runtime state knows nothing of it
         self._cmd.lchan.select_file(self._cmd.lchan.selected_file)
 
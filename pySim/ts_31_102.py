@@ -1584,12 +1584,13 @@ class ADF_USIM(CardADF):
         authenticate_parser = argparse.ArgumentParser()
         authenticate_parser.add_argument('rand', type=is_hexstr, help='Random challenge')
         authenticate_parser.add_argument('autn', type=is_hexstr, help='Authentication Nonce')
-        #authenticate_parser.add_argument('--context', help='Authentication context', default='3G')
+        authenticate_parser.add_argument('--context', help='Authentication context', default='3g',
+                                         choices=['3g', 'gsm', 'gba'])
 
         @cmd2.with_argparser(authenticate_parser)
         def do_authenticate(self, opts):
             """Perform Authentication and Key Agreement (AKA)."""
-            (data, _sw) = self._cmd.lchan.scc.authenticate(opts.rand, opts.autn)
+            (data, _sw) = self._cmd.lchan.scc.authenticate(opts.rand, opts.autn, opts.context)
             self._cmd.poutput_json(data)
 
         term_prof_parser = argparse.ArgumentParser()
@@ -33,6 +33,7 @@ Hexstr = NewType('Hexstr', str)
 SwHexstr = NewType('SwHexstr', str)
 SwMatchstr = NewType('SwMatchstr', str)
 ResTuple = Tuple[Hexstr, SwHexstr]
+ResTupleBin = Tuple[bytes, bytes]
 
 def h2b(s: Hexstr) -> bytearray:
     """convert from a string of hex nibbles to a sequence of bytes"""
@@ -41,7 +42,13 @@ def h2b(s: Hexstr) -> bytearray:
 
 def b2h(b: bytearray) -> Hexstr:
     """convert from a sequence of bytes to a string of hex nibbles"""
-    return ''.join(['%02x' % (x) for x in b])
+    return bytes(b).hex()
+
+
+def restuple_b2h(res: ResTupleBin) -> ResTuple:
+    """convert a binary (data, sw) response tuple to its hex-string representation"""
+    (data, sw) = res
+    return (b2h(data) if data is not None else None, b2h(sw) if sw is not None else None)
 
 
 def h2i(s: Hexstr) -> List[int]:
@@ -51,7 +58,7 @@ def h2i(s: Hexstr) -> List[int]:
 
 def i2h(s: List[int]) -> Hexstr:
     """convert from a list of integers to a string of hex nibbles"""
-    return ''.join(['%02x' % (x) for x in s])
+    return bytes(s).hex()
 
 
 def h2s(s: Hexstr) -> str:
@@ -201,29 +208,44 @@ def comprehensiontlv_parse_one(binary: bytes) -> Tuple[dict, int, bytes, bytes]:
 # poor man's BER-TLV decoder. To be a more sophisticated OO library later
 #########################################################################
 
-def bertlv_parse_tag_raw(binary: bytes) -> Tuple[int, bytes]:
-    """Get a single raw Tag from start of input according to ITU-T X.690 8.1.2
+def bertlv_parse_tag_raw_at(binary: bytes, offset: int = 0) -> Tuple[Optional[int], int]:
+    """Get a single raw Tag at the given offset of the input according to ITU-T X.690 8.1.2,
+    without copying any part of the input.
     Args:
-            binary : binary input data of BER-TLV length field
+            binary : binary input data (bytes, bytearray or memoryview)
+            offset : offset of the Tag within binary
     Returns:
-    Tuple of (tag:int, remainder:bytes)
+    Tuple of (tag:int, offset_after_tag:int); tag is None in case of FF padding
     """
     # check for FF padding at the end, as customary in SIM card files
-    if binary[0] == 0xff and len(binary) == 1 or binary[0] == 0xff and binary[1] == 0xff:
-        return None, binary
-    tag = binary[0] & 0x1f
+    if binary[offset] == 0xff and (offset + 1 == len(binary) or binary[offset + 1] == 0xff):
+        return None, offset
+    tag = binary[offset] & 0x1f
     if tag <= 30:
-        return binary[0], binary[1:]
+        return binary[offset], offset + 1
     else:  # multi-byte tag
-        tag = binary[0]
-        i = 1
+        tag = binary[offset]
+        i = offset + 1
         last = False
         while not last:
             last = not bool(binary[i] & 0x80)
             tag <<= 8
             tag |= binary[i]
             i += 1
-        return tag, binary[i:]
+        return tag, i
+
+
+def bertlv_parse_tag_raw(binary: bytes) -> Tuple[int, bytes]:
+    """Get a single raw Tag from start of input according to ITU-T X.690 8.1.2
+    Args:
+            binary : binary input data of BER-TLV length field
+    Returns:
+    Tuple of (tag:int, remainder:bytes)
+    """
+    tag, offset = bertlv_parse_tag_raw_at(binary)
+    if tag is None:
+        return None, binary
+    return tag, binary[offset:]
 
 
 def bertlv_parse_tag(binary: bytes) -> Tuple[dict, bytes]:
@@ -303,6 +325,28 @@ def bertlv_encode_tag(t) -> bytes:
         return tag_bytes
 
 
+def bertlv_parse_len_at(binary: bytes, offset: int = 0) -> Tuple[int, int]:
+    """Parse a single Length value at the given offset of the input according to ITU-T X.690
+    8.1.3, without copying any part of the input; only the definite form is supported here.
+    Args:
+            binary : binary input data (bytes, bytearray or memoryview)
+            offset : offset of the Length within binary
+    Returns:
+            Tuple of (length, offset_after_length)
+    """
+    if binary[offset] < 0x80:
+        return (binary[offset], offset + 1)
+    else:
+        num_len_oct = binary[offset] & 0x7f
+        length = 0
+        if len(binary) < offset + num_len_oct + 1:
+            return (0, len(binary))
+        for i in range(offset + 1, offset + 1 + num_len_oct):
+            length <<= 8
+            length |= binary[i]
+        return (length, offset + 1 + num_len_oct)
+
+
 def bertlv_parse_len(binary: bytes) -> Tuple[int, bytes]:
     """Parse a single Length value according to ITU-T X.690 8.1.3;
     only the definite form is supported here.
@@ -311,17 +355,8 @@ def bertlv_parse_len(binary: bytes) -> Tuple[int, bytes]:
     Returns:
             Tuple of (length, remainder)
     """
-    if binary[0] < 0x80:
-        return (binary[0], binary[1:])
-    else:
-        num_len_oct = binary[0] & 0x7f
-        length = 0
-        if len(binary) < num_len_oct + 1:
-            return (0, b'')
-        for i in range(1, 1+num_len_oct):
-            length <<= 8
-            length |= binary[i]
-        return (length, binary[1+num_len_oct:])
+    length, offset = bertlv_parse_len_at(binary)
+    return (length, binary[offset:])
 
 
 def bertlv_encode_len(length: int) -> bytes:
@@ -354,12 +389,52 @@ def bertlv_parse_one(binary: bytes) -> Tuple[dict, int, bytes, bytes]:
             Tuple of (tag:dict, len:int, remainder:bytes)
     """
     (tagdict, remainder) = bertlv_parse_tag(binary)
-    (length, remainder) = bertlv_parse_len(remainder)
-    value = remainder[:length]
-    remainder = remainder[length:]
+    (length, offset) = bertlv_parse_len_at(remainder)
+    value = remainder[offset:offset+length]
+    remainder = remainder[offset+length:]
     return (tagdict, length, value, remainder)
 
 
+class BerTlvReader:
+    """Iterator over a concatenation of BER-TLV objects in a shared buffer.  Rather than
+    slicing off the remainder after each TLV (which copies the tail of the buffer for every
+    object and is hence quadratic), it yields (tag, offset, length) tuples, where tag is the
+    raw tag (like bertlv_parse_tag_raw), and offset/length describe the value part within
+    the buffer.  Iteration stops at the end of the buffer or at FF padding.
+
+    Example:
+        for tag, offset, length in BerTlvReader(buf):
+            value = buf[offset:offset+length]
+    """
+    def __init__(self, binary: bytes, offset: int = 0, end: Optional[int] = None):
+        """
+        Args:
+                binary : binary input data (bytes, bytearray or memoryview)
+                offset : offset within binary at which to start
+                end : offset within binary at which to stop (default: end of binary)
+        """
+        self.binary = binary
+        self.offset = offset
+        self.end = len(binary) if end is None else end
+        # offset of the start (tag) of the most recently returned TLV
+        self.tlv_offset = None
+
+    def __iter__(self):
+        return self
+
+    def __next__(self) -> Tuple[int, int, int]:
+        if self.offset >= self.end:
+            raise StopIteration
+        tag, offset = bertlv_parse_tag_raw_at(self.binary, self.offset)
+        if tag is None:
+            self.offset = self.end
+            raise StopIteration
+        length, offset = bertlv_parse_len_at(self.binary, offset)
+        self.tlv_offset = self.offset
+        self.offset = offset + length
+        return tag, offset, length
+
+
 def dgi_parse_tag_raw(binary: bytes) -> Tuple[int, bytes]:
     # In absence of any clear spec guidance we assume it's always 16 bit
     return int.from_bytes(binary[:2], 'big'), binary[2:]
@@ -396,6 +471,65 @@ def dgi_parse_len(binary: bytes) -> Tuple[int, bytes]:
     else:
         return binary[0], binary[1:]
 
+
+def atr_parse(atr: List[int]) -> dict:
+    """Parse the interface and historical bytes of an ATR (ISO/IEC 7816-3 Section 8.2).
+
+    Args:
+            atr : ATR as list of integers (or bytes)
+    Returns:
+            dict of interface bytes by name ('TA1', 'TD1', 'TC2', ...), the list of offered
+            protocols (key 'protocols') and the historical bytes (key 'historical_bytes')
+    """
+    result = {'protocols': []}
+    pos = 1
+    y = atr[pos] >> 4
+    i = 1
+    while True:
+        for j, name in enumerate(['TA', 'TB', 'TC', 'TD']):
+            if y & (1 << j):
+                pos += 1
+                result['%s%u' % (name, i)] = atr[pos]
+        if not y & 0x8:
+            break
+        td = result['TD%u' % i]
+        result['protocols'].append(td & 0x0f)
+        y = td >> 4
+        i += 1
+    num_hist = atr[1] & 0x0f
+    result['historical_bytes'] = bytes(atr[pos+1:pos+1+num_hist])
+    return result
+
+
+def compact_tlv_parse(binary: bytes) -> Dict[int, bytes]:
+    """Parse a sequence of COMPACT-TLV data objects (ISO/IEC 7816-4 Section 8.1.1.2), as used
+    in the historical bytes of an ATR.
+
+    Args:
+            binary : encoded COMPACT-TLV data objects
+    Returns:
+            dict of values by (4 bit) tag
+    """
+    result = {}
+    pos = 0
+    while pos < len(binary):
+        tag = binary[pos] >> 4
+        length = binary[pos] & 0x0f
+        result[tag] = binary[pos+1:pos+1+length]
+        pos += 1 + length
+    return result
+
+
+def atr_card_capabilities(atr: List[int]) -> Optional[bytes]:
+    """Return the card capabilities (ISO/IEC 7816-4 Section 8.1.1.2.7) from the historical bytes
+    of an ATR, if present."""
+    hist = atr_parse(atr)['historical_bytes']
+    # category indicator 0x80: historical bytes consist of COMPACT-TLV data objects
+    if len(hist) < 1 or hist[0] != 0x80:
+        return None
+    return compact_tlv_parse(hist[1:]).get(0x7, None)
+
+
 # IMSI encoded format:
 # For IMSI 0123456789ABCDE:
 #
@@ -1011,6 +1145,38 @@ def expand_hex(hexstring, length):
     return hexstring
 
 
+def changed_ranges(current: bytes, desired: bytes, gap: int = 0) -> List[Tuple[int, int]]:
+    """Determine the byte ranges in which two equally long binary strings differ.  Ranges separated
+    by not more than 'gap' identical bytes are coalesced into one.
+
+    Args:
+            current : current content
+            desired : desired content
+            gap : maximum number of identical bytes between two ranges to be coalesced
+    Returns:
+            list of (offset, length) tuples
+    """
+    if len(current) != len(desired):
+        raise ValueError('Cannot compare data of different length (%d vs. %d)' % (len(current), len(desired)))
+    if current == desired:
+        return []
+    ranges = []
+    start = None
+    end = 0
+    for i, (a, b) in enumerate(zip(current, desired)):
+        if a == b:
+            continue
+        if start is None:
+            start = i
+        elif i - end > gap:
+            ranges.append((start, end - start))
+            start = i
+        end = i + 1
+    if start is not None:
+        ranges.append((start, end - start))
+    return ranges
+
+
 class JsonEncoder(json.JSONEncoder):
     """Extend the standard library JSONEncoder with support for more types."""
 
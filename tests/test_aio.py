@@ -0,0 +1,149 @@
+#!/usr/bin/env python3
+
+import os
+import struct
+import asyncio
+import threading
+import argparse
+import tempfile
+import unittest
+from unittest import mock
+from pySim.exceptions import SwMatchError
+from pySim.commands import AsyncSimCardCommands
+from pySim.transport.aio import ExecutorLink
+from pySim.transport.calypso import AsyncCalypsoSimLink
+from pySim.transport.modem_atcmd_aio import AsyncModemATCommandLink
+from pySim.transport.simulated import SimulatedCard, SimulatedCardLink
+
+from test_transport import FakeModem
+
+def async_scc(link) -> AsyncSimCardCommands:
+    scc = AsyncSimCardCommands(link)
+    scc.cla_byte = '00'
+    scc.sel_ctrl = '0004'
+    return scc
+
+class InFlightCounter:
+    """Context manager keeping track of the maximum number of concurrently active blocks."""
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.current = 0
+        self.max = 0
+
+    def __enter__(self):
+        with self.lock:
+            self.current += 1
+            self.max = max(self.max, self.current)
+
+    def __exit__(self, *args):
+        with self.lock:
+            self.current -= 1
+
+class ExecutorLinkTest(unittest.TestCase):
+    def test_commands(self):
+        async def run():
+            sl = SimulatedCardLink(card=SimulatedCard.default_uicc())
+            scc = async_scc(ExecutorLink(sl))
+            await scc.update_binary(['3f00', '2fe2'], '98942143658709214365')
+            self.assertEqual(await scc.read_binary(['3f00', '2fe2']), ('98942143658709214365', '9000'))
+            self.assertEqual(await scc.record_count(['3f00', '2f00']), 2)
+            await scc.update_record('2f00', 2, 'aabbcc')
+            data, _sw = await scc.read_record('2f00', 2)
+            self.assertTrue(data.startswith('aabbccff'))
+            # repeated selection of the same path is served from the selection cache
+            await scc.read_binary(['3f00', '2fe2'])
+            count = sl.apdu_count
+            await scc.read_binary(['3f00', '2fe2'])
+            self.assertEqual(sl.apdu_count - count, 1)
+            with self.assertRaises(SwMatchError):
+                await scc.select_file('6f99')
+        asyncio.run(run())
+
+    def test_concurrency(self):
+        """Cards with a response time of 20ms each are driven concurrently from one event loop."""
+        in_flight = InFlightCounter()
+        class CountingLink(SimulatedCardLink):
+            def _send_apdu_raw_bin(self, pdu):
+                with in_flight:
+                    return super()._send_apdu_raw_bin(pdu)
+        async def provision(scc, iccid):
+            await scc.update_binary(['3f00', '2fe2'], iccid)
+            return (await scc.read_binary(['3f00', '2fe2']))[0]
+        async def run():
+            opts = argparse.Namespace(sim_seed=None, sim_latency=20.0)
+            sccs = [async_scc(ExecutorLink(CountingLink(opts, card=SimulatedCard.default_uicc())))
+                    for i in range(20)]
+            iccids = ['98%018u' % i for i in range(len(sccs))]
+            result = await asyncio.gather(*[provision(scc, iccid) for scc, iccid in zip(sccs, iccids)])
+            self.assertEqual(result, iccids)
+            # the APDUs to the different cards overlap rather than being sent one after another
+            self.assertGreater(in_flight.max, 1)
+        asyncio.run(run())
+
+    def test_lchan_lock(self):
+        """Concurrent tasks on the same link do not interleave their commands and GET RESPONSE."""
+        async def run():
+            link = ExecutorLink(SimulatedCardLink(card=SimulatedCard.default_uicc()))
+            rsps = await asyncio.gather(*[link.send_apdu('00a40004023f00') for i in range(10)])
+            for data, sw in rsps:
+                self.assertEqual(sw, '9000')
+                self.assertTrue(data.startswith('62'))
+        asyncio.run(run())
+
+class AsyncModemATCommandLinkTest(unittest.TestCase):
+    def test_csim(self):
+        async def run():
+            opts = argparse.Namespace(modem_dev='/dev/null', modem_baud=115200, modem_channel_aid=None)
+            with mock.patch('serial.Serial', lambda *args, **kwargs: FakeModem(*args, **kwargs, echo=True)):
+                sl = AsyncModemATCommandLink(opts)
+            await sl.connect()
+            self.assertTrue(sl._echo)
+            scc = async_scc(sl)
+            self.assertEqual(await scc.record_count(['3f00', '2f00']), 2)
+            data, sw = await scc.read_record('2f00', 1)
+            self.assertEqual(sw, '9000')
+            self.assertTrue(data.startswith('61'))
+            sl.close()
+        asyncio.run(run())
+
+class AsyncCalypsoSimLinkTest(unittest.TestCase):
+    async def osmocon(self, reader, writer):
+        """Minimal emulation of osmocon + OsmocomBB firmware with a simulated card."""
+        card = SimulatedCard.default_uicc()
+        while True:
+            try:
+                msg_len = struct.unpack('!H', await reader.readexactly(2))[0]
+            except asyncio.IncompleteReadError:
+                break
+            msg = await reader.readexactly(msg_len)
+            if msg[0] == 0x0d:
+                rsp = b'\x0e\x00\x00\x00'
+            else:
+                data, sw = card.process_apdu(msg[4:])
+                rsp = b'\x17\x00\x00\x00' + data + sw
+            writer.write(struct.pack('!H', len(rsp)) + rsp)
+        writer.close()
+
+    def test_apdu(self):
+        async def run():
+            with tempfile.TemporaryDirectory() as tmpdir:
+                path = os.path.join(tmpdir, 'osmocom_l2')
+                server = await asyncio.start_unix_server(self.osmocon, path)
+                sl = AsyncCalypsoSimLink(argparse.Namespace(osmocon_sock=path))
+                await sl.connect()
+                data, sw = await sl.send_apdu_raw('00a40004022fe2')
+                self.assertEqual(data, '')
+                self.assertTrue(sw.startswith('61'))
+                data, sw = await sl.send_apdu('00a40004022fe2')
+                self.assertEqual(sw, '9000')
+                self.assertTrue(data.startswith('62'))
+                await sl.disconnect()
+                # let the osmocon emulation notice the closed connection
+                await asyncio.sleep(0.01)
+                server.close()
+                await server.wait_closed()
+        with mock.patch('builtins.print'):
+            asyncio.run(run())
+
+if __name__ == "__main__":
+	unittest.main()
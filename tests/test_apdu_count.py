@@ -0,0 +1,72 @@
+#!/usr/bin/env python3
+
+# Regression test for the number of APDUs the pySim programs exchange with a (simulated) card.  Since
+# the time it takes to process a card is dominated by the number of APDUs, an increase of the APDU
+# count of any of these typical operations is a performance regression (and a decrease should be
+# reflected by adjusting the expected count).
+
+import os
+import sys
+import json
+import time
+import logging
+import tempfile
+import unittest
+import subprocess
+
+log = logging.getLogger(__name__)
+
+TOP_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+
+# ATR of a sysmoISIM-SJA2, so that pySim-prog can auto-detect the card type
+SJA2_ATR = '3b9f96801f878031e073fe211b674a4c753034054ba9'
+
+class ApduCountTest(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def tmpfile(self, name: str, content: str = None) -> str:
+        path = os.path.join(self.tmpdir.name, name)
+        if content is not None:
+            with open(path, 'w') as f:
+                f.write(content)
+        return path
+
+    def run_simulated(self, prog: str, *args) -> int:
+        """Run one of the pySim programs on a simulated card and return the number of APDUs exchanged."""
+        stats = self.tmpfile('apdu-stats.json')
+        cmd = [sys.executable, os.path.join(TOP_DIR, prog), '--simulated-card', '--apdu-stats', stats] + list(args)
+        t_start = time.perf_counter()
+        subprocess.run(cmd, check=True, stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL,
+                       stderr=subprocess.PIPE, cwd=self.tmpdir.name, timeout=120)
+        duration = time.perf_counter() - t_start
+        with open(stats) as f:
+            count = json.load(f)['total']['count']
+        log.info('%s %s: %u APDUs, %.3f s wall time', prog, ' '.join(args), count, duration)
+        return count
+
+    def test_export(self):
+        self.assertEqual(self.run_simulated('pySim-shell.py', 'export'), 990)
+
+    def test_bulk_script(self):
+        script = self.tmpfile('script.txt', 'select MF\nselect EF.ICCID\nread_binary\n')
+        # a card handler which supplies exactly one card
+        flag = self.tmpfile('card-fetched')
+        handler = self.tmpfile('card-handler.yaml', "get: 'test ! -e %s && touch %s'\n"
+                               "done: 'true'\nerror: 'true'\n" % (flag, flag))
+        self.assertEqual(self.run_simulated('pySim-shell.py', '--card_handler', handler,
+                                            'bulk_script', script), 63)
+
+    def test_prog(self):
+        with open(os.path.join(TOP_DIR, 'pysim-testdata', 'sysmoISIM-SJA2.data')) as f:
+            data = dict([l.strip().split('=', 1) for l in f if '=' in l])
+        self.assertEqual(self.run_simulated('pySim-prog.py', '--sim-atr', SJA2_ATR, '-t', 'auto',
+                                            '-x', data['MCC'], '-y', data['MNC'], '-s', data['ICCID'],
+                                            '-i', data['IMSI'], '-k', data['KI'], '-o', data['OPC'],
+                                            '-a', data['ADM'], '--msisdn', '6766266'), 151)
+
+if __name__ == "__main__":
+	unittest.main()
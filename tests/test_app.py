@@ -0,0 +1,26 @@
+#!/usr/bin/env python3
+
+import unittest
+from pySim.app import card_applications
+from pySim.filesystem import CardApplication, LazyCardApplication
+
+class LazyCardApplicationTest(unittest.TestCase):
+    def test_card_applications(self):
+        apps = card_applications()
+        names = [a.name for a in apps]
+        for name in ['USIM', 'ISIM', 'ARA-M', 'ADF.ISD-R']:
+            self.assertIn(name, names)
+        # no application class may be registered twice (lazy + already imported)
+        self.assertEqual(len(names), len(set(names)))
+
+    def test_load(self):
+        for lazy_app in card_applications():
+            if not isinstance(lazy_app, LazyCardApplication):
+                continue
+            app = lazy_app.load()
+            self.assertIsInstance(app, CardApplication)
+            self.assertEqual(app.name, lazy_app.name)
+            self.assertEqual(app.aid, lazy_app.aid)
+
+if __name__ == "__main__":
+	unittest.main()
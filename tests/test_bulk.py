@@ -0,0 +1,43 @@
+#!/usr/bin/env python3
+
+import unittest
+from pySim.bulk import BulkEngine, resolve_pcsc_readers
+
+READERS = ['Alcor Micro AU9540 00 00', 'Identiv uTrust 4701 F 01 00', 'Identiv uTrust 4701 F 02 00']
+
+class ResolveReadersTest(unittest.TestCase):
+    def test_index_and_regex(self):
+        self.assertEqual(resolve_pcsc_readers(['2', 'Alcor'], READERS), [0, 2])
+        self.assertEqual(resolve_pcsc_readers(['uTrust', '1'], READERS), [1, 2])
+
+    def test_no_match(self):
+        with self.assertRaises(ValueError):
+            resolve_pcsc_readers(['3'], READERS)
+        with self.assertRaises(ValueError):
+            resolve_pcsc_readers(['Gemalto'], READERS)
+
+class BulkEngineTest(unittest.TestCase):
+    def test_run(self):
+        attempts = []
+        def job(reader):
+            attempts.append(reader)
+            if reader == 1:
+                raise IOError('card mute')
+            return True, 'transcript %u' % reader
+        stats = BulkEngine(job, tries=2).run([0, 1, 2])
+        self.assertEqual(stats.success_count, 2)
+        self.assertEqual(stats.fail_count, 1)
+        self.assertEqual([r.reader for r in stats.results], [0, 1, 2])
+        self.assertEqual(stats.results[2].transcript, 'transcript 2')
+        self.assertEqual(stats.results[1].tries, 2)
+        self.assertEqual(sorted(attempts), [0, 1, 1, 2])
+
+    def test_halt_on_error(self):
+        def job(reader):
+            return reader != 1, 'transcript %u' % reader
+        stats = BulkEngine(job, max_workers=1).run([0, 1, 2], halt_on_error=True)
+        self.assertEqual([r.reader for r in stats.results], [0, 1])
+        self.assertEqual(stats.fail_count, 1)
+
+if __name__ == "__main__":
+	unittest.main()
@@ -0,0 +1,226 @@
+#!/usr/bin/env python3
+
+import unittest
+from pySim.utils import h2i
+from pySim.commands import SimCardCommands, EXT_APDU_LEN_DEFAULT
+
+from test_transport import ScriptedLink
+
+# FCP of a 4 byte transparent EF with FID 6f07 (file size tag 80 = 0004)
+FCP_EF = '621f8202412183026f07a506c00100ca01808a01058b036f060280020004880138'
+
+def uicc_scc(script) -> SimCardCommands:
+    scc = SimCardCommands(ScriptedLink(script))
+    scc.cla_byte = '00'
+    scc.sel_ctrl = '0004'
+    return scc
+
+class SelectionCacheTest(unittest.TestCase):
+    def test_update_binary_conserve(self):
+        """update_binary(conserve=True) must only SELECT once."""
+        scc = uicc_scc([('00a40004026f07', FCP_EF + '9000'),
+                        ('00b0000004', '010203049000'),
+                        ('00d6000004aabbccdd', '9000')])
+        scc.update_binary('6f07', 'aabbccdd', conserve=True)
+        self.assertEqual(scc._tp.script, [])
+
+    def test_invalidate_on_select(self):
+        scc = uicc_scc([('00a40004026f07', FCP_EF + '9000'),
+                        ('00a40004023f00', '9000'),
+                        ('00a40004026f07', FCP_EF + '9000'),
+                        ('00b0000004', '010203049000')])
+        scc.binary_size('6f07')
+        scc.select_file('3f00')
+        self.assertEqual(scc.read_binary('6f07'), ('01020304', '9000'))
+        self.assertEqual(scc._tp.script, [])
+
+    def test_invalidate_on_error(self):
+        scc = uicc_scc([('00a40004026f07', FCP_EF + '9000'),
+                        ('00b0000004', '6982'),
+                        ('00a40004026f07', FCP_EF + '9000')])
+        with self.assertRaises(ValueError):
+            scc.read_binary('6f07')
+        self.assertEqual(scc.binary_size('6f07'), 4)
+        self.assertEqual(scc._tp.script, [])
+
+    def test_shared_between_lchan_forks(self):
+        scc = uicc_scc([('00a40004026f07', FCP_EF + '9000'),
+                        ('00a40004026f07', FCP_EF + '9000')])
+        fork = scc.fork_lchan(0)
+        scc.binary_size('6f07')
+        fork.binary_size('6f07')
+        scc.reset_card()
+        fork.binary_size('6f07')
+        self.assertEqual(scc._tp.script, [])
+
+class SfiTest(unittest.TestCase):
+    def test_read_binary_sfi(self):
+        scc = uicc_scc([('00b0870004', '010203049000')])
+        self.assertEqual(scc.read_binary_sfi(7, 4), ('01020304', '9000'))
+        self.assertEqual(scc._tp.script, [])
+
+    def test_read_binary_sfi_until_end(self):
+        scc = uicc_scc([('00b08702ff', '01026282')])
+        self.assertEqual(scc.read_binary_sfi(7, offset=2), ('0102', '9000'))
+
+    def test_read_binary_sfi_invalid(self):
+        scc = uicc_scc([])
+        with self.assertRaises(ValueError):
+            scc.read_binary_sfi(31, 4)
+        with self.assertRaises(ValueError):
+            scc.read_binary_sfi(7, 4, offset=256)
+
+    def test_read_record_sfi(self):
+        scc = uicc_scc([('00b2013c00', '6c03'), ('00b2013c03', 'aabbcc9000')])
+        self.assertEqual(scc.read_record_sfi(7, 1), ('aabbcc', '9000'))
+        self.assertEqual(scc._tp.script, [])
+
+    def test_read_records_sfi(self):
+        scc = uicc_scc([('00b2013c00', '6c02'), ('00b2013c02', 'aabb9000'), ('00b2023c02', 'ccdd9000'),
+                        ('00b2033c02', '6a83')])
+        self.assertEqual(list(scc.read_records_sfi(7)), [(1, 'aabb'), (2, 'ccdd')])
+        self.assertEqual(scc._tp.script, [])
+        scc = uicc_scc([('00b2023c02', 'ccdd9000'), ('00b2033c02', 'ffff9000')])
+        self.assertEqual(list(scc.read_records_sfi(7, 2, 5, 2, stop_on_empty=True)), [(2, 'ccdd')])
+        self.assertEqual(scc._tp.script, [])
+
+    def test_sfi_invalidates_sel_cache(self):
+        scc = uicc_scc([('00a40004026f07', FCP_EF + '9000'),
+                        ('00b0870004', '010203049000'),
+                        ('00a40004026f07', FCP_EF + '9000')])
+        scc.binary_size('6f07')
+        scc.read_binary_sfi(7, 4)
+        scc.binary_size('6f07')
+        self.assertEqual(scc._tp.script, [])
+
+class ExtendedLengthTest(unittest.TestCase):
+    # T=1, card capabilities in historical bytes indicate extended Lc/Le support
+    ATR = h2i('3b880180730000400000005d')
+    # 12 byte EF.ATR
+    FCP_EF_ATR = '620c8202412183022f018002000c'
+
+    def t1_scc(self, script, atr=ATR) -> SimCardCommands:
+        scc = uicc_scc(script)
+        scc._tp.protocol = 1
+        scc._tp.get_atr = lambda: atr
+        return scc
+
+    def test_atr(self):
+        scc = self.t1_scc([('00a40004023f0000', '6a82')])
+        scc.probe_extended_length()
+        self.assertEqual((scc.ext_cmd_len, scc.ext_rsp_len), (EXT_APDU_LEN_DEFAULT, EXT_APDU_LEN_DEFAULT))
+        self.assertEqual(scc.fork_lchan(1).max_cmd_len, EXT_APDU_LEN_DEFAULT)
+
+    def test_ef_atr(self):
+        # extended length information: 1033 bytes command APDU, 2050 bytes response APDU
+        ef_atr = '7f660802020409020208029000'
+        scc = self.t1_scc([('00a40004023f0000', '62008202782183023f009000'),
+                           ('00a40004022f0100', self.FCP_EF_ATR + '9000'),
+                           ('00b000000c', ef_atr)], atr=h2i('3b80800101'))
+        scc.probe_extended_length()
+        self.assertEqual((scc.ext_cmd_len, scc.ext_rsp_len), (1024, 2048))
+        scc._tp.script = [('00a40004026f0700', '620c8202412183026f07800208009000'),
+                          ('00b0000000' + '0800', 'aa' * 2048 + '9000')]
+        self.assertEqual(scc.read_binary('6f07'), ('aa' * 2048, '9000'))
+        scc._tp.script = [('00d6000000' + '0400' + 'bb' * 1024, '9000'),
+                          ('00d6040000' + '0400' + 'bb' * 1024, '9000')]
+        scc.update_binary('6f07', 'bb' * 2048)
+        self.assertEqual(scc._tp.script, [])
+
+    def test_t0(self):
+        scc = uicc_scc([])
+        scc._tp.get_atr = lambda: self.ATR
+        scc.probe_extended_length()
+        self.assertEqual(scc.max_cmd_len, 255)
+        self.assertEqual(scc.encode_le(256), '00')
+        self.assertEqual(scc.encode_le(1024), '000400')
+        self.assertEqual(scc.encode_lc(1024), '000400')
+
+class DeltaWriteTest(unittest.TestCase):
+    # FCP of a 32 byte transparent EF with FID 6f07
+    FCP_EF32 = FCP_EF.replace('80020004', '80020020')
+
+    def test_update_binary_ranges(self):
+        current = '00' * 32
+        desired = 'aa' + '00' * 9 + 'bbcc' + '00' * 3 + 'dd' + '00' * 15 + 'ee'
+        scc = uicc_scc([('00a40004026f07', self.FCP_EF32 + '9000'),
+                        ('00b0000020', current + '9000'),
+                        ('00d6000001aa', '9000'),
+                        ('00d6000a06bbcc000000dd', '9000'),
+                        ('00d6001f01ee', '9000')])
+        scc.conserve_gap = 4
+        self.assertEqual(scc.update_binary('6f07', desired, conserve=True), ('', '9000'))
+        self.assertEqual(scc._tp.script, [])
+
+    def test_update_binary_unchanged(self):
+        scc = uicc_scc([('00a40004026f07', self.FCP_EF32 + '9000'),
+                        ('00b0000010', 'AB' * 16 + '9000')])
+        self.assertEqual(scc.update_binary('6f07', 'AB' * 16, conserve=True), (None, '9000'))
+        self.assertEqual(scc._tp.script, [])
+
+    def test_update_binary_unreadable(self):
+        scc = uicc_scc([('00a40004026f07', self.FCP_EF32 + '9000'),
+                        ('00b0000002', '6982'),
+                        ('00a40004026f07', self.FCP_EF32 + '9000'),
+                        ('00d6000002aabb', '9000')])
+        scc.update_binary('6f07', 'aabb', conserve=True)
+        self.assertEqual(scc._tp.script, [])
+
+class ReadRecordsTest(unittest.TestCase):
+    # FCP of a linear fixed EF with FID 6f01, 3 records of 3 bytes
+    FCP_EF_REC = '621a8205422100030383026f018a01058b036f06018002000988010c'
+
+    def test_absolute(self):
+        scc = uicc_scc([('00a40004026f01', self.FCP_EF_REC + '9000'),
+                        ('00b2020403', '0102039000'),
+                        ('00b2030403', '0405069000')])
+        self.assertEqual(list(scc.read_records('6f01', first=2)), [(2, '010203'), (3, '040506')])
+        self.assertEqual(scc._tp.script, [])
+
+    def test_next(self):
+        scc = uicc_scc([('00a40004026f01', self.FCP_EF_REC + '9000'),
+                        ('00a40004026f01', self.FCP_EF_REC + '9000'),
+                        ('00b2000203', '0102039000'),
+                        ('00b2000203', 'ffffff9000')])
+        scc.record_size('6f01')
+        # the EF is selected again, to reset the record pointer
+        self.assertEqual(list(scc.read_records('6f01', next_mode=True, stop_on_empty=True)), [(1, '010203')])
+        self.assertEqual(scc._tp.script, [])
+        with self.assertRaises(ValueError):
+            list(scc.read_records('6f01', first=2, next_mode=True))
+
+class AuthenticateTest(unittest.TestCase):
+    RAND = '00112233445566778899aabbccddeeff'
+    AUTN = 'ffeeddccbbaa99887766554433221100'
+
+    def test_batch(self):
+        scc = uicc_scc([('008800812210' + self.RAND + '10' + self.AUTN, '6115'),
+                        ('00c0000015', 'db04a1a2a3a402b1b202c1c208d1d2d3d4d5d6d7d89000'),
+                        ('008800812210' + self.RAND + '10' + self.AUTN, '9862'),
+                        ('008800812210' + self.RAND + '10' + self.AUTN, 'dc0e' + '11' * 14 + '9000')])
+        res = list(scc.authenticate_batch([(self.RAND, self.AUTN)] * 3))
+        self.assertEqual(res[0], ({'successful_3g_authentication': {'res': 'a1a2a3a4', 'ck': 'b1b2',
+                                    'ik': 'c1c2', 'kc': 'd1d2d3d4d5d6d7d8'}}, '9000'))
+        self.assertEqual(res[1], (None, '9862'))
+        self.assertEqual(res[2], ({'synchronisation_failure': {'auts': '11' * 14}}, '9000'))
+        self.assertEqual(scc._tp.script, [])
+
+    def test_gsm_context(self):
+        scc = uicc_scc([('008800801110' + self.RAND, '04a1a2a3a408d1d2d3d4d5d6d7d89000')])
+        self.assertEqual(scc.authenticate(self.RAND, None, context='gsm'),
+                         ({'successful_gsm_authentication': {'sres': 'a1a2a3a4', 'kc': 'd1d2d3d4d5d6d7d8'}}, '9000'))
+
+    def test_gba_context(self):
+        scc = uicc_scc([('0088008423dd10' + self.RAND + '10' + self.AUTN, 'db04a1a2a3a49000')])
+        self.assertEqual(scc.authenticate(self.RAND, self.AUTN, context='gba'),
+                         ({'successful_gba_authentication': {'res': 'a1a2a3a4'}}, '9000'))
+
+    def test_2g(self):
+        scc = uicc_scc([('00a40004023f00', '9000'), ('00a40004027f20', '9000'),
+                        ('a088000010' + self.RAND, 'a1a2a3a4d1d2d3d4d5d6d7d89000')])
+        res = list(scc.authenticate_batch([(self.RAND, None)], context='2g'))
+        self.assertEqual(res, [({'successful_gsm_authentication': {'sres': 'a1a2a3a4',
+                                                                     'kc': 'd1d2d3d4d5d6d7d8'}}, '9000')])
+
+if __name__ == "__main__":
+	unittest.main()
@@ -15,17 +15,35 @@
 # You should have received a copy of the GNU General Public License
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
+import os
 import unittest
 import logging
 import base64
+import tempfile
 
 from pySim.utils import b2h, h2b
 from pySim.esim.bsp import *
 import pySim.esim.rsp as rsp
-from pySim.esim import ActivationCode
+from pySim.esim import ActivationCode, LazyAsn1
 
 from cryptography.hazmat.primitives.asymmetric import ec
 
+class TestLazyAsn1(unittest.TestCase):
+    def test_compile_cache(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            os.environ['PYSIM_ASN1_CACHE_DIR'] = tmpdir
+            try:
+                asn1 = LazyAsn1('rsp')
+                # nothing is compiled before first use
+                self.assertEqual(os.listdir(tmpdir), [])
+                enc = asn1.encode('CancelSessionResponse', ('cancelSessionResponseError', 1))
+                self.assertEqual(len(os.listdir(tmpdir)), 1)
+                # a fresh instance must load the cached specification
+                self.assertEqual(LazyAsn1('rsp').decode('CancelSessionResponse', enc),
+                                 ('cancelSessionResponseError', 1))
+            finally:
+                del os.environ['PYSIM_ASN1_CACHE_DIR']
+
 class TestActivationCode(unittest.TestCase):
     def test_de_encode(self):
         STRS = ['1$SMDP.GSMA.COM$04386-AGYFT-A74Y8-3F815',
@@ -0,0 +1,74 @@
+#!/usr/bin/env python3
+
+import os
+import json
+import tempfile
+import unittest
+from pySim.transport.metrics import ApduMetrics
+
+from test_transport import ScriptedLink, StormLink
+
+class ApduMetricsTest(unittest.TestCase):
+    def test_link(self):
+        link = ScriptedLink([('00a40004022fe2', '6120'),
+                             ('00c0000020', '62' + '00' * 30 + '9000'),
+                             ('00b0000000', '6c0a'),
+                             ('00b000000a', '98942143658709214365' + '9000'),
+                             ('00b2010c00', '9000')])
+        link.metrics = ApduMetrics()
+        link.send_apdu('00a40004022fe2')
+        link.send_apdu('00b0000000')
+        link.send_apdu('00b2010c00')
+        m = link.metrics.to_dict()
+        self.assertEqual(m['total']['count'], 5)
+        self.assertEqual(m['total']['bytes_out'], 7 + 5 + 5 + 5 + 5)
+        self.assertEqual(m['total']['bytes_in'], 2 + 33 + 2 + 12 + 2)
+        self.assertEqual(m['per_ins']['a4']['count'], 1)
+        self.assertEqual(m['per_ins']['b0']['count'], 2)
+        self.assertEqual(m['per_ins']['c0']['bytes_in'], 33)
+        # GET RESPONSE and READ BINARY are accounted to the file selected before
+        self.assertEqual(m['per_file']['2fe2']['count'], 4)
+        self.assertEqual(m['per_file']['sfi01']['count'], 1)
+        self.assertEqual(m['events']['get_response']['count'], 1)
+        self.assertEqual(m['events']['le_retry']['count'], 1)
+        self.assertEqual(m['total']['buckets']['+Inf'], 5)
+
+    def test_proactive_fetch(self):
+        link = StormLink(2)
+        link.metrics = ApduMetrics()
+        link.send_apdu_checksw('a0f2000016')
+        self.assertEqual(link.metrics.events['proactive_fetch']['count'], 2)
+        self.assertEqual(link.metrics.per_ins[0x12].count, 2)
+        self.assertEqual(link.metrics.per_ins[0x14].count, 2)
+
+    def test_lchan(self):
+        m = ApduMetrics()
+        m.record_apdu(bytes.fromhex('00a40004026f07'), b'', b'\x90\x00', 0.002)
+        m.record_apdu(bytes.fromhex('01a40004026f08'), b'', b'\x90\x00', 0.002)
+        m.record_apdu(bytes.fromhex('00b0000009'), b'\x00' * 9, b'\x90\x00', 0.02)
+        m.record_apdu(bytes.fromhex('01b0000009'), b'\x00' * 9, b'\x90\x00', 3.0)
+        self.assertEqual(m.per_file['6f07'].count, 2)
+        self.assertEqual(m.per_file['6f08'].count, 2)
+        self.assertEqual(m.per_file['6f08'].cumulative_buckets()[-2:], [1, 2])
+
+    def test_write(self):
+        m = ApduMetrics()
+        m.record_apdu(bytes.fromhex('00a40004022fe2'), b'', b'\x90\x00', 0.003)
+        with tempfile.TemporaryDirectory() as tmpdir:
+            path = os.path.join(tmpdir, 'stats')
+            m.write(path)
+            with open(path) as f:
+                self.assertEqual(json.load(f)['per_file']['2fe2']['count'], 1)
+            m.write(path, 'prometheus')
+            with open(path) as f:
+                prom = f.read()
+            self.assertIn('pysim_apdu_duration_seconds_bucket{ins="a4",le="0.005"} 1', prom)
+            self.assertIn('pysim_apdu_duration_seconds_bucket{ins="a4",le="0.0025"} 0', prom)
+            self.assertIn('pysim_file_apdu_duration_seconds_count{file="2fe2"} 1', prom)
+            self.assertIn('pysim_apdu_bytes_out_total{ins="a4"} 7', prom)
+            self.assertEqual(os.listdir(tmpdir), ['stats'])
+        m.reset()
+        self.assertEqual(m.total.count, 0)
+
+if __name__ == "__main__":
+	unittest.main()
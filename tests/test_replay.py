@@ -0,0 +1,76 @@
+#!/usr/bin/env python3
+
+import os
+import tempfile
+import unittest
+from pySim.exceptions import ProtocolError
+from pySim.commands import SimCardCommands
+from pySim.transport.simulated import SimulatedCard, SimulatedCardLink, SimulatedFile
+from pySim.transport.replay import ApduRecorder, ReplayLink, read_recording
+
+class ReplayTest(unittest.TestCase):
+    def setUp(self):
+        fd, self.filename = tempfile.mkstemp()
+        os.close(fd)
+        os.unlink(self.filename)
+        card = SimulatedCard()
+        ef = card.mf.add_child(SimulatedFile('2fe2', 'EF.ICCID', 'transparent'))
+        ef.data = bytearray(b'\x98\x94\x21\x43\x65\x87\x09\x21\x43\x65')
+        self.sl = SimulatedCardLink(card=card)
+
+    def tearDown(self):
+        if os.path.exists(self.filename):
+            os.unlink(self.filename)
+
+    def record(self):
+        recorder = ApduRecorder(self.filename, link=self.sl)
+        self.sl.apdu_tracer = recorder
+        scc = SimCardCommands(self.sl)
+        scc.cla_byte = '00'
+        scc.sel_ctrl = '0004'
+        result = scc.read_binary(['3f00', '2fe2'])
+        recorder.close()
+        return result
+
+    def replay_scc(self, **kwargs) -> SimCardCommands:
+        session = read_recording(self.filename)[-1]
+        scc = SimCardCommands(ReplayLink(session=session, **kwargs))
+        scc.cla_byte = '00'
+        scc.sel_ctrl = '0004'
+        return scc
+
+    def test_replay(self):
+        result = self.record()
+        scc = self.replay_scc()
+        self.assertEqual(scc.get_atr(), self.sl.get_atr())
+        self.assertEqual(scc.read_binary(['3f00', '2fe2']), result)
+        self.assertEqual(scc._tp.remaining, 0)
+        # replay again
+        scc._tp.rewind()
+        scc.invalidate_sel_cache()
+        self.assertEqual(scc.read_binary(['3f00', '2fe2']), result)
+
+    def test_mismatch(self):
+        self.record()
+        scc = self.replay_scc()
+        with self.assertRaises(ProtocolError):
+            scc.read_binary(['3f00', '2f00'])
+
+    def test_sessions(self):
+        self.record()
+        self.record()
+        sessions = read_recording(self.filename)
+        self.assertEqual(len(sessions), 2)
+        self.assertEqual([str(r) for r in sessions[0].records], [str(r) for r in sessions[1].records])
+
+    def test_truncated(self):
+        self.record()
+        with open(self.filename, 'rb+') as f:
+            f.truncate(os.path.getsize(self.filename) - 1)
+        records = read_recording(self.filename)[0].records
+        scc = self.replay_scc()
+        self.assertEqual(scc._tp.remaining, len(records))
+        self.assertGreater(len(records), 0)
+
+if __name__ == "__main__":
+	unittest.main()
@@ -0,0 +1,167 @@
+#!/usr/bin/env python3
+
+import unittest
+from pySim.runtime import ContentCache
+from pySim.filesystem import CardDF, TransparentEF, WalkPlan
+from pySim.transport.simulated import SimulatedCardLink
+from pySim.transport.metrics import ApduMetrics
+from pySim.app import init_card
+
+class ContentCacheTest(unittest.TestCase):
+    def setUp(self):
+        self.sl = SimulatedCardLink()
+        self.rs, _card = init_card(self.sl)
+        self.rs.content_cache = ContentCache()
+        self.lchan = self.rs.lchan[0]
+
+    def assertNoApdus(self, func, *args):
+        count = self.sl.apdu_count
+        ret = func(*args)
+        self.assertEqual(self.sl.apdu_count, count)
+        return ret
+
+    def test_binary(self):
+        self.lchan.select('MF/EF.ICCID')
+        data, sw = self.lchan.read_binary()
+        self.assertNoApdus(self.lchan.read_binary)
+        self.lchan.update_binary('aabb', 2)
+        expected = data[:4] + 'aabb' + data[8:]
+        self.assertEqual(self.assertNoApdus(self.lchan.read_binary), (expected, '9000'))
+        self.assertEqual(self.assertNoApdus(self.lchan.read_binary, 2, 2), ('aabb', '9000'))
+        # the write went through to the card
+        self.rs.content_cache.invalidate()
+        self.assertEqual(self.lchan.read_binary(), (expected, '9000'))
+
+    def test_record(self):
+        self.lchan.select('MF/EF.DIR')
+        data, sw = self.lchan.read_record(1)
+        self.assertEqual(self.assertNoApdus(self.lchan.read_record, 1), (data, sw))
+        self.lchan.update_record(1, 'aabb')
+        self.assertEqual(self.assertNoApdus(self.lchan.read_record, 1)[0], 'aabb' + 'ff' * (len(data) // 2 - 2))
+
+    def test_read_records(self):
+        self.rs.content_cache = None
+        self.lchan.select('MF/EF.DIR')
+        recs = [(r, self.lchan.read_record(r)[0]) for r in range(1, 1 + self.lchan.selected_file_num_of_rec())]
+        self.assertEqual(list(self.lchan.read_records()), recs)
+        self.assertEqual(list(self.lchan.read_records(next_mode=True)), recs)
+        self.assertEqual(list(self.lchan.read_records(range(2, 3))), recs[1:2])
+        self.lchan.update_record(2, 'ff' * (len(recs[1][1]) // 2))
+        self.assertEqual(list(self.lchan.read_records(stop_on_empty=True)), recs[:1])
+
+    def test_read_records_sfi(self):
+        self.rs.content_cache = None
+        self.lchan.select('MF/EF.DIR')
+        recs = list(self.lchan.read_records())
+        self.rs.use_sfi = True
+        self.lchan.select('MF')
+        ef_dir = self.rs.mf.lookup_file_by_name('EF.DIR')
+        # read without SELECT, until the card reports the end of the file
+        before = self.sl.apdu_count
+        self.assertEqual(list(self.lchan.read_ef_records(ef_dir)), recs)
+        self.assertEqual(self.lchan.selected_file, self.rs.mf)
+        # one extra READ RECORD to learn the record length, one beyond the last record
+        self.assertEqual(self.sl.apdu_count - before, len(recs) + 2)
+        self.assertEqual(self.lchan.read_ef_record(ef_dir, 2)[0], recs[1][1])
+        # the selected EF is read via SFI, with the record length known from its FCP
+        self.lchan.select('EF.DIR')
+        before = self.sl.apdu_count
+        self.assertEqual(list(self.lchan.read_records()), recs)
+        self.assertEqual(self.lchan.read_record(1)[0], recs[0][1])
+        self.assertEqual(self.sl.apdu_count - before, len(recs) + 1)
+
+    def test_update_binary_sfi(self):
+        self.rs.content_cache = None
+        self.rs.use_sfi = True
+        self.lchan.select('MF/EF.ICCID')
+        data, _sw = self.lchan.read_binary()
+        self.lchan.update_binary('aabb', 2)
+        self.rs.use_sfi = False
+        self.assertEqual(self.lchan.read_binary()[0], data[:4] + 'aabb' + data[8:])
+
+    def test_read_records_cached(self):
+        self.lchan.select('MF/EF.DIR')
+        recs = list(self.lchan.read_records())
+        self.assertEqual(self.assertNoApdus(lambda: list(self.lchan.read_records())), recs)
+
+    def test_reset(self):
+        self.lchan.select('MF/EF.ICCID')
+        self.lchan.read_binary()
+        self.rs.reset()
+        self.lchan.select('MF/EF.ICCID')
+        count = self.sl.apdu_count
+        self.lchan.read_binary()
+        self.assertGreater(self.sl.apdu_count, count)
+
+    def test_invalidate_df(self):
+        self.lchan.select('ADF.USIM')
+        self.lchan.select('EF.IMSI')
+        self.lchan.read_binary()
+        adf_usim = self.lchan.get_application_df()
+        self.lchan.select('MF/EF.ICCID')
+        self.lchan.read_binary()
+        self.lchan.invalidate_content(adf_usim)
+        self.assertNoApdus(self.lchan.read_binary)
+        self.lchan.select('ADF.USIM')
+        self.lchan.select('EF.IMSI')
+        count = self.sl.apdu_count
+        self.lchan.read_binary()
+        self.assertGreater(self.sl.apdu_count, count)
+
+class WalkPlanTest(unittest.TestCase):
+    def setUp(self):
+        self.sl = SimulatedCardLink()
+        self.rs, _card = init_card(self.sl)
+        self.lchan = self.rs.lchan[0]
+        self.sl.metrics = ApduMetrics()
+
+    def selects(self) -> int:
+        stats = self.sl.metrics.per_ins.get(0xa4)
+        return stats.count if stats else 0
+
+    def assertSelects(self, path, count):
+        f = self.rs.mf
+        for name in path.split('/')[1:]:
+            f = f.lookup_file_by_name(name)
+        before = self.selects()
+        self.lchan.select_file(f)
+        self.assertEqual(self.lchan.selected_file, f)
+        self.assertEqual(self.selects() - before, count)
+
+    def test_select_path(self):
+        self.lchan.select('MF/DF.GSM/EF.IMSI')
+        # sibling EF and the DF of an EF are selected directly
+        self.assertSelects('MF/DF.GSM/EF.AD', 1)
+        self.assertSelects('MF/DF.GSM', 1)
+        # sibling DF of the current DF
+        self.lchan.select('MF/DF.TELECOM/DF.PHONEBOOK')
+        self.assertSelects('MF/DF.TELECOM/DF.MULTIMEDIA', 1)
+        # starting over from the MF is cheaper than climbing up
+        self.assertSelects('MF/EF.ICCID', 2)
+
+    def walk(self, plan):
+        for f in plan.files():
+            if plan.use_sfi(f) and isinstance(f, TransparentEF):
+                self.lchan.read_ef_binary(f)
+            elif plan.use_sfi(f):
+                list(self.lchan.read_ef_records(f))
+            elif isinstance(f, CardDF) or plan.efs:
+                self.lchan.select_file(f)
+        self.lchan.select_file(plan.start)
+
+    def test_plan(self):
+        for efs, sfi in ((False, False), (True, False), (True, True)):
+            self.rs.use_sfi = sfi
+            plan = WalkPlan(self.rs.mf, efs=efs, sfi=sfi)
+            before = self.selects()
+            self.walk(plan)
+            self.assertEqual(self.selects() - before, plan.selects)
+            self.assertEqual(self.lchan.selected_file, self.rs.mf)
+            self.assertEqual(plan.sfi_reads > 0, sfi)
+        # EFs are visited before the sub-DFs of a DF
+        children = plan.children(self.rs.mf.lookup_file_by_name('DF.TELECOM'))
+        self.assertTrue(isinstance(children[-1], CardDF))
+        self.assertFalse(isinstance(children[0], CardDF))
+
+if __name__ == "__main__":
+	unittest.main()
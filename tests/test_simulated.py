@@ -0,0 +1,121 @@
+#!/usr/bin/env python3
+
+import unittest
+import argparse
+from pySim.utils import h2b
+from pySim.commands import SimCardCommands
+from pySim.transport.simulated import SimulatedCard, SimulatedCardLink, SimulatedFile
+from pySim.app import init_card
+
+EXPORT_SCRIPT = """
+# directory: MF (3f00)
+# file: EF.ICCID (2fe2)
+# RAW FCP Template: 62228202412183022fe2a5098001718301008701018a01058b032f06038002000a880110
+update_binary 98942143658709214365
+# directory: MF/DF.TEST (3f00/7f77)
+# file: EF.REC (6f01)
+# RAW FCP Template: 621a8205422100030283026f018a01058b036f06018002000688010c
+update_record 1 010203
+update_record 2 040506
+"""
+
+def uicc_scc(card: SimulatedCard) -> SimCardCommands:
+    scc = SimCardCommands(SimulatedCardLink(card=card))
+    scc.cla_byte = '00'
+    scc.sel_ctrl = '0004'
+    return scc
+
+class SimulatedCardTest(unittest.TestCase):
+    def setUp(self):
+        self.card = SimulatedCard()
+        ef = self.card.mf.add_child(SimulatedFile('2fe2', 'EF.ICCID', 'transparent', sfid=2))
+        ef.data = bytearray(h2b('98942143658709214365'))
+        ef = self.card.mf.add_child(SimulatedFile('2f00', 'EF.DIR', 'linear_fixed'))
+        ef.rec_len = 3
+        ef.records = [bytearray(b'\x01\x02\x03'), bytearray(b'\xff\xff\xff')]
+        self.scc = uicc_scc(self.card)
+
+    def test_read_update_binary(self):
+        self.assertEqual(self.scc.read_binary(['3f00', '2fe2']), ('98942143658709214365', '9000'))
+        self.scc.update_binary('2fe2', '0102', offset=8)
+        self.assertEqual(bytes(self.card.mf.children['2fe2'].data[8:]), b'\x01\x02')
+
+    def test_sfi(self):
+        self.assertEqual(self.scc.read_binary_sfi(2, 2, 1), ('9421', '9000'))
+
+    def test_records(self):
+        self.assertEqual(self.scc.record_count(['3f00', '2f00']), 2)
+        self.assertEqual(self.scc.read_record('2f00', 1), ('010203', '9000'))
+        self.scc.update_record('2f00', 2, 'aabbcc')
+        self.assertEqual(self.scc.read_record('2f00', 2), ('aabbcc', '9000'))
+
+    def test_file_not_found(self):
+        with self.assertRaises(Exception):
+            self.scc.select_file('6f99')
+
+    def test_manage_channel(self):
+        self.scc.manage_channel(mode='open', lchan_nr=1)
+        scc1 = self.scc.fork_lchan(1)
+        self.assertEqual(scc1.read_record(['3f00', '2f00'], 1), ('010203', '9000'))
+        self.scc.manage_channel(mode='close', lchan_nr=1)
+        self.assertEqual(self.card.lchan.keys(), {0})
+
+    def test_export_script(self):
+        card = SimulatedCard()
+        card.load_export_script(EXPORT_SCRIPT.splitlines())
+        scc = uicc_scc(card)
+        self.assertEqual(scc.read_binary(['3f00', '2fe2']), ('98942143658709214365', '9000'))
+        self.assertEqual(scc.read_record(['3f00', '7f77', '6f01'], 2), ('040506', '9000'))
+        self.assertEqual(scc.record_count('6f01'), 2)
+
+    def test_card_data(self):
+        card = SimulatedCard.default_uicc()
+        card.load_card_data(['ICCID=8988211000000000001', 'IMSI=262011234567890'])
+        scc = uicc_scc(card)
+        self.assertEqual(scc.read_binary(['3f00', '2fe2'])[0], '988812010000000000f1')
+        self.assertEqual(scc.read_binary(['3f00', '7f20', '6f07'])[0], '082926102143658709')
+
+    def test_classic_sim(self):
+        scc = SimCardCommands(SimulatedCardLink(card=self.card))
+        # TS 51.011 SELECT response, returned via 9Fxx + GET RESPONSE
+        data, sw = scc.select_file('2fe2')
+        self.assertEqual(sw, '9000')
+        self.assertEqual(data, '0000000a2fe20400' + '11ff5501020000')
+        self.assertEqual(scc.read_binary('2fe2'), ('98942143658709214365', '9000'))
+        data, sw = scc.select_file('2f00')
+        self.assertEqual(data[4:8], '0006')
+        self.assertEqual(data[-4:], '0103')
+        self.assertEqual(scc.read_record('2f00', 1), ('010203', '9000'))
+        # MF: 0 DFs, 2 EFs
+        data, sw = scc.select_file('3f00')
+        self.assertEqual(data[8:14], '3f0001')
+        self.assertEqual(data[28:32], '0002')
+
+    def test_card_model(self):
+        card = SimulatedCard.default_uicc('3b9f96801f878031e073fe211b674a4c753034054ba9')
+        scc = uicc_scc(card)
+        # sysmoISIM-SJA2 specific file, sized according to its encoding
+        data, sw = scc.read_binary(['3f00', 'a515', '6f20'])
+        self.assertEqual(len(data), 33 * 2)
+        self.assertNotIn('a515', SimulatedCard.default_uicc().mf.children)
+
+class SimulatedCardLinkTest(unittest.TestCase):
+    def test_init_card(self):
+        sl = SimulatedCardLink()
+        rs, card = init_card(sl)
+        self.assertEqual(str(rs.profile), 'UICC')
+        self.assertIn('ADF.USIM', [a.name for a in rs.mf.applications.values()])
+        rs.lchan[0].select('ADF.USIM')
+        rs.lchan[0].select('EF.IMSI')
+        rs.lchan[0].update_binary('082926102143658709')
+        self.assertEqual(rs.lchan[0].read_binary_dec()[0], {'imsi': '262011234567890'})
+        self.assertGreater(sl.apdu_count, 0)
+
+    def test_sim_atr(self):
+        atr = '3b9f96801f878031e073fe211b674a4c753034054ba9'
+        sl = SimulatedCardLink(argparse.Namespace(sim_seed=None, sim_latency=0.0, sim_atr=atr))
+        self.assertEqual(bytes(sl.get_atr()), h2b(atr))
+        self.assertIn('a515', sl.card.mf.children)
+
+if __name__ == "__main__":
+	unittest.main()
@@ -0,0 +1,77 @@
+#!/usr/bin/env python3
+
+import os
+import tempfile
+import unittest
+from io import BytesIO
+from pySim.snapshot import SnapshotWriter, Snapshot, SnapshotDiff, diff_snapshots
+from pySim.transport.simulated import SimulatedCardLink
+from pySim.app import init_card
+
+FILES = ['MF', 'MF/EF.ICCID', 'MF/EF.DIR', 'ADF.USIM/EF.IMSI']
+
+class SnapshotTest(unittest.TestCase):
+    def setUp(self):
+        self.sl = SimulatedCardLink()
+        self.rs, _card = init_card(self.sl)
+        self.lchan = self.rs.lchan[0]
+
+    def take(self, meta=None) -> Snapshot:
+        buf = BytesIO()
+        with SnapshotWriter(buf, meta) as writer:
+            for path in FILES:
+                self.lchan.select(path)
+                writer.add_selected(self.lchan)
+            writer.add_error('MF/EF.BROKEN', '3F00/2FFF', 'SW 6a82')
+        return Snapshot(buf.getvalue())
+
+    def test_roundtrip(self):
+        with self.take({'iccid': '1234'}) as snap:
+            self.assertEqual(snap.meta, {'iccid': '1234'})
+            self.assertEqual(list(snap.entries), ['MF', 'MF/EF.ICCID', 'MF/EF.DIR', 'MF/ADF.USIM/EF.IMSI',
+                                                  'MF/EF.BROKEN'])
+            self.lchan.select('MF/EF.ICCID')
+            iccid = snap.entries['MF/EF.ICCID']
+            self.assertEqual(iccid.structure, 'transparent')
+            self.assertEqual(iccid.fid_path, '3f00/2fe2')
+            self.assertEqual(iccid.data.hex(), self.lchan.read_binary()[0])
+            self.assertEqual(iccid.fcp.hex(), self.lchan.selected_file_fcp_hex)
+            self.lchan.select('MF/EF.DIR')
+            records = snap.entries['MF/EF.DIR'].records()
+            self.assertEqual([r.hex() for r in records], [d for r, d in self.lchan.read_records()])
+            self.assertEqual(snap.entries['MF'].structure, 'df')
+            self.assertTrue(snap.entries['MF/EF.BROKEN'].error)
+
+    def test_diff(self):
+        ref = self.take()
+        self.assertEqual(list(diff_snapshots(ref, ref)), [])
+        self.lchan.select('MF/EF.ICCID')
+        self.lchan.update_binary('0000', 2)
+        self.lchan.select('MF/EF.DIR')
+        self.lchan.update_record(2, 'ff' * (ref.entries['MF/EF.DIR'].rec_len))
+        other = self.take()
+        diffs = list(diff_snapshots(ref, other))
+        self.assertEqual(diffs, [SnapshotDiff('MF/EF.ICCID', 'content', 'bytes 2+2'),
+                                 SnapshotDiff('MF/EF.DIR', 'content', 'records 2')])
+        self.assertEqual(list(diff_snapshots(ref, other, ignore=['*/EF.DIR', '3F00/2FE2'])), [])
+        self.assertEqual(list(diff_snapshots(ref, other, ignore=['*/ef.dir', 'mf/ef.Iccid'])), [])
+        del other.entries['MF/EF.ICCID']
+        self.assertEqual(list(diff_snapshots(ref, other))[0], SnapshotDiff('MF/EF.ICCID', 'removed'))
+        self.assertEqual(list(diff_snapshots(other, ref))[-1], SnapshotDiff('MF/EF.ICCID', 'added'))
+
+    def test_file(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            path = os.path.join(tmpdir, 'snap')
+            with open(path, 'wb') as f:
+                with SnapshotWriter(f) as writer:
+                    self.lchan.select('MF/EF.ICCID')
+                    writer.add_selected(self.lchan)
+            with Snapshot.open(path) as snap:
+                self.assertEqual(snap.entries['MF/EF.ICCID'].data.hex(), self.lchan.read_binary()[0])
+            with open(path, 'r+b') as f:
+                f.truncate(os.path.getsize(path) - 1)
+            with self.assertRaises(ValueError):
+                Snapshot.open(path)
+
+if __name__ == "__main__":
+	unittest.main()
@@ -117,5 +117,36 @@ class TestIE(unittest.TestCase):
         self.assertEqual(ie.to_bytes(), b'\x42')
         self.assertEqual(ie.to_ie(), b'\x42')
 
+class KnownIE(BER_TLV_IE, tag=0x81):
+    _construct = Int8ub
+
+class MyCollection(TLV_IE_Collection, nested=[KnownIE]):
+    pass
+
+class TestCollection(unittest.TestCase):
+    def test_dispatch_tables(self):
+        c1 = MyCollection()
+        c2 = MyCollection()
+        self.assertEqual(c1.members_by_tag, {0x81: KnownIE})
+        self.assertEqual(c1.members_by_name, {'known_ie': KnownIE})
+        # computed once at class creation time, not per instance
+        self.assertIs(c1.members_by_tag, c2.members_by_tag)
+        c3 = TLV_IE_Collection(nested=[KnownIE])
+        self.assertEqual(c3.members_by_tag, {0x81: KnownIE})
+
+    def test_unknown_tags(self):
+        enc = b'\x81\x01\x42\x82\x02\x01\x02'
+        coll = MyCollection()
+        coll.from_bytes(enc)
+        self.assertEqual(coll.to_dict(), [{'known_ie': 0x42}, {'unknown_ber_tlv_ie_82': {'raw': '0102'}}])
+        self.assertEqual(coll.to_bytes(), enc)
+        # repeated decoding of the same unknown tag re-uses the same class
+        cls = type(coll.children[1])
+        hits = unknown_tag_class_stats()['hits']
+        coll2 = MyCollection()
+        coll2.from_bytes(enc)
+        self.assertIs(type(coll2.children[1]), cls)
+        self.assertEqual(unknown_tag_class_stats()['hits'], hits + 1)
+
 if __name__ == "__main__":
 	unittest.main()
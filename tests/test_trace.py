@@ -0,0 +1,138 @@
+#!/usr/bin/env python3
+
+import os
+import json
+import queue
+import threading
+import unittest
+import importlib.util
+
+from pySim.apdu import Apdu, CardReset
+from pySim.apdu_source import ApduSource
+
+# pySim-trace.py is not a valid module name, so load it by path
+_spec = importlib.util.spec_from_file_location('pySim_trace', os.path.join(os.path.dirname(__file__),
+                                                                           '..', 'pySim-trace.py'))
+pySim_trace = importlib.util.module_from_spec(_spec)
+_spec.loader.exec_module(pySim_trace)
+
+SELECT_ICCID = ('00a40004022fe2', '9000')
+READ_ICCID = ('00b000000a', '98001032547698103254769000')
+ICCID = '8900012345678901234567'
+
+class FakeSource(ApduSource):
+    """APDU source fed by the test via a queue: None ends the trace, exceptions are raised."""
+    def __init__(self):
+        super().__init__()
+        self.items = queue.Queue()
+        self.idle = threading.Event()
+
+    def put(self, *items):
+        for item in items:
+            self.items.put(item)
+
+    def read_packet(self):
+        if self.items.empty():
+            self.idle.set()
+        item = self.items.get()
+        if item is None:
+            raise StopIteration
+        if isinstance(item, Exception):
+            raise item
+        return item
+
+class FakeOutput:
+    """File-like object recording the individual batches written to it."""
+    def __init__(self):
+        self.writes = []
+        self.flushes = 0
+        self.written = threading.Condition()
+
+    def write(self, s: str):
+        with self.written:
+            if s:
+                self.writes.append(s)
+            self.written.notify_all()
+
+    def flush(self):
+        self.flushes += 1
+
+    def batch_sizes(self):
+        return [len(w.splitlines()) for w in self.writes]
+
+    def lines(self):
+        return ''.join(self.writes).splitlines()
+
+class TracerTest(unittest.TestCase):
+    def setUp(self):
+        self.source = FakeSource()
+        self.output = FakeOutput()
+        self.tracer = pySim_trace.Tracer(source=self.source, output=self.output, output_format='json')
+
+    def read_iccid(self, n: int):
+        """Return n READ BINARY APDUs (the first one preceded by a SELECT)."""
+        return [Apdu(*SELECT_ICCID)] + [Apdu(*READ_ICCID) for i in range(n)]
+
+    def test_json(self):
+        self.tracer.show_raw_apdu = True
+        out = self.tracer.process_apdu(CardReset(bytes.fromhex('3b9f96801f')))
+        self.assertEqual(json.loads(out), {'reset': {'atr': '3b9f96801f'}})
+        # SELECT is suppressed by default
+        self.assertIsNone(self.tracer.process_apdu(Apdu(*SELECT_ICCID)))
+        out = self.tracer.process_apdu(Apdu(*READ_ICCID))
+        self.assertTrue(out.endswith('\n'))
+        self.assertEqual(out.count('\n'), 1)
+        d = json.loads(out)
+        self.assertEqual(d['lchan'], 0)
+        self.assertEqual(d['name'], 'READ BINARY')
+        self.assertEqual(d['path'], 'MF/EF.ICCID')
+        self.assertEqual(d['sw'], '9000')
+        self.assertEqual(d['processed'], {'iccid': ICCID})
+        self.assertEqual(d['apdu']['rsp']['body'], READ_ICCID[1][:-4])
+        self.tracer.show_raw_apdu = False
+        d = json.loads(self.tracer.process_apdu(Apdu(*READ_ICCID)))
+        self.assertEqual(sorted(d.keys()), ['id', 'lchan', 'name', 'path', 'processed', 'sw'])
+
+    def test_stream_batches(self):
+        self.source.put(*self.read_iccid(5))
+        # hold back decoding until the producer thread has drained the source, so that
+        # the batch boundaries are deterministic
+        process_apdu = self.tracer.process_apdu
+        def delayed_process_apdu(apdu):
+            self.assertTrue(self.source.idle.wait(5))
+            return process_apdu(apdu)
+        self.tracer.process_apdu = delayed_process_apdu
+        result = []
+        thread = threading.Thread(target=lambda: result.append(self.tracer.main_streaming(batch_size=2)),
+                                  daemon=True)
+        thread.start()
+        # the last, incomplete batch is written as soon as the queue has run dry, even
+        # though the source has not ended yet
+        with self.output.written:
+            self.assertTrue(self.output.written.wait_for(lambda: len(self.output.lines()) == 5, 5))
+        self.assertEqual(self.output.batch_sizes(), [2, 2, 1])
+        self.assertTrue(thread.is_alive())
+        self.source.put(None)
+        thread.join(5)
+        self.assertFalse(thread.is_alive())
+        self.assertEqual(result, [0])
+        self.assertEqual(self.output.batch_sizes(), [2, 2, 1])
+        self.assertEqual([json.loads(l)['processed'] for l in self.output.lines()], [{'iccid': ICCID}] * 5)
+
+    def test_stream_end(self):
+        self.source.put(CardReset(None), *self.read_iccid(3), None)
+        self.assertEqual(self.tracer.main_streaming(batch_size=100), 0)
+        lines = self.output.lines()
+        self.assertEqual(len(lines), 4)
+        self.assertEqual(json.loads(lines[0]), {'reset': {'atr': None}})
+        self.assertGreaterEqual(self.output.flushes, 1)
+
+    def test_stream_exception(self):
+        self.source.put(*self.read_iccid(2), IOError('capture interface went away'))
+        with self.assertRaisesRegex(IOError, 'capture interface went away'):
+            self.tracer.main_streaming()
+        # everything read before the error was still written
+        self.assertEqual(len(self.output.lines()), 2)
+
+if __name__ == "__main__":
+	unittest.main()
@@ -0,0 +1,376 @@
+#!/usr/bin/env python3
+
+import os
+import argparse
+import unittest
+from unittest import mock
+from pySim.utils import h2b, b2h
+from pySim.exceptions import SwMatchError
+from pySim.transport import LinkBase, ProactiveHandler, case3_to_case4, proactive_command_details
+from pySim.transport import init_reader, argparse_add_reader_args
+from pySim.transport.serial import SerialSimLink
+from pySim.transport.modem_atcmd import ModemATCommandLink
+from pySim.transport.simulated import SimulatedCard
+
+class ScriptedLink(LinkBase):
+    """LinkBase implementation answering from a list of expected (command, response) pairs."""
+    def __init__(self, script, **kwargs):
+        super().__init__(**kwargs)
+        self.script = list(script)
+        self.sent = []
+
+    def __str__(self):
+        return "scripted"
+
+    def _send_apdu_raw_bin(self, pdu):
+        self.sent.append(b2h(pdu))
+        exp_cmd, rsp = self.script.pop(0)
+        if exp_cmd != b2h(pdu):
+            raise ValueError('Unexpected command %s (expected %s)' % (b2h(pdu), exp_cmd))
+        rsp = h2b(rsp)
+        return bytes(rsp[:-2]), bytes(rsp[-2:])
+
+    def wait_for_card(self, timeout=None, newcardonly=False):
+        pass
+
+    def connect(self):
+        pass
+
+    def disconnect(self):
+        pass
+
+    def reset_card(self):
+        return 1
+
+class HexOnlyLink(ScriptedLink):
+    """Legacy style driver implementing only the hex-string _send_apdu_raw."""
+    _send_apdu_raw_bin = LinkBase._send_apdu_raw_bin
+
+    def _send_apdu_raw(self, pdu):
+        self.sent.append(pdu)
+        _exp_cmd, rsp = self.script.pop(0)
+        return rsp[:-4], rsp[-4:]
+
+class LinkBaseTest(unittest.TestCase):
+    def test_get_response_bin(self):
+        tp = ScriptedLink([('00b0000000', '6104'), ('00c0000004', '010203049000')])
+        self.assertEqual(tp.send_apdu_bin(h2b('00b0000000')), (b'\x01\x02\x03\x04', b'\x90\x00'))
+
+    def test_wrong_le_hex(self):
+        tp = ScriptedLink([('00b0000000', '6c02'), ('00b0000002', 'aabb9000')])
+        self.assertEqual(tp.send_apdu('00b0000000'), ('aabb', '9000'))
+
+    def test_checksw(self):
+        tp = ScriptedLink([('00a40004023f00', '6a82')])
+        with self.assertRaises(SwMatchError):
+            tp.send_apdu_checksw('00a40004023f00')
+        tp = ScriptedLink([('00a40004023f00', '6a82')])
+        self.assertEqual(tp.send_apdu_checksw_bin(h2b('00a40004023f00'), '6a??'), (b'', b'\x6a\x82'))
+
+    def test_hex_only_driver(self):
+        tp = HexOnlyLink([('00b0000000', 'aabb9000')])
+        self.assertEqual(tp.send_apdu_bin(h2b('00b0000000')), (b'\xaa\xbb', b'\x90\x00'))
+        self.assertEqual(tp.sent, ['00b0000000'])
+
+    def test_t1_le(self):
+        tp = ScriptedLink([('00a40004023f0000', '6200' + '9000'), ('00b0000004', '010203049000')])
+        tp.protocol = 1
+        self.assertEqual(tp.send_apdu('00a40004023f00'), ('6200', '9000'))
+        self.assertEqual(tp.send_apdu('00b0000004'), ('01020304', '9000'))
+
+    def test_case3_to_case4(self):
+        self.assertEqual(case3_to_case4(h2b('00a40004023f00')), h2b('00a40004023f0000'))
+        self.assertEqual(case3_to_case4(h2b('00a4000c023f00')), h2b('00a4000c023f00'))
+        self.assertEqual(case3_to_case4(h2b('00a40004023f0000')), h2b('00a40004023f0000'))
+        self.assertEqual(case3_to_case4(h2b('00d6000002aabb')), h2b('00d6000002aabb'))
+        ext = h2b('80e29100000100') + b'\x00' * 256
+        self.assertEqual(case3_to_case4(ext), ext + b'\x00\x00')
+
+    def test_no_driver(self):
+        class NoDriverLink(HexOnlyLink):
+            _send_apdu_raw = LinkBase._send_apdu_raw
+        with self.assertRaises(TypeError):
+            NoDriverLink([])
+
+class StormLink(LinkBase):
+    """LinkBase implementation emulating a card which has a given number of proactive commands
+    (DISPLAY TEXT) pending after each command."""
+    def __init__(self, num_pcmds, **kwargs):
+        super().__init__(**kwargs)
+        self.num_pcmds = num_pcmds
+        self.pending = 0
+        self.terminal_responses = []
+
+    def __str__(self):
+        return "storm"
+
+    def _pcmd(self):
+        # DISPLAY TEXT with command number N
+        text = b'\x04' + b'storm %04u' % self.pending
+        return b'\xd0' + bytes([9 + len(text)]) + bytes([0x81, 0x03, self.pending & 0xff, 0x21, 0x80]) + \
+               b'\x82\x02\x81\x02' + b'\x8d' + bytes([len(text)]) + text
+
+    def _sw(self):
+        return bytes([0x91, len(self._pcmd())]) if self.pending else b'\x90\x00'
+
+    def _send_apdu_raw_bin(self, pdu):
+        if pdu[1] == 0x12:
+            return self._pcmd(), b'\x90\x00'
+        if pdu[1] == 0x14:
+            self.terminal_responses.append(pdu)
+            self.pending -= 1
+        else:
+            self.pending = self.num_pcmds
+        return b'', self._sw()
+
+    def wait_for_card(self, timeout=None, newcardonly=False):
+        pass
+
+    def connect(self):
+        pass
+
+    def disconnect(self):
+        pass
+
+    def reset_card(self):
+        return 1
+
+class CountingHandler(ProactiveHandler):
+    def __init__(self):
+        self.batches = []
+
+    def receive_fetch_batch(self, pcmds):
+        self.batches.append([type(parsed).__name__ for pcmd, parsed in pcmds])
+
+class ProactiveSessionTest(unittest.TestCase):
+    def test_command_details(self):
+        self.assertEqual(proactive_command_details(h2b('d009810301250082028182')), h2b('8103012500'))
+        self.assertEqual(proactive_command_details(h2b('d0098202818201030125ff')), h2b('01030125ff'))
+        with self.assertRaises(ValueError):
+            proactive_command_details(h2b('d00482028182'))
+
+    def test_no_handler(self):
+        link = StormLink(3)
+        self.assertEqual(link.send_apdu_checksw('a0f2000016'), ('', '9000'))
+        self.assertEqual(len(link.terminal_responses), 3)
+        # command beyond terminal capability
+        self.assertEqual(b2h(link.terminal_responses[0]),
+                         '801400000c' + '8103032180' + '82028281' + '830130')
+
+    def test_handler(self):
+        handler = CountingHandler()
+        link = StormLink(3, proactive_handler=handler)
+        link.send_apdu_checksw('a0f2000016')
+        self.assertEqual(handler.batches, [['DisplayText']] * 3)
+        # performed successfully
+        self.assertEqual(b2h(link.terminal_responses[-1]),
+                         '801400000c' + '8103012180' + '82028281' + '830100')
+
+    def test_batch(self):
+        handler = CountingHandler()
+        link = StormLink(5, proactive_handler=handler, proactive_batch_size=2)
+        link.send_apdu_checksw('a0f2000016')
+        self.assertEqual([len(b) for b in handler.batches], [2, 2, 1])
+
+    def test_batch_size_option(self):
+        parser = argparse_add_reader_args(argparse.ArgumentParser())
+        opts = parser.parse_args(['--simulated-card', '--proactive-batch-size', '8'])
+        sl = init_reader(opts, proactive_handler=CountingHandler())
+        self.assertEqual(sl.proactive_session.batch_size, 8)
+        self.assertEqual(init_reader(parser.parse_args(['--simulated-card'])).proactive_session.batch_size, 1)
+
+    def test_storm(self):
+        """A storm of proactive commands is processed iteratively, without recursion."""
+        link = StormLink(5000)
+        link.send_apdu_checksw('a0f2000016')
+        self.assertEqual(len(link.terminal_responses), 5000)
+
+class FakeSerial:
+    """Emulation of a Phoenix reader (TX and RX tied together) with a card answering from a
+    list of (bytes written, bytes sent by the card) pairs."""
+    def __init__(self, atr, script, **kwargs):
+        self.name = 'fake'
+        self.baudrate = kwargs['baudrate']
+        self.timeout = kwargs['timeout']
+        self.atr = atr
+        self.script = list(script)
+        self.rx = b''
+        self.reads = 0
+
+    def setRTS(self, val):
+        if val == 0:
+            self.rx += self.atr
+
+    def setDTR(self, val):
+        pass
+
+    def flushInput(self):
+        self.rx = b''
+
+    def write(self, data):
+        self.rx += data
+        if self.script and self.script[0][0] == data:
+            self.rx += self.script.pop(0)[1]
+
+    def read(self, num=1):
+        self.reads += 1
+        data, self.rx = self.rx[:num], self.rx[num:]
+        return data
+
+    def close(self):
+        pass
+
+class SerialSimLinkTest(unittest.TestCase):
+    ATR = h2b('3b9f96801fc78031a073be21136743200718000001a5')
+
+    def make_link(self, script, pps=True):
+        opts = argparse.Namespace(device='/dev/null', baudrate=9600, pps=pps)
+        with mock.patch('serial.Serial', lambda **kwargs: FakeSerial(self.ATR, script, **kwargs)):
+            sl = SerialSimLink(opts)
+        sl.connect()
+        return sl
+
+    def test_pps(self):
+        sl = self.make_link([(h2b('ff109679'), h2b('ff109679'))])
+        self.assertEqual(sl.get_atr(), list(self.ATR))
+        # Fi=512, Di=32
+        self.assertEqual(sl._sl.baudrate, 223200)
+
+    def test_pps_rejected(self):
+        sl = self.make_link([(h2b('ff109679'), b'')])
+        self.assertEqual(sl.get_atr(), list(self.ATR))
+        self.assertEqual(sl._sl.baudrate, 9600)
+
+    def test_no_pps(self):
+        sl = self.make_link([], pps=False)
+        self.assertEqual(sl._sl.baudrate, 9600)
+
+    def test_apdu(self):
+        sl = self.make_link([(h2b('00b0000004'), h2b('60b0010203049000'))], pps=False)
+        reads = sl._sl.reads
+        self.assertEqual(sl.send_apdu_raw_bin(h2b('00b0000004')), (h2b('01020304'), h2b('9000')))
+        # echo, NULL, ACK, data (in bulk), SW1, SW2
+        self.assertEqual(sl._sl.reads - reads, 6)
+
+    def test_apdu_case3(self):
+        sl = self.make_link([(h2b('00d6000002'), h2b('d6')), (h2b('aabb'), h2b('609000'))], pps=False)
+        self.assertEqual(sl.send_apdu_raw_bin(h2b('00d6000002aabb')), (b'', h2b('9000')))
+
+    def test_apdu_sw_only(self):
+        sl = self.make_link([(h2b('00a40004023f00'[:10]), h2b('6a82'))], pps=False)
+        self.assertEqual(sl.send_apdu_raw_bin(h2b('00a40004023f00')), (b'', h2b('6a82')))
+
+class FakeModem:
+    """Emulation of a modem serial port (backed by a pipe, so that it can be polled) with a simulated
+    card, supporting AT+CSIM and AT+CCHO/AT+CGLA.  Like a real modem, it hands out session ids
+    (starting at session_base) which are not the logical channel numbers."""
+    def __init__(self, device, baudrate, timeout, echo=False, session_base=0):
+        self.rfd, self.wfd = os.pipe()
+        self.echo = echo
+        self.pending = 0
+        self.cmd = b''
+        self.card = SimulatedCard.default_uicc()
+        self.timeout = timeout
+        self.cmds = []
+        self.session_base = session_base
+        self.sessions = {}
+
+    def fileno(self):
+        return self.rfd
+
+    @property
+    def in_waiting(self):
+        return self.pending
+
+    def _send(self, data: bytes):
+        os.write(self.wfd, data)
+        self.pending += len(data)
+
+    def _apdu(self, pdu: str, lchan: int = 0) -> str:
+        apdu = bytearray(h2b(pdu))
+        if lchan:
+            # the modem sets the logical channel number in the CLA byte
+            if lchan < 4:
+                apdu[0] = (apdu[0] & 0xbc) | lchan
+            else:
+                apdu[0] = (apdu[0] & 0xb0) | 0x40 | (lchan - 4)
+        data, sw = self.card.process_apdu(bytes(apdu))
+        rsp = b2h(data + sw).upper()
+        return '%d,"%s"' % (len(rsp), rsp)
+
+    def _respond(self, cmd: str):
+        self.cmds.append(cmd)
+        # unsolicited result code
+        self._send(b'\r\n+CREG: 1\r\n')
+        rsp = ''
+        if cmd.startswith('AT+CSIM=') and '"' in cmd:
+            rsp = '+CSIM: ' + self._apdu(cmd.split('"')[1])
+        elif cmd.startswith('AT+CCHO='):
+            lchan, _sw = self.card.process_apdu(h2b('0070000001'))
+            session_id = self.session_base + lchan[0]
+            self.sessions[session_id] = lchan[0]
+            rsp = '%u' % session_id
+        elif cmd.startswith('AT+CGLA='):
+            session_id = int(cmd[8:].split(',')[0])
+            rsp = '+CGLA: ' + self._apdu(cmd.split('"')[1], self.sessions[session_id])
+        if rsp:
+            self._send(b'\r\n' + rsp.encode() + b'\r\n')
+        self._send(b'\r\nOK\r\n')
+
+    def write(self, data):
+        if self.echo:
+            self._send(data)
+        self.cmd += data
+        while b'\r' in self.cmd:
+            cmd, self.cmd = self.cmd.split(b'\r', 1)
+            self._respond(cmd.decode())
+        return len(data)
+
+    def read(self, num=1):
+        data = os.read(self.rfd, num)
+        self.pending -= len(data)
+        return data
+
+    def reset_input_buffer(self):
+        if self.pending:
+            self.read(self.pending)
+
+    def close(self):
+        os.close(self.rfd)
+        os.close(self.wfd)
+
+class ModemATCommandLinkTest(unittest.TestCase):
+    def make_link(self, echo=False, channel_aid=None, session_base=0):
+        opts = argparse.Namespace(modem_dev='/dev/null', modem_baud=115200, modem_channel_aid=channel_aid)
+        with mock.patch('serial.Serial', lambda *args, **kwargs: FakeModem(*args, **kwargs, echo=echo,
+                                                                            session_base=session_base)):
+            return ModemATCommandLink(opts)
+
+    def test_csim(self):
+        for echo in [False, True]:
+            sl = self.make_link(echo=echo)
+            self.assertEqual(sl._echo, echo)
+            self.assertEqual(sl.send_apdu('00a40004023f00')[1], '9000')
+            self.assertEqual(sl.send_apdu('00a40004022f00')[1], '9000')
+            self.assertEqual(len(sl.send_apdu('00b2010400')[0]), 2 * 0x36)
+
+    def test_cgla(self):
+        sl = self.make_link(channel_aid='a0000000871002')
+        self.assertEqual(sl._session_id, 1)
+        data, sw = sl.send_apdu('00a40004023f00')
+        self.assertEqual(sw, '9000')
+        self.assertTrue(data.startswith('62'))
+        self.assertTrue(sl._sl.cmds[-2].startswith('AT+CGLA=1,14,"00A4'))
+
+    def test_cgla_session_id(self):
+        # the session id is opaque; the APDU must be passed on unmodified
+        sl = self.make_link(channel_aid='a0000000871002', session_base=20)
+        self.assertEqual(sl._session_id, 21)
+        data, sw = sl.send_apdu('00a40004023f00')
+        self.assertEqual(sw, '9000')
+        self.assertTrue(data.startswith('62'))
+        self.assertTrue(sl._sl.cmds[-2].startswith('AT+CGLA=21,14,"00A40004023F00"'))
+        self.assertEqual(sl._sl.sessions, {21: 1})
+
+if __name__ == "__main__":
+	unittest.main()
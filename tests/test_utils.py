@@ -199,6 +199,21 @@ class TestBerTlv(unittest.TestCase):
         res = utils.bertlv_parse_one(b'\x81\x01\x01');
         self.assertEqual(res, ({'tag':1, 'constructed':False, 'class':2}, 1, b'\x01', b''))
 
+    def test_BerTlvReader(self):
+        buf = b'\x81\x01\x01\x1f\x8f\x00\x81\x80' + b'\x55' * 128 + b'\xa0\x00\xff\xff'
+        reader = utils.BerTlvReader(buf)
+        res = []
+        for tag, offset, length in reader:
+            res.append((tag, reader.tlv_offset, offset, length))
+        self.assertEqual(res, [(0x81, 0, 2, 1), (0x1f8f00, 3, 8, 128), (0xa0, 136, 138, 0)])
+        # the reader also operates on memoryview and sub-ranges of the buffer
+        self.assertEqual(list(utils.BerTlvReader(memoryview(buf), 3, 136)), [(0x1f8f00, 8, 128)])
+
+    def test_parse_at(self):
+        self.assertEqual(utils.bertlv_parse_tag_raw_at(b'\x00\x1f\x8f\x00\x23', 1), (0x1f8f00, 4))
+        self.assertEqual(utils.bertlv_parse_tag_raw_at(b'\x00\xff\xff', 1), (None, 1))
+        self.assertEqual(utils.bertlv_parse_len_at(b'\x00\x83\x12\x34\x56\x78', 1), (0x123456, 5))
+
 class TestComprTlv(unittest.TestCase):
     def test_ComprTlvTagDec(self):
         res = utils.comprehensiontlv_parse_tag(b'\x12\x23')
@@ -236,6 +251,21 @@ class TestDgiTlv(unittest.TestCase):
         self.assertEqual(utils.dgi_parse_len(b'\xfe\x0b'), (254, b'\x0b'))
         self.assertEqual(utils.dgi_parse_len(b'\xff\x00\xff\x0b'), (255, b'\x0b'))
 
+class TestChangedRanges(unittest.TestCase):
+    def test_identical(self):
+        self.assertEqual(utils.changed_ranges(b'\x01\x02', b'\x01\x02'), [])
+
+    def test_ranges(self):
+        cur = bytes(16)
+        new = b'\x01' + bytes(4) + b'\x02\x03' + bytes(2) + b'\x04' + bytes(5) + b'\x05'
+        self.assertEqual(utils.changed_ranges(cur, new), [(0, 1), (5, 2), (9, 1), (15, 1)])
+        self.assertEqual(utils.changed_ranges(cur, new, gap=2), [(0, 1), (5, 5), (15, 1)])
+        self.assertEqual(utils.changed_ranges(cur, new, gap=5), [(0, 16)])
+
+    def test_length_mismatch(self):
+        with self.assertRaises(ValueError):
+            utils.changed_ranges(b'\x01', b'\x01\x02')
+
 class TestLuhn(unittest.TestCase):
     def test_verify(self):
         utils.verify_luhn('8988211000000530082')